@@ -25,8 +25,17 @@ REQS_BASE = [
 REQS_WYZE = [
     'requests>=2.25'
 ]
+REQS_ASYNC = [
+    'aiohttp>=3.7'
+]
+REQS_MAPS = [
+    'numpy>=1.17'
+]
+REQS_HTTP2 = [
+    'httpx[http2]>=0.18'
+]
 REQS_SIMPLE = REQS_BASE + REQS_WYZE
-REQS_FULL = REQS_SIMPLE
+REQS_FULL = REQS_SIMPLE + REQS_ASYNC + REQS_MAPS + REQS_HTTP2
 REQS_DEV = ([
     # 'tox>=2.1.1',
     # 'sphinx>=1.3.1',
@@ -45,10 +54,19 @@ setup(
     ],
     extras_require={
         'wyze': REQS_WYZE,
+        'async': REQS_ASYNC,
+        'maps': REQS_MAPS,
+        'http2': REQS_HTTP2,
         'full': REQS_FULL,
         'dev': REQS_DEV
     },
     packages=find_packages(),
+    entry_points={
+        'smartbridge.providers': [
+            'wyze = smartbridge.providers.wyze.provider:WyzeProvider',
+            'mock = smartbridge.providers.mock.provider:MockWyzeProvider',
+        ]
+    },
     license='The Unlicense',
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -33,6 +33,17 @@ def has_writeable_property(cls, prop):
     return False
 
 
+def to_bool(value):
+    """
+    Interprets a configuration value as a boolean. Values read from config
+    files are strings, so ``'false'``, ``'no'``, ``'off'`` and ``'0'`` are
+    treated as ``False``.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() not in ('', '0', 'false', 'no', 'off')
+    return bool(value)
+
+
 def get_env(varname, default_value=None):
     """
     Return the value of the environment variable or default_value.
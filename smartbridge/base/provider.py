@@ -2,8 +2,11 @@
 import functools
 import logging
 import os
+import threading
+import time
 from os.path import expanduser
 from configparser import ConfigParser
+from types import MappingProxyType
 
 from ..interfaces import Provider
 from ..interfaces.exceptions import ProviderConnectionException
@@ -21,6 +24,74 @@ SmartbridgeConfigLocations = [SmartbridgeConfigPath]
 UserConfigPath = os.path.join(expanduser('~'), '.smartbridge')
 SmartbridgeConfigLocations.append(UserConfigPath)
 
+_EMPTY_SECTION = MappingProxyType({})
+
+
+class SmartbridgeConfigFiles(object):
+    """
+    The parsed Smartbridge configuration files, shared by every provider in
+    the process. The files are parsed once, and parsed again when their
+    modification times change; these are checked at most once every
+    ``check_interval`` seconds.
+    """
+
+    def __init__(self, paths, check_interval=5):
+        self._paths = paths
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._checked_at = None
+        self._sections = {}
+
+    def _is_due(self, now):
+        return (self._checked_at is None or
+                now - self._checked_at >= self._check_interval)
+
+    def _stat(self):
+        mtimes = []
+        for path in self._paths:
+            try:
+                mtimes.append((path, os.stat(path).st_mtime_ns))
+            except OSError:
+                mtimes.append((path, None))
+        return tuple(mtimes)
+
+    def _load(self):
+        parser = ConfigParser()
+        parser.read(self._paths)
+        self._sections = {
+            name: MappingProxyType(dict(parser.items(name)))
+            for name in parser.sections()}
+        log.debug("Loaded configuration files %s", self._paths)
+
+    def reload(self):
+        """
+        Parses the configuration files again, whether they changed or not.
+        """
+        with self._lock:
+            self._load()
+            self._mtimes = self._stat()
+            self._checked_at = time.monotonic()
+
+    def section(self, name):
+        """
+        Returns the options of a section, as a read-only mapping.
+        :rtype: :class:`types.MappingProxyType`
+        """
+        now = time.monotonic()
+        if self._is_due(now):
+            with self._lock:
+                if self._is_due(now):
+                    mtimes = self._stat()
+                    if mtimes != self._mtimes:
+                        self._load()
+                        self._mtimes = mtimes
+                    self._checked_at = now
+        return self._sections.get(name, _EMPTY_SECTION)
+
+
+config_files = SmartbridgeConfigFiles(SmartbridgeConfigLocations)
+
 
 class BaseConfiguration(Configuration):
 
@@ -45,8 +116,14 @@ class BaseProvider(Provider):
 
     def __init__(self, config):
         self._config = BaseConfiguration(config)
-        self._config_parser = ConfigParser()
-        self._config_parser.read(SmartbridgeConfigLocations)
+        # the values of the provider's section of the configuration files,
+        # overridden by the ones passed in, resolved once per provider
+        effective_config = {
+            key: value for key, value in config_files.section(
+                getattr(self, 'PROVIDER_ID', None)).items() if value}
+        effective_config.update(
+            (key, value) for key, value in self._config.items() if value)
+        self._effective_config = MappingProxyType(effective_config)
 
     @property
     def config(self):
@@ -71,6 +148,13 @@ class BaseProvider(Provider):
             raise ProviderConnectionException(
                 "Authentication with provider failed: %s" % (e,))
 
+    def close(self):
+        """
+        Releases the connections held by this provider. Providers reopen
+        them on demand, so a closed provider can still be used.
+        """
+        pass
+
     def clone(self, zone=None):
         cloned_config = self.config.copy()
         cloned_provider = self.__class__(cloned_config)
@@ -110,14 +194,8 @@ class BaseProvider(Provider):
                               ``key`` is not available
         :return: a configuration value for the supplied ``key``
         """
-        log.debug("Getting config key %s, with supplied default value: %s",
-                  key, default_value)
-        value = default_value
-        if isinstance(self.config, dict) and self.config.get(key):
-            value = self.config.get(key, default_value)
-        elif hasattr(self.config, key) and getattr(self.config, key):
-            value = getattr(self.config, key)
-        elif (self._config_parser.has_option(self.PROVIDER_ID, key) and
-              self._config_parser.get(self.PROVIDER_ID, key)):
-            value = self._config_parser.get(self.PROVIDER_ID, key)
-        return value
+        value = self._effective_config.get(key)
+        if value:
+            return value
+        value = getattr(self.config, key, None)
+        return value if value else default_value
@@ -1,11 +1,14 @@
 import importlib
-import inspect
 import logging
-import pkgutil
+import threading
+import time
+from collections import OrderedDict
 from collections import defaultdict
+from contextlib import contextmanager
 
 from smartbridge import providers
 from smartbridge.interfaces import Provider
+from smartbridge.interfaces import TestMockHelperMixin
 
 
 log = logging.getLogger(__name__)
@@ -16,15 +19,233 @@ class ProviderList(object):
     MOCK = 'mock'
 
 
+# maps the PROVIDER_ID of every bundled provider to the class implementing
+# it, as ``module:class``, so that creating a provider imports its own
+# module only
+PROVIDER_MANIFEST = {
+    ProviderList.WYZE: 'smartbridge.providers.wyze.provider:WyzeProvider',
+    ProviderList.MOCK: 'smartbridge.providers.mock.provider:MockWyzeProvider',
+}
+
+# entry point group through which other packages can add providers, e.g.
+# ``entry_points={'smartbridge.providers': ['acme = acme.provider:Acme']}``
+ENTRY_POINT_GROUP = 'smartbridge.providers'
+
+
+class ProviderPool(object):
+    """
+    Shares providers between callers using the same provider and
+    configuration, so that they reuse warm clients and connection pools.
+    Providers are keyed by a fingerprint of the provider name and
+    configuration, credentials included. The least recently used provider
+    is evicted once more than ``max_size`` are pooled, and providers unused
+    for ``idle_timeout`` seconds are evicted the next time the pool is used.
+
+    Evicted providers are closed, unless they are checked out with
+    :meth:`checkout`: those are closed when the last caller using them
+    releases them.
+    """
+
+    def __init__(self, factory, max_size=32, idle_timeout=300):
+        self._factory = factory
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        # fingerprint -> [provider, last used, checkouts], least recently
+        # used first
+        self._providers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._providers)
+
+    @staticmethod
+    def fingerprint(name, config):
+        """
+        Returns the key that a provider is pooled under. Only a digest of
+        the configuration is kept.
+        :rtype: ``str``
+        """
+        import hashlib
+        import json
+
+        stable = json.dumps([name, dict(config or {})], sort_keys=True,
+                            separators=(',', ':'), default=repr)
+        return hashlib.sha256(stable.encode('utf-8')).hexdigest()
+
+    def get(self, name, config):
+        """
+        Returns the pooled provider for ``name`` and ``config``, creating it
+        if there is none. The provider is closed once it is evicted; use
+        :meth:`checkout` to keep it open while it is in use.
+        :rtype: ``object`` of :class:`.Provider`
+        """
+        return self._get(name, config, 0)[1][0]
+
+    @contextmanager
+    def checkout(self, name, config):
+        """
+        Like :meth:`get`, as a context manager that keeps the provider open
+        until the block is left, even if it is evicted meanwhile.
+        """
+        key, entry = self._get(name, config, 1)
+        try:
+            yield entry[0]
+        finally:
+            with self._lock:
+                entry[2] -= 1
+                pooled = self._providers.get(key) is entry
+                if pooled:
+                    entry[1] = time.monotonic()
+                    self._providers.move_to_end(key)
+            if not pooled and not entry[2]:
+                self._close([entry[0]])
+
+    def _get(self, name, config, checkouts):
+        key = self.fingerprint(name, config)
+        expired = []
+        try:
+            with self._lock:
+                expired.extend(self._remove_idle(time.monotonic()))
+                entry = self._use(key, checkouts)
+            if entry is None:
+                # providers are created outside of the lock, as that may
+                # take a while; the first one created for a key is kept
+                provider = self._factory.create_provider(name, config)
+                with self._lock:
+                    entry = self._use(key, checkouts)
+                    if entry is None:
+                        entry = self._providers[key] = [
+                            provider, time.monotonic(), checkouts]
+                        expired.extend(self._remove_least_recently_used())
+                    else:
+                        expired.append(provider)
+        finally:
+            self._close(expired)
+        return key, entry
+
+    def _use(self, key, checkouts):
+        entry = self._providers.get(key)
+        if entry is not None:
+            entry[1] = time.monotonic()
+            entry[2] += checkouts
+            self._providers.move_to_end(key)
+        return entry
+
+    def remove(self, name, config):
+        """
+        Closes and forgets the pooled provider for ``name`` and ``config``,
+        e.g. after its credentials were revoked.
+        """
+        with self._lock:
+            entry = self._providers.pop(self.fingerprint(name, config), None)
+            expired = self._unused([entry] if entry else [])
+        self._close(expired)
+
+    def clear(self):
+        """
+        Closes and forgets every pooled provider.
+        """
+        with self._lock:
+            expired = self._unused(self._providers.values())
+            self._providers.clear()
+        self._close(expired)
+
+    @staticmethod
+    def _unused(entries):
+        # providers still checked out are closed when they are released
+        return [entry[0] for entry in entries if not entry[2]]
+
+    def _remove_least_recently_used(self):
+        entries = []
+        while len(self._providers) > self._max_size:
+            entries.append(self._providers.popitem(last=False)[1])
+        return self._unused(entries)
+
+    def _remove_idle(self, now):
+        if self._idle_timeout is None:
+            return []
+        idle = [key for key, (_, last_used, checkouts)
+                in self._providers.items()
+                if not checkouts and now - last_used >= self._idle_timeout]
+        return self._unused([self._providers.pop(key) for key in idle])
+
+    def _close(self, providers):
+        for provider in providers:
+            log.debug("Closing pooled provider %s", provider.name)
+            try:
+                provider.close()
+            except Exception as e:
+                log.warning("Could not close provider %s: %s",
+                            provider.name, e)
+
+
 class ProviderFactory(object):
     """
     Get info and handle on the available provider implementations.
     """
 
-    def __init__(self):
+    def __init__(self, pool_size=32, pool_idle_timeout=300):
         self.provider_list = defaultdict(dict)
+        self.provider_paths = dict(PROVIDER_MANIFEST)
+        self._entry_points_loaded = False
+        self._discovered = False
+        self.pool = ProviderPool(self, pool_size, pool_idle_timeout)
         log.debug("Providers List: %s", self.provider_list)
 
+    def register_provider_path(self, provider_id, path):
+        """
+        Registers a provider with the factory without importing it. The
+        class is imported the first time the provider is requested.
+        :type  provider_id: str
+        :param provider_id: The PROVIDER_ID of the provider.
+        :type  path: str
+        :param path: The class implementing the provider, as
+                     ``package.module:ClassName``.
+        """
+        self.provider_paths[provider_id] = path
+
+    def _load_entry_points(self):
+        """
+        Adds the providers advertised by installed packages through the
+        ``smartbridge.providers`` entry point group. Bundled providers take
+        precedence.
+        """
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        from importlib.metadata import entry_points
+
+        try:
+            found = entry_points(group=ENTRY_POINT_GROUP)
+        except TypeError:
+            # Python < 3.10
+            found = entry_points().get(ENTRY_POINT_GROUP, ())
+        for entry_point in found:
+            self.provider_paths.setdefault(
+                entry_point.name, entry_point.value.replace(' ', ''))
+
+    def _load_provider(self, provider_id):
+        """
+        Imports and registers the class of the given provider.
+        :rtype: provider class or ``None``
+        """
+        path = self.provider_paths.get(provider_id)
+        if path is None:
+            self._load_entry_points()
+            path = self.provider_paths.get(provider_id)
+        if path is None:
+            return None
+
+        module_name, _, class_name = path.partition(':')
+        log.debug("Importing provider %s from %s", provider_id, module_name)
+        try:
+            cls = getattr(importlib.import_module(module_name), class_name)
+        except (ImportError, AttributeError) as e:
+            log.warning("Could not import provider %s: %s", provider_id, e)
+            return None
+        self.register_provider_class(cls)
+        return self.provider_list.get(provider_id, {}).get('class')
+
     def register_provider_class(self, cls):
         """
         Registers a provider class with the factory. The class must
@@ -53,11 +274,25 @@ class ProviderFactory(object):
 
     def discover_providers(self):
         """
-        Discover all available providers within the
+        Discover all available providers: the ones listed in the manifest or
+        advertised through entry points, and any other module within the
         ``smartbridge.providers`` package.
         Note that this methods does not guard against a failed import.
         """
+        import pkgutil
+
+        self._load_entry_points()
+        for provider_id in list(self.provider_paths):
+            if not self.provider_list.get(provider_id, {}).get('class'):
+                self._load_provider(provider_id)
+
+        listed = set(path.split(':')[0]
+                     for path in self.provider_paths.values())
         for _, modname, _ in pkgutil.iter_modules(providers.__path__):
+            prefix = "{0}.{1}".format(providers.__name__, modname)
+            if any(name == prefix or name.startswith(prefix + '.')
+                   for name in listed):
+                continue
             log.debug("Importing provider: %s", modname)
             try:
                 self._import_provider(modname)
@@ -69,6 +304,8 @@ class ProviderFactory(object):
         Imports and registers providers from the given module name.
         Raises an ImportError if the import does not succeed.
         """
+        import inspect
+
         log.debug("Importing providers from %s", module_name)
         module = importlib.import_module(
             "{0}.{1}".format(providers.__name__,
@@ -81,8 +318,8 @@ class ProviderFactory(object):
     def list_providers(self):
         """
         Get a list of available providers.
-        It uses a simple automatic discovery system by iterating through all
-        submodules in smartbridge.providers.
+        This imports every provider; use :meth:`get_provider_class` to
+        import a single one.
         :rtype: dict
         :return: A dict of available providers and their implementations in the
                  following format::
@@ -91,8 +328,9 @@ class ProviderFactory(object):
                                          der}
                  }
         """
-        if not self.provider_list:
+        if not self._discovered:
             self.discover_providers()
+            self._discovered = True
         log.debug("List of available providers: %s", self.provider_list)
         return self.provider_list
 
@@ -122,6 +360,25 @@ class ProviderFactory(object):
         log.debug("Created '%s' provider", name)
         return provider_class(config)
 
+    def get_provider(self, name, config):
+        """
+        Like :meth:`create_provider`, but returns a provider shared with
+        earlier calls using the same name and config, if it was used within
+        the factory's ``pool_idle_timeout``. Providers are safe to share
+        between threads, so a multi-tenant service can keep one provider
+        (and its connections) per set of credentials.
+        :rtype: ``object`` of :class:`.Provider`
+        """
+        return self.pool.get(name, config)
+
+    def checkout_provider(self, name, config):
+        """
+        Like :meth:`get_provider`, as a context manager that keeps the
+        provider open while the block runs, even if the pool evicts it
+        meanwhile.
+        """
+        return self.pool.checkout(name, config)
+
     def get_provider_class(self, name):
         """
         Return a class for the requested provider.
@@ -130,13 +387,18 @@ class ProviderFactory(object):
                  if the provider was not found.
         """
         log.debug("Returning a class for the %s provider", name)
-        impl = self.list_providers().get(name)
-        if impl:
+        impl = self.provider_list.get(name)
+        if impl and impl.get("class"):
             log.debug("Returning provider class for %s", name)
             return impl["class"]
-        else:
+        cls = self._load_provider(name)
+        if cls is None and not self._discovered:
+            # providers outside the manifest can only be found by importing
+            # every module
+            cls = self.list_providers().get(name, {}).get("class")
+        if cls is None:
             log.debug("Provider with the name: %s not found", name)
-            return None
+        return cls
 
     def get_all_provider_classes(self, ignore_mocks=False):
         """
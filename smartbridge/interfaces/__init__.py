@@ -2,6 +2,7 @@
 Public interface exports
 """
 from .provider import Provider  # noqa
+from .provider import TestMockHelperMixin  # noqa
 from .devices import DeviceType  # noqa
 from .devices import Device  # noqa
 from .devices import NetworkedDevice  # noqa
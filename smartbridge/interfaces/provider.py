@@ -73,6 +73,15 @@ class Provider(object):
         """
         pass
 
+    @abstractmethod
+    def close(self):
+        """
+        Releases the connections (sessions, connection pools, worker
+        threads) held by this provider. They are reopened on demand, so the
+        provider remains usable after it was closed.
+        """
+        pass
+
     @abstractmethod
     def has_service(self, service_type):
         """
@@ -150,3 +159,29 @@ class Provider(object):
         :return:  a MotionSensorService object
         """
         pass
+
+
+class TestMockHelperMixin(object):
+    """
+    A helper class that providers can implement to indicate that they are
+    mock providers, which run against local stand-ins rather than the real
+    smart-device services. Test cases use the methods below to set up and
+    tear down the stand-in before and after each test.
+    """
+
+    def setUpMock(self):
+        """
+        Called before each test is run. Starts the stand-in services and
+        prepares any data that the tests depend on.
+        """
+        raise NotImplementedError(
+            'TestMockHelperMixin.setUpMock not implemented by this provider')
+
+    def tearDownMock(self):
+        """
+        Called after each test is run. Stops the stand-in services and
+        discards their state.
+        """
+        raise NotImplementedError(
+            'TestMockHelperMixin.tearDownMock not implemented by this '
+            'provider')
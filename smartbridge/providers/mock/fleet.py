@@ -0,0 +1,330 @@
+"""
+Synthetic Wyze accounts served by the local stand-in server
+"""
+import base64
+import logging
+import random
+import struct
+import threading
+import time
+import zlib
+
+from smartbridge.providers.wyze.devices import WyzeBulb
+from smartbridge.providers.wyze.devices import WyzeContactSensor
+from smartbridge.providers.wyze.devices import WyzeMotionSensor
+from smartbridge.providers.wyze.devices import WyzePlug
+
+log = logging.getLogger(__name__)
+
+
+def _varint(value):
+    value &= (1 << 64) - 1
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _field(number, value):
+    if isinstance(value, float):
+        return _varint(number << 3 | 5) + struct.pack('<f', value)
+    if isinstance(value, int):
+        return _varint(number << 3) + _varint(value)
+    if isinstance(value, list):
+        value = b''.join(value)
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def _path_message(pose_id, history):
+    return _field(6, [_field(1, pose_id)] + [
+        _field(2, [_field(1, update), _field(2, x), _field(3, y)])
+        for update, x, y in history])
+
+
+def _pose_message(pose_id, update, x, y):
+    return _field(8, [_field(1, pose_id), _field(2, update), _field(3, x),
+                      _field(4, y), _field(5, 0.0)])
+
+
+def encode_map_blob(message):
+    """
+    Packs an encoded map message the way the API returns it: zlib
+    compressed and base64 encoded.
+    :rtype: ``str``
+    """
+    return base64.b64encode(zlib.compress(message)).decode('ascii')
+
+
+def synthetic_map(size=200, rooms=4, history=500, resolution=0.05):
+    """
+    Returns the encoded message of a square map with ``size`` x ``size``
+    cells, ``rooms`` side by side rooms and a path of ``history`` points.
+    :rtype: ``bytes``
+    """
+    extent = size * resolution / 2
+    cells = size * size
+    grid = bytearray(cells)
+    matrix = bytearray(cells)
+    for row in range(size):
+        for column in range(size):
+            i = row * size + column
+            if row in (0, size - 1) or column in (0, size - 1):
+                grid[i] = 127
+            else:
+                grid[i] = 255
+                matrix[i] = column * rooms // size + 1
+
+    path = [(i, -extent + (i % size) * resolution,
+             -extent + (i // size % size) * resolution)
+            for i in range(history)]
+    return b''.join([
+        _field(1, 1),
+        _field(2, [_field(1, 1600000000), _field(2, 1600000000)]),
+        _field(3, [_field(1, 1), _field(2, size), _field(3, size),
+                   _field(4, -extent), _field(5, -extent),
+                   _field(6, extent), _field(7, extent),
+                   _field(8, resolution)]),
+        _field(4, [_field(1, bytes(grid))]),
+        _field(5, [_field(1, 1), _field(2, b'Home')]),
+        _path_message(1, path),
+        _field(7, [_field(1, 0.0), _field(2, 0.0), _field(3, 0.0)]),
+        _pose_message(1, history, 0.0, 0.0),
+    ] + [
+        _field(12, [_field(1, room + 1), _field(2, b'Room %d' % (room + 1)),
+                    _field(5, 0), _field(6, 1)])
+        for room in range(rooms)
+    ] + [
+        _field(13, [_field(1, bytes(matrix))]),
+    ])
+
+
+# the product model, product type and property table of each device type
+_DEVICE_TYPES = (
+    ('bulbs', 'WLPA19', 'Light', WyzeBulb),
+    ('plugs', 'WLPP1', 'Plug', WyzePlug),
+    ('contact_sensors', 'DWS3U', 'ContactSensor', WyzeContactSensor),
+    ('motion_sensors', 'PIR3U', 'MotionSensor', WyzeMotionSensor),
+)
+
+
+class WyzeFleet(object):
+    """
+    The devices of a synthetic Wyze account. Property values are generated
+    from the PID tables of the device classes, using ``seed`` so that two
+    fleets of the same size are identical. Device state changes through
+    ``set_property`` and the vacuum actions, like it would on real devices.
+    """
+
+    def __init__(self, bulbs=2, plugs=2, contact_sensors=2, motion_sensors=2,
+                 vacuums=1, sweep_records=5, map_size=200, seed=0):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._properties = {}
+        self._vacuums = {}
+        self._map_size = map_size
+
+        counts = {
+            'bulbs': bulbs,
+            'plugs': plugs,
+            'contact_sensors': contact_sensors,
+            'motion_sensors': motion_sensors,
+        }
+        for i, (kind, model, product_type, device_class) in enumerate(
+                _DEVICE_TYPES):
+            for n in range(counts[kind]):
+                mac = '{0}{1:02X}{2:06X}'.format('7C78B2', i, n)
+                self._devices[mac] = self._device(
+                    mac, model, product_type,
+                    '{0} {1}'.format(product_type, n + 1))
+                properties = self._properties[mac] = (
+                    self._initial_properties(device_class))
+                if 'switch_state' in device_class.props():
+                    self._devices[mac]['device_params']['switch_state'] = int(
+                        properties['P3'])
+        for n in range(vacuums):
+            mac = 'JA_RO2_{0:06X}'.format(n)
+            self._devices[mac] = self._device(
+                mac, 'JA_RO2', 'JA_RO2', 'Vacuum {0}'.format(n + 1))
+            self._vacuums[mac] = self._initial_vacuum(mac, sweep_records)
+
+    def _device(self, mac, model, product_type, nickname):
+        return {
+            'mac': mac,
+            'product_model': model,
+            'product_type': product_type,
+            'nickname': nickname,
+            'firmware_ver': '1.2.0.111',
+            'hardware_ver': '0.0.0.0',
+            'device_params': {
+                'ip': '10.0.{0}.{1}'.format(
+                    self._random.randint(0, 254), self._random.randint(1, 254)),
+                'rssi': str(self._random.randint(-80, -30)),
+                'ssid': 'smartbridge',
+            },
+        }
+
+    def _value(self, name, type):
+        if name in ('switch_state', 'available', 'status_light'):
+            return '1' if name == 'available' else str(self._random.randint(0, 1))
+        if name == 'brightness':
+            return str(self._random.randint(1, 100))
+        if name == 'color_temp':
+            return str(self._random.randint(2700, 6500))
+        if name == 'rssi':
+            return str(self._random.randint(-80, -30))
+        if name == 'voltage':
+            return str(self._random.randint(80, 100))
+        if type == 'int':
+            return '0'
+        return ''
+
+    def _initial_properties(self, device_class):
+        return {pid: self._value(name, type)
+                for name, (pid, type) in device_class.props().items()}
+
+    def _initial_vacuum(self, mac, sweep_records):
+        now = int(time.time() * 1000)
+        current_map = synthetic_map(size=self._map_size, history=0)
+        return {
+            'props': {
+                'iot_state': 'connected',
+                'battary': self._random.randint(20, 100),
+                'mode': 0,
+                'chargeState': 1,
+                'cleanSize': 0,
+                'cleanTime': 0,
+                'fault_type': '',
+                'fault_code': 0,
+                'current_mapid': 1,
+                'count': sweep_records,
+                'cleanlevel': 2,
+                'notice_save_map': True,
+                'memory_map_update_time': now,
+            },
+            'device_info': {
+                'mac': mac,
+                'ipaddr': '10.0.0.{0}'.format(self._random.randint(1, 254)),
+                'device_type': 'Robot',
+                'mcu_sys_version': '1.6.113',
+            },
+            'map': encode_map_blob(current_map),
+            'pose_id': 1,
+            'history': [],
+            'records': [{
+                'record_id': '{0}-{1}'.format(mac, n),
+                'create_time': now - (n + 1) * 86400000,
+                'clean_time': 30 + n,
+                'clean_size': 20 + n,
+                'clean_type': 0,
+                'map': encode_map_blob(synthetic_map(size=50, history=50)),
+            } for n in range(sweep_records)],
+        }
+
+    def device_list(self):
+        with self._lock:
+            return [dict(device) for device in self._devices.values()]
+
+    def get_device(self, mac):
+        return self._devices.get(mac)
+
+    @property
+    def macs(self):
+        return list(self._devices)
+
+    def property_list(self, mac, pids=None):
+        """
+        Returns the properties of a device in the ``property_list`` layout
+        of the API, limited to ``pids`` when given.
+        :rtype: ``list`` of ``dict``
+        """
+        properties = self._properties.get(mac, {})
+        ts = int(time.time() * 1000)
+        with self._lock:
+            return [{'pid': pid, 'value': value, 'ts': ts}
+                    for pid, value in properties.items()
+                    if not pids or pid in pids]
+
+    def set_property(self, mac, pid, value):
+        """
+        Changes a device property. Returns ``False`` for unknown devices.
+        :rtype: ``bool``
+        """
+        properties = self._properties.get(mac)
+        if properties is None:
+            return False
+        with self._lock:
+            properties[pid] = str(value)
+            if pid == 'P3':
+                self._devices[mac] = dict(
+                    self._devices[mac],
+                    device_params=dict(
+                        self._devices[mac]['device_params'],
+                        switch_state=int(value)))
+        return True
+
+    def is_vacuum(self, mac):
+        return mac in self._vacuums
+
+    def vacuum_props(self, mac, keys):
+        props = self._vacuums[mac]['props']
+        return {key: props[key] for key in keys if key in props}
+
+    def vacuum_device_info(self, mac, keys):
+        info = self._vacuums[mac]['device_info']
+        return {key: info[key] for key in keys if key in info}
+
+    def vacuum_map(self, mac):
+        return {'map': self._vacuums[mac]['map']}
+
+    def vacuum_position(self, mac):
+        """
+        Returns the current position of a vacuum. A sweeping vacuum moves by
+        one path point every time its position is read.
+        """
+        with self._lock:
+            vacuum = self._vacuums[mac]
+            history = vacuum['history']
+            if vacuum['props']['mode'] == 1:
+                n = len(history)
+                history.append((n, 0.05 * (n % 40), 0.05 * (n // 40)))
+            update, x, y = history[-1] if history else (0, 0.0, 0.0)
+            message = (_path_message(vacuum['pose_id'], history) +
+                       _pose_message(vacuum['pose_id'], update, x, y))
+        return {'map': encode_map_blob(message)}
+
+    def vacuum_action(self, mac, cmd, params):
+        """
+        Applies a ``set_iot_action`` command to a vacuum.
+        """
+        with self._lock:
+            vacuum = self._vacuums[mac]
+            if cmd == 'set_mode':
+                # (type, value) as in WyzeVacuum.clean_props(), pause_props()
+                # and dock_props()
+                mode = {(0, 1): 1, (0, 2): 4, (3, 1): 5}.get(
+                    (int(params.get('type', 0)), int(params.get('value', 0))),
+                    0)
+                self._set_vacuum_mode(vacuum, mode)
+            elif cmd == 'set_preference':
+                if int(params.get('ctrltype', 0)) == 1:
+                    vacuum['props']['cleanlevel'] = int(params['value'])
+
+    def vacuum_sweep(self, mac, rooms):
+        with self._lock:
+            self._set_vacuum_mode(self._vacuums[mac], 1)
+
+    @staticmethod
+    def _set_vacuum_mode(vacuum, mode):
+        if mode == 1 and vacuum['props']['mode'] != 4:
+            # a new run rather than a resumed one
+            vacuum['pose_id'] += 1
+            vacuum['history'] = []
+        vacuum['props']['mode'] = mode
+
+    def vacuum_sweep_records(self, mac, last_time, count):
+        records = [record for record in self._vacuums[mac]['records']
+                   if record['create_time'] < last_time]
+        return records[:count]
@@ -0,0 +1,57 @@
+"""Provider implementation backed by a local Wyze stand-in server."""
+import logging
+
+from smartbridge.interfaces import TestMockHelperMixin
+from smartbridge.providers.wyze import WyzeProvider
+
+from .fleet import WyzeFleet
+from .server import WyzeStandInServer
+
+log = logging.getLogger(__name__)
+
+
+class MockWyzeProvider(WyzeProvider, TestMockHelperMixin):
+    '''
+    A Wyze provider that talks to a local :class:`.WyzeStandInServer`
+    instead of the Wyze cloud. Unless ``mock_server_url`` points at a
+    running stand-in, one is started for the provider, serving a
+    :class:`.WyzeFleet` built from the ``mock_fleet`` dictionary (e.g.
+    ``{'bulbs': 100}``) with the given ``mock_latency`` and
+    ``mock_error_rate``.
+    '''
+    PROVIDER_ID = 'mock'
+
+    def __init__(self, config):
+        super(MockWyzeProvider, self).__init__(config)
+
+        self.server_url = self._get_config_value('mock_server_url', None)
+        self._server = None
+        if self.server_url is None:
+            self._server = WyzeStandInServer(
+                fleet=WyzeFleet(**(self._get_config_value('mock_fleet', {}))),
+                latency=self._get_config_value('mock_latency', 0),
+                error_rate=float(self._get_config_value('mock_error_rate', 0)))
+            self.server_url = self._server.start().url
+
+        self.endpoint_urls = {
+            name: self.server_url for name in self.endpoint_urls}
+        if self.access_token is None:
+            self.access_token = WyzeStandInServer.ACCESS_TOKEN
+            self.refresh_token = WyzeStandInServer.REFRESH_TOKEN
+
+    @property
+    def server(self):
+        '''
+        The stand-in server started by this provider, if any.
+        :rtype: :class:`.WyzeStandInServer`
+        '''
+        return self._server
+
+    def setUpMock(self):
+        if self._server is not None:
+            self._server.start()
+
+    def tearDownMock(self):
+        self.close()
+        if self._server is not None:
+            self._server.stop()
@@ -0,0 +1,443 @@
+"""
+A local stand-in for the Wyze cloud services, for offline functional and
+load testing.
+
+One HTTP server answers the api, venus, platform, auth and general service
+paths. Requests are validated the way the real services do it: ``sc``/``sv``
+and the access token on the api service, and ``signature2`` on the signed
+(wpk) services, so a client that signs incorrectly fails against the
+stand-in too.
+"""
+from collections import Counter
+from hashlib import md5
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qsl
+from urllib.parse import urlsplit
+
+from smartbridge.base.helpers import md5_string
+from smartbridge.providers.wyze.client import WyzeApiClient
+from smartbridge.providers.wyze.client import WyzeAuthServiceClient
+from smartbridge.providers.wyze.client import WyzeWpkNetServiceClient
+
+from .fleet import WyzeFleet
+
+log = logging.getLogger(__name__)
+
+# the sv value every api service path must be called with
+API_SV = {
+    '/app/user/refresh_token': 'd91914dd28b7492ab9dd17f7707d35a3',
+    '/app/v2/device/set_property': '44b6d5640c4d4978baba65c8ab9a6d6e',
+    '/app/v2/device_list/get_property_list': 'be9e90755d3445d0a4a583c8314972b6',
+    '/app/v2/device/get_property_list': '1df2807c63254e16a06213323fe8dec8',
+    '/app/v2/device/get_device_Info': '81d1abc794ba45a39fdd21233d621e84',
+    '/app/v2/home_page/get_object_list': 'c417b62d72ee44bf933054bdca183e77',
+}
+
+
+class WyzeStandInError(Exception):
+    """
+    Ends a request with an error response in the format of the services.
+    """
+
+    def __init__(self, code, msg, status=200):
+        super(WyzeStandInError, self).__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep connections alive, so clients can pool them, and send small
+    # responses right away rather than waiting for delayed ACKs
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _handle(self, method):
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, response = self.server.stand_in.handle(
+            method, self.path, self.headers, body)
+
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, format, *args):
+        log.debug('%s - %s', self.address_string(), format % args)
+
+
+class WyzeStandInServer(object):
+    """
+    Serves a :class:`.WyzeFleet` over HTTP on ``host``:``port`` (a free port
+    by default, see ``url``).
+
+    ``latency`` (seconds, or a ``(min, max)`` range) is added to every
+    request, and a fraction ``error_rate`` of the requests fail with an
+    HTTP 503. Errors for specific paths are queued with ``inject_error``.
+    Without ``username``, any login is accepted.
+    """
+
+    ACCESS_TOKEN = 'smartbridge-mock-access-token'
+    REFRESH_TOKEN = 'smartbridge-mock-refresh-token'
+    USER_ID = 'smartbridge-mock-user'
+
+    def __init__(self, fleet=None, host='127.0.0.1', port=0, latency=0,
+                 error_rate=0.0, username=None, password=None, seed=None):
+        self.fleet = fleet if fleet is not None else WyzeFleet()
+        self._host = host
+        self._port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self._username = username
+        self._password = password
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._access_tokens = {WyzeStandInServer.ACCESS_TOKEN}
+        self._refresh_tokens = {WyzeStandInServer.REFRESH_TOKEN}
+        self._token_count = 0
+        self._errors = {}
+        self.requests = Counter()
+        self._httpd = None
+        self._thread = None
+
+        self._routes = {
+            ('POST', '/user/login'): (self._auth, self._login),
+            ('POST', '/v1/user/event'): (self._general, self._user_event),
+            ('GET', '/app/v2/platform/get_variable'):
+                (self._signed, self._get_variable),
+            ('GET', '/app/v2/platform/get_user_profile'):
+                (self._signed, self._get_user_profile),
+            ('GET', '/plugin/venus/memory_map/current_position'):
+                (self._signed, self._current_position),
+            ('GET', '/plugin/venus/memory_map/current_map'):
+                (self._signed, self._current_map),
+            ('GET', '/plugin/venus/sweep_record/query_data'):
+                (self._signed, self._sweep_records),
+            ('GET', '/plugin/venus/get_iot_prop'):
+                (self._signed, self._get_iot_prop),
+            ('GET', '/plugin/venus/device_info'):
+                (self._signed, self._device_info),
+            ('POST', '/plugin/venus/set_iot_action'):
+                (self._signed, self._set_iot_action),
+            ('POST', '/plugin/venus/sweeping'):
+                (self._signed, self._sweeping),
+            ('POST', '/app/user/refresh_token'):
+                (self._api, self._refresh_token),
+            ('POST', '/app/v2/home_page/get_object_list'):
+                (self._api, self._get_object_list),
+            ('POST', '/app/v2/device_list/get_property_list'):
+                (self._api, self._get_device_list_property_list),
+            ('POST', '/app/v2/device/get_property_list'):
+                (self._api, self._get_device_property_list),
+            ('POST', '/app/v2/device/get_device_Info'):
+                (self._api, self._get_device_info),
+            ('POST', '/app/v2/device/set_property'):
+                (self._api, self._set_device_property),
+        }
+
+    @property
+    def url(self):
+        """
+        The base URL of the running server, for every service.
+        :rtype: ``str``
+        """
+        host, port = self._httpd.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.running:
+            self._httpd = ThreadingHTTPServer(
+                (self._host, self._port), _Handler)
+            self._httpd.daemon_threads = True
+            self._httpd.stand_in = self
+            # a restarted server keeps its port, and so its url
+            self._port = self._httpd.server_address[1]
+            self._thread = threading.Thread(
+                target=self._httpd.serve_forever,
+                name='wyze-stand-in', daemon=True)
+            self._thread.start()
+            log.debug('wyze stand-in listening on %s', self.url)
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def inject_error(self, path, code='1001', msg='', status=200, count=1):
+        """
+        Makes the next ``count`` requests to ``path`` fail, with an HTTP
+        ``status`` other than 200 or else with the given error ``code`` and
+        ``msg`` in the response.
+        """
+        with self._lock:
+            self._errors.setdefault(path, []).extend(
+                [WyzeStandInError(code, msg, status)] * count)
+
+    def expire_tokens(self):
+        """
+        Invalidates every access token issued so far; clients have to
+        refresh their token or log in again.
+        """
+        with self._lock:
+            self._access_tokens = set()
+
+    def handle(self, method, path, headers, body):
+        """
+        Answers one request and returns the HTTP status and the response.
+        """
+        url = urlsplit(path)
+        path = url.path
+        with self._lock:
+            self.requests[path] += 1
+            errors = self._errors.get(path)
+            injected = errors.pop(0) if errors else None
+        self._delay()
+
+        route = self._routes.get((method, path))
+        if route is None:
+            return 404, {'code': '404', 'msg': 'NotFound'}
+        try:
+            if injected is not None:
+                raise injected
+            if self.error_rate and self._random.random() < self.error_rate:
+                raise WyzeStandInError('503', 'ServiceUnavailable', 503)
+
+            validate, respond = route
+            params = validate(
+                method, path, dict(parse_qsl(url.query, keep_blank_values=True)),
+                headers, body)
+            return 200, respond(params)
+        except WyzeStandInError as e:
+            return e.status, {'code': e.code, 'msg': e.msg, 'data': None}
+
+    def _delay(self):
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = self._random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+    @staticmethod
+    def _success(data=None):
+        return {'code': '1', 'msg': 'SUCCESS', 'data': data,
+                'ts': int(time.time() * 1000)}
+
+    @staticmethod
+    def _json(body):
+        try:
+            return json.loads(body.decode('utf-8'))
+        except ValueError:
+            raise WyzeStandInError('1001', 'InvalidParameter')
+
+    def _check_access_token(self, access_token):
+        if access_token not in self._access_tokens:
+            raise WyzeStandInError('2001', 'AccessTokenError')
+
+    @staticmethod
+    def _check_signature(headers, access_token, message):
+        salt = WyzeWpkNetServiceClient.SALTS.get(headers.get('appid'))
+        if salt is None:
+            raise WyzeStandInError('1001', 'InvalidParameter')
+        if not headers.get('requestid'):
+            raise WyzeStandInError('1001', 'InvalidParameter')
+        # computed here rather than with the client's signer, so that a
+        # signing bug in the client cannot hide itself
+        signing_key = md5_string((access_token or '') + salt)
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        expected = hmac.new(signing_key.encode('utf-8'), msg=message,
+                            digestmod=md5).hexdigest()
+        if headers.get('signature2') != expected:
+            raise WyzeStandInError('1004', 'InvalidSignature')
+
+    def _auth(self, method, path, query, headers, body):
+        if headers.get('x-api-key') != WyzeAuthServiceClient.X_API_KEY:
+            raise WyzeStandInError('1001', 'InvalidParameter', 401)
+        # logins are signed without an access token
+        self._check_signature(headers, None, body)
+        return self._json(body)
+
+    def _signed(self, method, path, query, headers, body):
+        access_token = headers.get('access_token')
+        self._check_access_token(access_token)
+        if method == 'GET':
+            if 'nonce' not in query:
+                raise WyzeStandInError('1001', 'InvalidParameter')
+            self._check_signature(headers, access_token, '&'.join(
+                name + '=' + value for name, value in sorted(query.items())))
+            return query
+
+        params = self._json(body)
+        if 'nonce' not in params:
+            raise WyzeStandInError('1001', 'InvalidParameter')
+        self._check_signature(headers, access_token, body)
+        return params
+
+    def _api(self, method, path, query, headers, body):
+        params = self._json(body)
+        if params.get('sc') != WyzeApiClient.SC or (
+                params.get('sv') != API_SV[path]):
+            raise WyzeStandInError('1001', 'InvalidParameter')
+        if not params.get('ts') or not params.get('phone_id'):
+            raise WyzeStandInError('1001', 'InvalidParameter')
+        if path != '/app/user/refresh_token':
+            self._check_access_token(params.get('access_token'))
+        return params
+
+    def _general(self, method, path, query, headers, body):
+        params = self._json(body)
+        if not params.get('appId') or not params.get('eventId'):
+            raise WyzeStandInError('1001', 'InvalidParameter')
+        return params
+
+    def _issue_tokens(self):
+        with self._lock:
+            self._token_count += 1
+            access_token = '{0}-{1}'.format(
+                WyzeStandInServer.ACCESS_TOKEN, self._token_count)
+            refresh_token = '{0}-{1}'.format(
+                WyzeStandInServer.REFRESH_TOKEN, self._token_count)
+            self._access_tokens.add(access_token)
+            self._refresh_tokens.add(refresh_token)
+        return access_token, refresh_token
+
+    def _login(self, params):
+        if self._username is not None and (
+                params.get('email') != self._username or
+                params.get('password') != md5_string(md5_string(md5_string(
+                    self._password or '')))):
+            return {'code': '1000', 'msg': 'UserNameOrPasswordError'}
+
+        access_token, refresh_token = self._issue_tokens()
+        return {
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'user_id': WyzeStandInServer.USER_ID,
+            'mfa_options': None,
+        }
+
+    def _refresh_token(self, params):
+        if params.get('refresh_token') not in self._refresh_tokens:
+            raise WyzeStandInError('2001', 'RefreshTokenError')
+        access_token, refresh_token = self._issue_tokens()
+        return self._success({
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+        })
+
+    def _user_event(self, params):
+        return self._success()
+
+    def _get_variable(self, params):
+        return self._success({
+            key: None for key in params.get('keys', '').split(',') if key})
+
+    def _get_user_profile(self, params):
+        return self._success({
+            'user_id': WyzeStandInServer.USER_ID,
+            'nickname': 'smartbridge',
+            'email': self._username,
+        })
+
+    def _device(self, mac, vacuum=False):
+        device = self.fleet.get_device(mac)
+        if device is None or self.fleet.is_vacuum(mac) != vacuum:
+            raise WyzeStandInError('3001', 'DeviceNotFound')
+        return device
+
+    def _current_position(self, params):
+        self._device(params.get('did'), vacuum=True)
+        return self._success(self.fleet.vacuum_position(params['did']))
+
+    def _current_map(self, params):
+        self._device(params.get('did'), vacuum=True)
+        return self._success(self.fleet.vacuum_map(params['did']))
+
+    def _sweep_records(self, params):
+        self._device(params.get('did'), vacuum=True)
+        try:
+            last_time = int(params.get('last_time'))
+            count = int(params.get('count'))
+        except (TypeError, ValueError):
+            raise WyzeStandInError('1001', 'InvalidParameter')
+        return self._success({'data': self.fleet.vacuum_sweep_records(
+            params['did'], last_time, count)})
+
+    def _get_iot_prop(self, params):
+        self._device(params.get('did'), vacuum=True)
+        return self._success({'props': self.fleet.vacuum_props(
+            params['did'], params.get('keys', '').split(','))})
+
+    def _device_info(self, params):
+        self._device(params.get('device_id'), vacuum=True)
+        return self._success(self.fleet.vacuum_device_info(
+            params['device_id'], params.get('keys', '').split(',')))
+
+    def _set_iot_action(self, params):
+        self._device(params.get('did'), vacuum=True)
+        self.fleet.vacuum_action(
+            params['did'], params.get('cmd'), params.get('params') or {})
+        return self._success({})
+
+    def _sweeping(self, params):
+        self._device(params.get('did'), vacuum=True)
+        self.fleet.vacuum_sweep(params['did'], params.get('rooms_id') or [])
+        return self._success({})
+
+    def _get_object_list(self, params):
+        return self._success({'device_list': self.fleet.device_list()})
+
+    def _get_device_list_property_list(self, params):
+        pids = params.get('target_pid_list') or None
+        return self._success({'device_list': [{
+            'device_mac': mac,
+            'device_property_list': self.fleet.property_list(mac, pids),
+        } for mac in params.get('device_list') or []
+            if self.fleet.get_device(mac) is not None]})
+
+    def _get_device_property_list(self, params):
+        mac = params.get('device_mac')
+        self._device(mac)
+        return self._success({'property_list': self.fleet.property_list(
+            mac, params.get('target_pid_list') or None)})
+
+    def _get_device_info(self, params):
+        mac = params.get('device_mac')
+        device = dict(self._device(mac))
+        device['property_list'] = self.fleet.property_list(mac)
+        return self._success(device)
+
+    def _set_device_property(self, params):
+        mac = params.get('device_mac')
+        self._device(mac)
+        self.fleet.set_property(mac, params.get('pid'), params.get('pvalue'))
+        return self._success({})
@@ -0,0 +1,350 @@
+"""
+Asyncio counterparts of the Wyze clients, backed by aiohttp.
+
+The request-building and signing code of the blocking service clients is
+reused as is; only the transport is replaced, so every endpoint method of an
+async service client returns an awaitable.
+"""
+import asyncio
+import logging
+import time
+
+from smartbridge.interfaces.exceptions import ProviderConnectionException
+
+from .client import WyzeApiClient
+from .client import WyzeVenusServiceClient
+from .client import merge_property_lists
+from .devices import DeviceModels
+from .registry import WyzeDeviceRegistry
+from .throttle import PRIORITY_COMMAND
+from .throttle import THROTTLED_STATUSES
+from .throttle import current_priority
+from .throttle import request_priority
+
+log = logging.getLogger(__name__)
+
+
+class AsyncWyzeServiceClientMixin(object):
+    """
+    Replaces the ``requests`` transport of a :class:`.WyzeServiceClient` with
+    an ``aiohttp`` session. ``aiohttp`` is only imported when the first
+    session is created, so it is only needed by users of the async clients.
+    """
+
+    def __init__(self, config, access_token=None):
+        super(AsyncWyzeServiceClientMixin, self).__init__(config, access_token)
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                headers=self._without_empty_values(self.session_headers),
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self._request_timeout))
+
+        return self._session
+
+    @staticmethod
+    def _without_empty_values(headers):
+        # requests silently drops headers without a value, aiohttp does not
+        return {name: value for name, value in (headers or {}).items()
+                if value is not None}
+
+    async def _do_request(self, method, url, headers, params=None, data=None):
+        import aiohttp
+
+        rate_limiter = self.rate_limiter
+        await rate_limiter.async_acquire(current_priority())
+
+        headers = self._without_empty_values(headers)
+        try:
+            log.debug('sending ' + method + ' request to ' + url)
+            async with self.session.request(
+                    method, url, headers=headers, params=params,
+                    data=data) as response:
+                if response.status >= 400:
+                    if response.status in THROTTLED_STATUSES:
+                        rate_limiter.throttled()
+                    raise ProviderConnectionException(
+                        '{0} error for url: {1}'.format(response.status, url))
+                response_json = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError,
+                ValueError) as request_exception:
+            log.exception(request_exception)
+            raise ProviderConnectionException(request_exception)
+
+        log.trace('parsed response JSON')
+        log.trace(response_json)
+
+        if (isinstance(response_json, dict) and
+                str(response_json.get('code')) in self._throttled_codes):
+            rate_limiter.throttled()
+            raise ProviderConnectionException(
+                'Throttled by {0} with response: {1}'.format(
+                    url, response_json))
+        rate_limiter.succeeded()
+
+        self._check_response(url, data, headers, response_json)
+
+        return response_json
+
+    async def do_post(self, url: str, headers: dict, payload):
+        request_headers = {'content-type': 'application/json'}
+        if headers is not None:
+            request_headers.update(headers)
+
+        return await self._do_request(
+            'POST', url, request_headers, data=self.serialize(payload))
+
+    async def do_get(self, url: str, headers: dict, payload: dict):
+        return await self._do_request('GET', url, headers, params=payload)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class AsyncWyzeApiClient(AsyncWyzeServiceClientMixin, WyzeApiClient):
+    """
+    Async wrapper on the requests to https://api.wyzecam.com
+    """
+
+    def __init__(self, config, access_token):
+        super(AsyncWyzeApiClient, self).__init__(config, access_token)
+
+    # commands are awaited within their priority, as the blocking client
+    # only sets it while creating the coroutine
+
+    async def set_device_property(self, mac, model, pid, value):
+        with request_priority(PRIORITY_COMMAND):
+            return await super(AsyncWyzeApiClient, self).set_device_property(
+                mac, model, pid, value)
+
+
+class AsyncWyzeVenusServiceClient(
+        AsyncWyzeServiceClientMixin, WyzeVenusServiceClient):
+    """
+    Async wrapper on the requests to the Wyze Venus (vacuum) service
+    """
+
+    def __init__(self, config, access_token):
+        super(AsyncWyzeVenusServiceClient, self).__init__(config, access_token)
+
+    async def set_iot_action(self, did, model, cmd, params,
+                             is_sub_device=False):
+        with request_priority(PRIORITY_COMMAND):
+            return await super(
+                AsyncWyzeVenusServiceClient, self).set_iot_action(
+                    did, model, cmd, params, is_sub_device)
+
+    async def sweep_room(self, did, rooms=[]):
+        with request_priority(PRIORITY_COMMAND):
+            return await super(
+                AsyncWyzeVenusServiceClient, self).sweep_room(did, rooms)
+
+
+class AsyncWyzeClient(object):
+    """
+    Async Wyze client is the asyncio twin of :class:`.WyzeClient`
+    """
+
+    def __init__(self, config={}):
+        self._config = config
+        self._access_token = config.get('access_token')
+
+        self._api_client = None
+        self._venus_client = None
+
+        self._device_registry = WyzeDeviceRegistry()
+        self._device_list_ttl = float(config.get('device_list_ttl', 30))
+        self._device_list_loaded_at = None
+        self._device_list_generation = 0
+        self._device_list_lock = None
+        self._property_list_chunk_size = int(
+            config.get('property_list_chunk_size', 50))
+        self._request_timeout = float(config.get('request_timeout', 10))
+
+    @property
+    def venus_client(self):
+        if not self._venus_client:
+            self._venus_client = AsyncWyzeVenusServiceClient(
+                self._config, self._access_token)
+        return self._venus_client
+
+    @property
+    def api_client(self):
+        if not self._api_client:
+            self._api_client = AsyncWyzeApiClient(
+                self._config, self._access_token)
+        return self._api_client
+
+    async def close(self):
+        for client in (self._api_client, self._venus_client):
+            if client:
+                await client.close()
+
+    def _is_device_list_fresh(self):
+        return (self._device_list_loaded_at is not None and
+                time.monotonic() - self._device_list_loaded_at <
+                self._device_list_ttl)
+
+    async def devices(self):
+        """
+        Returns the registry of account-wide devices, refetching the device
+        list once ``device_list_ttl`` has expired. Concurrent callers share a
+        single fetch.
+        :rtype: :class:`.WyzeDeviceRegistry`
+        """
+        if self._is_device_list_fresh():
+            return self._device_registry
+
+        if self._device_list_lock is None:
+            self._device_list_lock = asyncio.Lock()
+
+        async with self._device_list_lock:
+            if self._is_device_list_fresh():
+                return self._device_registry
+
+            generation = self._device_list_generation
+            response = await self.api_client.get_object_list()
+            registry = self._device_registry.updated(
+                response['data']['device_list'])
+            # a list fetched before an invalidation is not kept
+            if generation == self._device_list_generation:
+                self._device_registry = registry
+                self._device_list_loaded_at = time.monotonic()
+
+        return registry
+
+    def invalidate_device_list(self):
+        self._device_list_generation += 1
+        self._device_list_loaded_at = None
+
+    async def list_devices(self):
+        return (await self.devices()).list()
+
+    async def _get_device(self, device_mac, models):
+        device = (await self.devices()).get(device_mac)
+        if device is None or device['product_model'] not in models:
+            return None
+        return dict(device)
+
+    async def _list_devices(self, models, props=None):
+        devices = (await self.devices()).list(models)
+        if props is None or len(devices) == 0:
+            return devices
+
+        chunk_size = self._property_list_chunk_size
+        chunks = [devices[start:start + chunk_size]
+                  for start in range(0, len(devices), chunk_size)]
+        responses = await asyncio.gather(*[
+            self.api_client.get_device_list_property_list(
+                [device['mac'] for device in chunk], props)
+            for chunk in chunks])
+
+        merged = []
+        for chunk, response in zip(chunks, responses):
+            merged.extend(merge_property_lists(chunk, response))
+        return merged
+
+    async def _get_with_properties(self, device_mac, models, props):
+        device = await self._get_device(device_mac, models)
+        if device is None:
+            return None
+
+        device.update(
+            await self.api_client.get_device_property_list(
+                device['mac'], device['product_model'], props))
+        return device
+
+    async def _get_sensor(self, device_mac, models):
+        sensor = await self._get_device(device_mac, models)
+        if sensor is None:
+            return None
+
+        sensor.update(
+            await self.api_client.get_device_info(
+                sensor['mac'], sensor['product_model']))
+        return sensor
+
+    async def list_bulbs(self, props=None):
+        return await self._list_devices(DeviceModels.BULB, props)
+
+    async def get_bulb(self, device_mac, props):
+        return await self._get_with_properties(
+            device_mac, DeviceModels.BULB, props)
+
+    async def set_bulb_property(self, device_mac, device_model, name, value):
+        await self.api_client.set_device_property(
+            device_mac, device_model, name, value)
+
+    async def list_plugs(self, props=None):
+        return await self._list_devices(DeviceModels.PLUG, props)
+
+    async def get_plug(self, device_mac, props):
+        return await self._get_with_properties(
+            device_mac, DeviceModels.PLUG, props)
+
+    async def set_plug_property(self, device_mac, device_model, name, value):
+        await self.api_client.set_device_property(
+            device_mac, device_model, name, value)
+
+    async def list_contact_sensors(self, props=None):
+        return await self._list_devices(DeviceModels.CONTACT_SENSOR, props)
+
+    async def get_contact_sensor(self, device_mac):
+        return await self._get_sensor(device_mac, DeviceModels.CONTACT_SENSOR)
+
+    async def list_motion_sensors(self, props=None):
+        return await self._list_devices(DeviceModels.MOTION_SENSOR, props)
+
+    async def get_motion_sensor(self, device_mac):
+        return await self._get_sensor(device_mac, DeviceModels.MOTION_SENSOR)
+
+    async def list_vacuums(self):
+        return await self._list_devices(DeviceModels.VACUUM)
+
+    async def get_vacuum(self, device_mac, props, device_info_props):
+        vacuum = await self._get_device(device_mac, DeviceModels.VACUUM)
+        if vacuum is None:
+            return None
+
+        venus_client = self.venus_client
+        names = ['props', 'device_info', 'current_position', 'current_map']
+        results = await asyncio.gather(*[
+            asyncio.wait_for(request, self._request_timeout)
+            for request in (
+                venus_client.get_iot_prop(device_mac, props),
+                venus_client.get_device_info(device_mac, device_info_props),
+                venus_client.get_current_position(device_mac),
+                venus_client.get_current_map(device_mac))],
+            return_exceptions=True)
+
+        # a failed sub-request only drops its part of the result
+        responses = {}
+        errors = []
+        for name, result in zip(names, results):
+            if isinstance(result, asyncio.CancelledError):
+                # cancellation is not a failed request
+                raise result
+            if isinstance(result, BaseException):
+                log.warning('%s request failed: %r', name, result)
+                errors.append(result)
+            else:
+                responses[name] = result
+        if len(errors) == len(results):
+            raise errors[0]
+
+        for name in ('props', 'device_info'):
+            response = responses.get(name)
+            if response and response.get('data') is not None:
+                vacuum.update(response['data'])
+        for name in ('current_position', 'current_map'):
+            response = responses.get(name)
+            if response and response.get('data') is not None:
+                vacuum[name] = response['data']
+
+        return vacuum
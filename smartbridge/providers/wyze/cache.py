@@ -0,0 +1,141 @@
+"""
+Caching helpers used by the Wyze client
+"""
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class WyzeDeviceListCache(object):
+    """
+    A thread-safe, time-based cache for the account-wide device list.
+
+    Fresh values are served for ``ttl`` seconds. Once a value is older than
+    that, but younger than ``ttl + stale_ttl``, it is still served while a
+    single background refresh is started (stale-while-revalidate). Anything
+    older than that is reloaded synchronously by the calling thread.
+    """
+
+    def __init__(self, loader, ttl=30, stale_ttl=30):
+        self._loader = loader
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._lock = threading.RLock()
+        self._value = None
+        self._loaded_at = None
+        self._refreshing = False
+        # bumped on every invalidation so that a load which started before
+        # an invalidation never overwrites the cache with outdated data
+        self._generation = 0
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    @property
+    def stale_ttl(self):
+        return self._stale_ttl
+
+    @property
+    def value(self):
+        """
+        The last loaded value, even if it expired or was invalidated since,
+        or ``None``. ``get()`` never returns it once it is invalid.
+        """
+        return self._value
+
+    def get(self):
+        """
+        Returns the cached value, loading it if needed.
+        """
+        with self._lock:
+            if self._loaded_at is not None:
+                age = time.monotonic() - self._loaded_at
+                if age < self._ttl:
+                    return self._value
+                if age < self._ttl + self._stale_ttl:
+                    if not self._refreshing:
+                        self._refreshing = True
+                        threading.Thread(
+                            target=self._refresh,
+                            args=(self._generation,),
+                            name='wyze-device-list-refresh',
+                            daemon=True).start()
+                    return self._value
+
+            # nothing usable is cached, so load while holding the lock; this
+            # collapses concurrent callers into a single network fetch
+            return self._load(self._generation)
+
+    def invalidate(self):
+        """
+        Drops the cached value so that the next ``get()`` reloads it.
+        """
+        with self._lock:
+            log.debug('invalidating the cached device list')
+            self._generation += 1
+            self._loaded_at = None
+
+    def refresh(self):
+        """
+        Reloads the value in the calling thread. Unlike ``invalidate()``,
+        the cached value is still served to other callers while loading,
+        and kept if loading fails.
+        """
+        with self._lock:
+            generation = self._generation
+        return self._load(generation)
+
+    def _load(self, generation):
+        value = self._loader()
+        with self._lock:
+            if generation == self._generation:
+                self._value = value
+                self._loaded_at = time.monotonic()
+        return value
+
+    def _refresh(self, generation):
+        try:
+            self._load(generation)
+        except Exception as e:
+            # keep serving the stale value; the next expired read will retry
+            log.warning('background device list refresh failed: %s', e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+class WyzeLRUCache(object):
+    """
+    A small thread-safe least-recently-used cache.
+    """
+
+    def __init__(self, maxsize=8):
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,6 +1,11 @@
 import datetime
 import logging
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from hashlib import md5
 from collections import OrderedDict
 import hmac
@@ -9,18 +14,57 @@ from abc import ABCMeta
 from abc import abstractmethod
 from abc import abstractproperty
 
-import requests
-
 from smartbridge.base.helpers import md5_string
+from smartbridge.base.helpers import to_bool
 from smartbridge.interfaces.exceptions import ProviderInternalException, ProviderConnectionException
+from .cache import WyzeDeviceListCache
 from .devices import DeviceModels
+from .registry import WyzeDeviceRegistry
+from .throttle import PRIORITY_COMMAND
+from .throttle import THROTTLED_STATUSES
+from .throttle import WyzeRateLimiter
+from .throttle import current_priority
+from .throttle import request_priority
+from .transport import create_transport
 
 log = logging.getLogger(__name__)
 
+# the number of connections kept alive per service unless configured
+DEFAULT_POOL_SIZE = 10
+
+
+def merge_property_lists(devices, response):
+    """
+    Returns copies of the devices with the per-device property lists from a
+    ``get_device_list_property_list`` response merged in, using the same
+    ``data.property_list`` shape that ``get_device_property_list`` returns.
+    """
+    property_lists = {}
+    if response and response.get('data') is not None:
+        for entry in response['data'].get('device_list') or []:
+            property_lists[entry.get('device_mac')] = entry.get(
+                'device_property_list', entry.get('property_list', []))
+
+    merged = []
+    for device in devices:
+        device = dict(device)
+        device['data'] = {
+            'property_list': property_lists.get(device['mac'], [])}
+        merged.append(device)
+    return merged
+
+
+def _with_priority(priority, function, args):
+    with request_priority(priority):
+        return function(*args)
+
 
 class WyzeClient(object):
     """
     Wyze client is the wrapper on top of Wyze endpoints
+
+    A single client and its service clients are safe to share between
+    threads; no per-request state is kept on the shared sessions.
     """
 
     def __init__(self, config={}):
@@ -34,79 +78,283 @@ class WyzeClient(object):
         self._auth_client = None
         self._api_client = None
         self._general_api_client = None
+        self._clients_lock = threading.Lock()
+
+        self._device_list_cache = WyzeDeviceListCache(
+            self._fetch_device_list,
+            ttl=float(config.get('device_list_ttl', 30)),
+            stale_ttl=float(config.get('device_list_stale_ttl', 30)))
+        self._property_list_chunk_size = int(
+            config.get('property_list_chunk_size', 50))
+
+        # independent sub-requests are fanned out over a shared thread pool
+        self._concurrent_requests = to_bool(
+            config.get('concurrent_requests', True))
+        self._max_workers = int(config.get('max_workers', 8))
+        self._request_timeout = float(config.get('request_timeout', 10))
+        self._executor = None
+        self._executor_lock = threading.Lock()
 
         log.debug("wyze user : %s", self._user_id)
 
     @property
     def auth_client(self):
         if not self._auth_client:
-            self._auth_client = WyzeAuthServiceClient(self._config)
+            with self._clients_lock:
+                if not self._auth_client:
+                    self._auth_client = WyzeAuthServiceClient(self._config)
         return self._auth_client
 
     @property
     def general_api_client(self):
         if not self._general_api_client:
-            self._general_api_client = WyzeGeneralApiClient(
-                self._config, self._access_token, self._user_id)
+            with self._clients_lock:
+                if not self._general_api_client:
+                    self._general_api_client = WyzeGeneralApiClient(
+                        self._config, self._access_token, self._user_id)
         return self._general_api_client
 
     @property
     def platform_client(self):
         if not self._platform_client:
-            self._platform_client = WyzePlatformServiceClient(
-                self._config, self._access_token)
+            with self._clients_lock:
+                if not self._platform_client:
+                    self._platform_client = WyzePlatformServiceClient(
+                        self._config, self._access_token)
         return self._platform_client
 
     @property
     def venus_client(self):
         if not self._venus_client:
-            self._venus_client = WyzeVenusServiceClient(
-                self._config, self._access_token)
+            with self._clients_lock:
+                if not self._venus_client:
+                    self._venus_client = WyzeVenusServiceClient(
+                        self._config, self._access_token)
         return self._venus_client
 
     @property
     def api_client(self):
         if not self._api_client:
-            self._api_client = WyzeApiClient(self._config, self._access_token)
+            with self._clients_lock:
+                if not self._api_client:
+                    self._api_client = WyzeApiClient(self._config, self._access_token)
         return self._api_client
 
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers,
+                    thread_name_prefix='wyze-client')
+            return self._executor
+
+    def _service_clients(self):
+        return [client for client in (
+            self._api_client,
+            self._venus_client,
+            self._platform_client,
+            self._auth_client,
+            self._general_api_client) if client]
+
+    def pool_stats(self):
+        """
+        Returns the connection pool metrics of every service client that has
+        been used, keyed by pool name.
+        :rtype: ``dict``
+        """
+        return {client.pool_name: client.pool_stats()
+                for client in self._service_clients()}
+
+    def rate_limiter_stats(self):
+        """
+        Returns the rate limiter metrics of every service client that has
+        been used, keyed by pool name.
+        :rtype: ``dict``
+        """
+        return {client.pool_name: client.rate_limiter.stats()
+                for client in self._service_clients()}
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        for client in self._service_clients():
+            client.close()
+
+    def _fan_out(self, calls):
+        """
+        Runs independent requests and returns their results by name.
+
+        In concurrent mode all of the requests are issued at once, each one
+        is given ``request_timeout`` seconds to complete, and a request that
+        fails or times out yields ``None`` instead of failing the others. The
+        first error is only raised if every request failed.
+        :type calls: ``dict``
+        :param calls: the ``(function, args)`` to call, keyed by name
+        """
+        if not self._concurrent_requests:
+            return {name: function(*args)
+                    for name, (function, args) in calls.items()}
+
+        # the requests are sent with the priority of the calling thread
+        priority = current_priority()
+        futures = {name: self.executor.submit(
+                       _with_priority, priority, function, args)
+                   for name, (function, args) in calls.items()}
+        deadline = time.monotonic() + self._request_timeout
+        results = {}
+        errors = []
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(
+                    timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                log.warning('%s request timed out after %ss',
+                            name, self._request_timeout)
+                future.cancel()
+                errors.append(ProviderConnectionException(
+                    '{0} request timed out'.format(name)))
+                results[name] = None
+            except Exception as e:
+                log.warning('%s request failed: %s', name, e)
+                errors.append(e)
+                results[name] = None
+
+        if errors and len(errors) == len(futures):
+            raise errors[0]
+
+        return results
+
     def login(self, username, password):
         return self.auth_client.login(username, password)
 
     def refresh_token(self):
-        return self.api_client.refresh_token()
+        response = self.api_client.refresh_token()
+
+        data = response.get('data') if response else None
+        if data and data.get('access_token'):
+            self.update_access_token(
+                data['access_token'], data.get('refresh_token'))
+
+        return response
+
+    def update_access_token(self, access_token, refresh_token=None):
+        """
+        Switches this client and all of its service clients to a new access
+        token, dropping the request signers derived from the old one.
+        """
+        self._access_token = access_token
+        if refresh_token is not None:
+            self._refresh_token = refresh_token
+        for client in self._service_clients():
+            # logins are always signed without an access token
+            if client is not self._auth_client:
+                client.update_access_token(access_token, refresh_token)
+
+    def _fetch_device_list(self):
+        # a new registry, so that a load outdated by an invalidation, which
+        # the cache drops, never changes the registry other callers read
+        previous = self._device_list_cache.value or WyzeDeviceRegistry()
+        return previous.updated(
+            self.api_client.get_object_list()['data']['device_list'])
+
+    @property
+    def devices(self):
+        """
+        Returns the registry of account-wide devices. The registry is shared
+        by all of the typed ``list_*`` and ``get_*`` calls and is only
+        refetched once the configured ``device_list_ttl`` has expired or it
+        is invalidated.
+        :rtype: :class:`.WyzeDeviceRegistry`
+        """
+        return self._device_list_cache.get()
 
     def list_devices(self):
-        return self.api_client.get_object_list()['data']['device_list']
+        return self.devices.list()
+
+    def _get_device(self, device_mac, models):
+        device = self.devices.get(device_mac)
+        if device is None or device['product_model'] not in models:
+            return None
+        # copy the shared entry so that per-device data can be merged in
+        return dict(device)
+
+    def invalidate_device_list(self):
+        """
+        Forces the next device lookup to refetch the device list, e.g. after
+        a device property has been changed.
+        """
+        self._device_list_cache.invalidate()
+
+    def refresh_device_list(self):
+        """
+        Refetches the device list without discarding the cached one, which
+        other callers keep using until the new list has been loaded.
+        :rtype: :class:`.WyzeDeviceRegistry`
+        """
+        return self._device_list_cache.refresh()
+
+    def _list_devices(self, models, props=None):
+        devices = self.devices.list(models)
+        if props is None or len(devices) == 0:
+            return devices
+        return self.get_device_list_properties(devices, props)
+
+    def get_device_list_properties(self, devices, props):
+        """
+        Fetches the given properties for all of the devices in batches of
+        ``property_list_chunk_size`` and returns copies of the devices with
+        the results merged in the same shape as ``get_device_property_list``.
+        :rtype: ``list`` of ``dict``
+        """
+        chunk_size = self._property_list_chunk_size
+        merged = []
+        for start in range(0, len(devices), chunk_size):
+            chunk = devices[start:start + chunk_size]
+            response = self.api_client.get_device_list_property_list(
+                [device['mac'] for device in chunk], props)
+            merged.extend(merge_property_lists(chunk, response))
+
+        log.debug('fetched properties for %d devices in %d requests',
+                  len(devices), -(-len(devices) // chunk_size))
+
+        return merged
 
     def list_vacuums(self):
-        return [device for device in self.list_devices(
-        ) if device['product_model'] in DeviceModels.VACUUM]
+        return self._list_devices(DeviceModels.VACUUM)
 
     def get_vacuum(self, device_mac, props, device_info_props):
-        vacuums = [_vacuum for _vacuum in self.list_vacuums()
-                   if _vacuum['mac'] == device_mac]
-        if len(vacuums) == 0:
+        vacuum = self._get_device(device_mac, DeviceModels.VACUUM)
+        if vacuum is None:
             return None
 
-        vacuum = vacuums[0]
-
-        props = self.venus_client.get_iot_prop(device_mac, props)
+        venus_client = self.venus_client
+        results = self._fan_out({
+            'props': (venus_client.get_iot_prop, (device_mac, props)),
+            'device_info': (venus_client.get_device_info,
+                            (device_mac, device_info_props)),
+            'current_position': (venus_client.get_current_position,
+                                 (device_mac,)),
+            'current_map': (venus_client.get_current_map, (device_mac,)),
+        })
+
+        props = results['props']
         if (props and 'data' in props and props['data'] is not None):
             vacuum.update(props['data'])
 
-        device_info_props = self.venus_client.get_device_info(
-            device_mac, device_info_props)
+        device_info_props = results['device_info']
         if (
                 device_info_props and 'data' in device_info_props and device_info_props['data'] is not None):
             vacuum.update(device_info_props['data'])
 
-        current_position = self.venus_client.get_current_position(device_mac)
+        current_position = results['current_position']
         if (
                 current_position and 'data' in current_position and current_position['data'] is not None):
             vacuum['current_position'] = current_position['data']
 
-        current_map = self.venus_client.get_current_map(device_mac)
+        current_map = results['current_map']
         if (
                 current_map and 'data' in current_map and current_map['data'] is not None):
             vacuum['current_map'] = current_map['data']
@@ -116,6 +364,43 @@ class WyzeClient(object):
 
         return vacuum
 
+    @staticmethod
+    def _response_data(response):
+        if response and response.get('data') is not None:
+            return response['data']
+        return None
+
+    def get_vacuum_props(self, device_mac, props):
+        return self._response_data(
+            self.venus_client.get_iot_prop(device_mac, props))
+
+    def get_vacuum_position(self, device_mac):
+        return self._response_data(
+            self.venus_client.get_current_position(device_mac))
+
+    def get_vacuum_map(self, device_mac):
+        return self._response_data(
+            self.venus_client.get_current_map(device_mac))
+
+    def get_vacuum_sweep_records(self, device_mac, keys, last_time=None,
+                                 count=20):
+        """
+        Returns one page of sweep records, newest first, and the cursor to
+        pass as ``last_time`` for the next (older) page.
+        """
+        data = self._response_data(self.venus_client.get_sweep_records(
+            device_mac, keys, last_time, count))
+        if isinstance(data, dict):
+            records = data.get('data') or []
+            cursor = data.get('last_time')
+        else:
+            records = data or []
+            cursor = None
+        if cursor is None and records:
+            cursor = min(int(record.get('create_time') or 0)
+                         for record in records)
+        return records, cursor
+
     def set_vacuum_mode(self, device_mac, device_model, type, value):
         self.venus_client.set_iot_action(
             device_mac, device_model, 'set_mode', {
@@ -138,17 +423,14 @@ class WyzeClient(object):
     def create_user_vacuum_event(self, event_id, event_type):
         self._create_user_event(self.venus_client.app_id, event_id, event_type)
 
-    def list_plugs(self):
-        return [device for device in self.list_devices(
-        ) if device['product_model'] in DeviceModels.PLUG]
+    def list_plugs(self, props=None):
+        return self._list_devices(DeviceModels.PLUG, props)
 
     def get_plug(self, device_mac, props):
-        plugs = [_plug for _plug in self.list_plugs() if _plug['mac']
-                 == device_mac]
-        if len(plugs) == 0:
+        plug = self._get_device(device_mac, DeviceModels.PLUG)
+        if plug is None:
             return None
 
-        plug = plugs[0]
         plug.update(
             self.api_client.get_device_property_list(
                 plug['mac'],
@@ -164,17 +446,62 @@ class WyzeClient(object):
         self.api_client.set_device_property(
             device_mac, device_model, name, value)
 
-    def list_bulbs(self):
-        return [device for device in self.list_devices(
-        ) if device['product_model'] in DeviceModels.BULB]
+    def set_device_properties(self, commands, max_parallel=None):
+        """
+        Sets properties on many devices at once and returns the outcome per
+        device: ``None`` on success, or the exception that stopped it.
+
+        The properties of one device are set by a single task, in order.
+        Devices are processed concurrently on the client executor, with at
+        most ``max_parallel`` (``max_workers`` by default) in flight.
+        :type commands: ``dict``
+        :param commands: ``(model, [(pid, value), ...])`` keyed by device MAC
+        """
+        def _apply(mac, model, properties):
+            for pid, value in properties:
+                self.api_client.set_device_property(mac, model, pid, value)
+
+        results = {}
+        if not self._concurrent_requests:
+            for mac, (model, properties) in commands.items():
+                try:
+                    _apply(mac, model, properties)
+                    results[mac] = None
+                except Exception as e:
+                    results[mac] = e
+        else:
+            window = max(1, min(max_parallel or self._max_workers,
+                                self._max_workers))
+            pending = iter(commands.items())
+            in_flight = {}
+            while True:
+                for mac, (model, properties) in pending:
+                    in_flight[self.executor.submit(
+                        _apply, mac, model, properties)] = mac
+                    if len(in_flight) >= window:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    mac = in_flight.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        log.warning('setting properties on %s failed: %s',
+                                    mac, error)
+                    results[mac] = error
+
+        self.invalidate_device_list()
+        return results
+
+    def list_bulbs(self, props=None):
+        return self._list_devices(DeviceModels.BULB, props)
 
     def get_bulb(self, device_mac, props):
-        bulbs = [_bulb for _bulb in self.list_bulbs() if _bulb['mac']
-                 == device_mac]
-        if len(bulbs) == 0:
+        bulb = self._get_device(device_mac, DeviceModels.BULB)
+        if bulb is None:
             return None
 
-        bulb = bulbs[0]
         bulb.update(
             self.api_client.get_device_property_list(
                 bulb['mac'],
@@ -190,23 +517,17 @@ class WyzeClient(object):
         self.api_client.set_device_property(
             device_mac, device_model, name, value)
 
-    def _list_sensors(self, models):
-        return [device for device in self.list_devices(
-        ) if device['product_model'] in models]
+    def list_contact_sensors(self, props=None):
+        return self._list_devices(DeviceModels.CONTACT_SENSOR, props)
 
-    def list_contact_sensors(self):
-        return self._list_sensors(DeviceModels.CONTACT_SENSOR)
-
-    def list_motion_sensors(self):
-        return self._list_sensors(DeviceModels.MOTION_SENSOR)
+    def list_motion_sensors(self, props=None):
+        return self._list_devices(DeviceModels.MOTION_SENSOR, props)
     
-    def _get_sensor(self, device_mac, sensors):
-        _sensors = [_sensor for _sensor in sensors if _sensor['mac']
-                 == device_mac]
-        if len(_sensors) == 0:
+    def _get_sensor(self, device_mac, models):
+        _sensor = self._get_device(device_mac, models)
+        if _sensor is None:
             return None
-        
-        _sensor = _sensors[0]
+
         _sensor.update(
             self.api_client.get_device_info(
                 _sensor['mac'],
@@ -215,7 +536,7 @@ class WyzeClient(object):
         return _sensor
 
     def get_contact_sensor(self, device_mac):
-        contact_sensor = self._get_sensor(device_mac, self.list_contact_sensors())
+        contact_sensor = self._get_sensor(device_mac, DeviceModels.CONTACT_SENSOR)
 
         log.debug('returning contact sensor data')
         log.debug(contact_sensor)
@@ -223,7 +544,7 @@ class WyzeClient(object):
         return contact_sensor
 
     def get_motion_sensor(self, device_mac):
-        motion_sensor = self._get_sensor(device_mac, self.list_motion_sensors())
+        motion_sensor = self._get_sensor(device_mac, DeviceModels.MOTION_SENSOR)
 
         log.debug('returning motion sensor data')
         log.debug(motion_sensor)
@@ -244,7 +565,13 @@ class WyzeServiceClient(object):
         self._config = config
         self._access_token = access_token
         self._refresh_token = config.get('refresh_token')
-        self._session = None
+        self._transport = None
+        self._transport_lock = threading.Lock()
+        self._request_timeout = float(config.get('request_timeout', 10))
+        self._rate_limiter = None
+        # service error codes that mean the client is sending too much
+        self._throttled_codes = frozenset(
+            str(code) for code in config.get('throttled_codes') or ())
 
         log.debug("wyze service : %s", self.app_id)
 
@@ -264,6 +591,107 @@ class WyzeServiceClient(object):
     def endpoint_url(self):
         pass
 
+    @property
+    def base_url(self):
+        """
+        Returns the URL that requests to this service are sent to: the
+        ``endpoint_urls`` entry configured for its pool name (e.g. a local
+        stand-in server), or the public ``endpoint_url``.
+        :rtype: ``str``
+        """
+        return self._config.get('endpoint_urls', {}).get(
+            self.pool_name) or self.endpoint_url
+
+    @abstractproperty
+    def pool_name(self):
+        """
+        Returns the name of the connection pool used for this service, one of
+        ``api``, ``venus``, ``platform``, ``auth`` or ``general``.
+        :rtype: ``str``
+        """
+        pass
+
+    @property
+    def pool_size(self):
+        """
+        Returns the maximum number of connections that are kept alive for
+        this service, as configured by ``pool_sizes``.
+        :rtype: ``int``
+        """
+        return int(self._config.get('pool_sizes', {}).get(
+            self.pool_name, DEFAULT_POOL_SIZE))
+
+    @abstractproperty
+    def session_headers(self):
+        """
+        Returns the headers that are sent with every request to this service.
+        :rtype: ``dict``
+        """
+        pass
+
+    @property
+    def transport(self):
+        """
+        Returns the transport shared by all requests to this service, as
+        selected by the ``transport``, ``record_path`` and ``replay_path``
+        configuration values.
+        :rtype: :class:`.WyzeTransport`
+        """
+        if not self._transport:
+            with self._transport_lock:
+                if not self._transport:
+                    self._transport = create_transport(
+                        self._config, self.session_headers, self.pool_size,
+                        self._request_timeout)
+
+        return self._transport
+
+    @property
+    def rate_limiter(self):
+        """
+        Returns the rate limiter of this service, limited to the
+        ``rate_limits`` entry for its pool name, in requests per second.
+        :rtype: :class:`.WyzeRateLimiter`
+        """
+        if not self._rate_limiter:
+            with self._transport_lock:
+                if not self._rate_limiter:
+                    self._rate_limiter = WyzeRateLimiter(
+                        self._config.get('rate_limits', {}).get(
+                            self.pool_name),
+                        max_backoff=float(
+                            self._config.get('max_backoff', 60)))
+
+        return self._rate_limiter
+
+    @property
+    def session(self):
+        """
+        Returns the ``requests`` session of the transport, e.g. to mount
+        custom adapters, or ``None`` for the ``httpx`` and replay transports.
+        :rtype: :class:`requests.Session`
+        """
+        return self.transport.session
+
+    def pool_stats(self):
+        """
+        Returns usage metrics for the connection pools of this service, one
+        entry per connected host.
+        :rtype: ``list`` of ``dict``
+        """
+        if not self._transport:
+            return []
+        return self._transport.pool_stats()
+
+    def close(self):
+        """
+        Closes the pooled connections of this service.
+        """
+        with self._transport_lock:
+            if self._transport:
+                self._transport.close()
+                self._transport = None
+
     @property
     def phone_id(self):
         return self._config.get('phone_id')
@@ -272,135 +700,168 @@ class WyzeServiceClient(object):
     def app_id(self):
         return self._config.get('app_id')
 
-    def _do_request(
-            self,
-            session: requests.Session,
-            request: requests.Request):
+    def _do_request(self, method, url, headers, params=None, data=None):
+        log.trace('request')
+        log.trace(headers)
+
+        rate_limiter = self.rate_limiter
+        rate_limiter.acquire(current_priority())
+
+        log.debug('sending ' + method + ' request to ' + url)
+        response = self.transport.request(method, url, headers, params, data)
+
+        log.trace('response')
+        log.trace(response)
+
+        if response.status >= 400:
+            if response.status in THROTTLED_STATUSES:
+                rate_limiter.throttled()
+            raise ProviderConnectionException(
+                '{0} error for url: {1}'.format(response.status, url))
+
+        # Code here will only run if the request is successful
         try:
-            log.trace('request')
-            log.trace(request.headers)
-
-            settings = session.merge_environment_settings(
-                request.url, {}, None, None, None)
-
-            log.debug(
-                'sending ' +
-                request.method +
-                ' request to ' +
-                request.url)
-            response = session.send(request, **settings)
-
-            log.trace('response')
-            log.trace(response)
-
-            response.raise_for_status()
-
-            # Code here will only run if the request is successful
-            response_json = response.json()
-
-            log.trace('parsed response JSON')
-            log.trace(response_json)
-
-            if 'code' in response_json:
-                response_code = response_json['code']
-
-                if isinstance(response_code, int):
-                    response_code = str(response_code)
-
-                if response_code != '1' and 'msg' in response_json and response_json[
-                        'msg'] == 'AccessTokenError':
-                    log.warning(
-                        "The access token has expired. Please refresh the token and try again.")
-                    raise ProviderConnectionException(
-                        "Failed to login with response: {0}".format(response_json))
-                if response_code != '1' and 'msg' in response_json and response_json[
-                        'msg'] == "UserIsLocked":
-                    log.warning(
-                        "The user account is locked. Please resolve this issue and try again.")
-                    raise ProviderConnectionException(
-                        "Failed to login with response: {0}".format(response_json))
-                if response_code != '1' and 'msg' in response_json and response_json[
-                        'msg'] == "UserNameOrPasswordError":
-                    log.warning(
-                        "The username or password is incorrect. Please check your credentials and try again.")
-                    raise ProviderConnectionException(
-                        "Failed to login with response: {0}".format(response_json))
-                if response_code == '1001':
-                    log.error(
-                        "Request to: {} does not respond to parameters in payload {} and gave a result of {}".format(
-                            request.url, request.body, response_json))
-                    raise ProviderInternalException(
-                        "Parameters passed to Wyze Service do not fit the endpoint")
-                if response_code == '1003':
-                    # FIXME what do I mean?
-                    log.error(
-                        "Request to: {} does not respond to parameters in payload {} and gave a result of {}".format(
-                            request.url, request.body, response_json))
-                    raise ProviderInternalException(
-                        "Parameters passed to Wyze Service do not fit the endpoint")
-                if response_code == '1004':
-                    log.error(
-                        "Request to: {} does not have the correct signature2 of {} and gave a result of {}".format(
-                            request.url, request.headers.signature2, response_json))
-                    raise ProviderInternalException(
-                        "Parameters passed to Wyze Service do not fit the endpoint")
-                if response_code != '1':
-                    print(type(response_code))
-                    log.error(
-                        "Request to: {} failed with payload: {} with result of {}".format(
-                            request.url, request.body, response_json))
-                    raise ProviderInternalException(
-                        "Failed to connect to the Wyze Service")
-
-            return response_json
-        except requests.exceptions.RequestException as request_exception:
-            log.exception(request_exception)
-            raise ProviderConnectionException(request_exception)
-
-    def do_post(self, url: str, headers: dict, payload: dict):
-        with self.session as client:
-            if headers is not None:
-                # add the request-specific headers
-                log.trace(
-                    'merging request-specific headers into session headers')
-                client.headers.update(headers)
-
-            # we have to use a prepared request because the requests module
-            # doesn't allow us to specify the separators in our json dumping
-            # and the server expects no extra whitespace
-            req = client.prepare_request(
-                requests.Request(
-                    'POST', url, json=payload))
-
-            log.trace('unmodified prepared request')
-            log.trace(req)
-
-            if isinstance(payload, dict):
-                payload = json.dumps(payload, separators=(',', ':'))
-            if isinstance(payload, str):
-                req.body = payload.encode('utf-8')
-                req.prepare_content_length(req.body)
-
-            return self._do_request(client, req)
+            response_json = json.loads(response.content)
+        except ValueError as e:
+            raise ProviderConnectionException(e)
 
-    def do_get(self, url: str, headers: dict, payload: dict):
-        with self.session as client:
-            if headers is not None:
-                # add the request-specific headers
-                log.trace(
-                    'merging request-specific headers into session headers')
-                client.headers.update(headers)
+        log.trace('parsed response JSON')
+        log.trace(response_json)
+
+        if (isinstance(response_json, dict) and
+                str(response_json.get('code')) in self._throttled_codes):
+            # like HTTP 429, a throttled request is a connection error that
+            # may succeed if tried again later
+            rate_limiter.throttled()
+            raise ProviderConnectionException(
+                'Throttled by {0} with response: {1}'.format(
+                    url, response_json))
+        rate_limiter.succeeded()
 
-            req = client.prepare_request(
-                requests.Request(
-                    'GET', url, params=payload))
+        self._check_response(url, data, headers, response_json)
+
+        return response_json
+
+    def _check_response(self, url, body, headers, response_json):
+        """
+        Raises the matching exception if the Wyze service reported an error
+        in the parsed response.
+        """
+        if 'code' in response_json:
+            response_code = response_json['code']
+
+            if isinstance(response_code, int):
+                response_code = str(response_code)
+
+            if response_code != '1' and 'msg' in response_json and response_json[
+                    'msg'] == 'AccessTokenError':
+                log.warning(
+                    "The access token has expired. Please refresh the token and try again.")
+                raise ProviderConnectionException(
+                    "Failed to login with response: {0}".format(response_json))
+            if response_code != '1' and 'msg' in response_json and response_json[
+                    'msg'] == "UserIsLocked":
+                log.warning(
+                    "The user account is locked. Please resolve this issue and try again.")
+                raise ProviderConnectionException(
+                    "Failed to login with response: {0}".format(response_json))
+            if response_code != '1' and 'msg' in response_json and response_json[
+                    'msg'] == "UserNameOrPasswordError":
+                log.warning(
+                    "The username or password is incorrect. Please check your credentials and try again.")
+                raise ProviderConnectionException(
+                    "Failed to login with response: {0}".format(response_json))
+            if response_code == '1001':
+                log.error(
+                    "Request to: {} does not respond to parameters in payload {} and gave a result of {}".format(
+                        url, body, response_json))
+                raise ProviderInternalException(
+                    "Parameters passed to Wyze Service do not fit the endpoint")
+            if response_code == '1003':
+                # FIXME what do I mean?
+                log.error(
+                    "Request to: {} does not respond to parameters in payload {} and gave a result of {}".format(
+                        url, body, response_json))
+                raise ProviderInternalException(
+                    "Parameters passed to Wyze Service do not fit the endpoint")
+            if response_code == '1004':
+                log.error(
+                    "Request to: {} does not have the correct signature2 of {} and gave a result of {}".format(
+                        url, headers.get('signature2'), response_json))
+                raise ProviderInternalException(
+                    "Parameters passed to Wyze Service do not fit the endpoint")
+            if response_code != '1':
+                log.error(
+                    "Request to: {} failed with payload: {} with result of {}".format(
+                        url, body, response_json))
+                raise ProviderInternalException(
+                    "Failed to connect to the Wyze Service")
+
+    @staticmethod
+    def serialize(payload):
+        """
+        Encodes a request payload into the exact bytes that are sent (and, for
+        signed services, signed). The server expects json without any extra
+        whitespace, which is why the body is not left to ``requests``.
+        :rtype: ``bytes``
+        """
+        if isinstance(payload, dict):
+            payload = json.dumps(payload, separators=(',', ':'))
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        return payload
+
+    def do_post(self, url: str, headers: dict, payload):
+        # the payload may already have been serialized for signing; either
+        # way it is only encoded once. The request-specific headers are only
+        # sent with this request, never stored on the shared transport.
+        request_headers = {'content-type': 'application/json'}
+        if headers is not None:
+            request_headers.update(headers)
+
+        return self._do_request(
+            'POST', url, request_headers, data=self.serialize(payload))
+
+    def do_get(self, url: str, headers: dict, payload: dict):
+        return self._do_request('GET', url, headers, params=payload)
 
-            return self._do_request(client, req)
+    def update_access_token(self, access_token, refresh_token=None):
+        """
+        Switches this client to a new access token, e.g. after a refresh.
+        """
+        self._access_token = access_token
+        if refresh_token is not None:
+            self._refresh_token = refresh_token
 
     def _nonce(self):
         return str(round(time.time() * 1000))
 
 
+class WyzeRequestSigner(object):
+    """
+    Signs request bodies for one access token and app id.
+
+    Signers hold a key derived from the access token, so they are kept by
+    the service client using them and dropped when the token is refreshed.
+
+    The HMAC key is derived once and kept in a prepared ``hmac`` object, so
+    signing a request only costs a ``copy()`` and the digest of the message.
+    """
+
+    def __init__(self, access_token, salt):
+        _signing_key = md5(
+            ((access_token if access_token is not None else '') + salt).encode('utf-8')).hexdigest()
+        self._hmac = hmac.new(_signing_key.encode('utf-8'), digestmod=md5)
+
+    def sign(self, message):
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+
+        signature = self._hmac.copy()
+        signature.update(message)
+        return signature.hexdigest()
+
+
 class WyzeWpkNetServiceClient(WyzeServiceClient):
     """
     Wyze wpk net service client is the wrapper to newer Wyze services like WpkWyzeSignatureService and WpkWyzeExService
@@ -414,16 +875,21 @@ class WyzeWpkNetServiceClient(WyzeServiceClient):
 
     def __init__(self, config, access_token=None):
         super(WyzeWpkNetServiceClient, self).__init__(config, access_token)
+        self._signer = None
 
-    @abstractproperty
-    def session(self):
-        """
-        Returns the provider instance associated with this resource.
-        Intended for use by subclasses only.
-        :rtype: :class:`.CloudProvider`
-        :return: a CloudProvider object
-        """
-        pass
+    @property
+    def signer(self):
+        signer = self._signer
+        if signer is None:
+            signer = self._signer = WyzeRequestSigner(
+                self._access_token, WyzeWpkNetServiceClient.SALTS[self.app_id])
+        return signer
+
+    def update_access_token(self, access_token, refresh_token=None):
+        super(WyzeWpkNetServiceClient, self).update_access_token(
+            access_token, refresh_token)
+        # the signing key is derived from the access token
+        self._signer = None
 
     def get_from_server(self, url, payload={}):
         # create the time-based nonce and add it to the payload
@@ -449,7 +915,8 @@ class WyzeWpkNetServiceClient(WyzeServiceClient):
         # this must be done here so that it will be included in the signing
         payload['nonce'] = nonce
 
-        request_data = json.dumps(payload, separators=(',', ':'))
+        # the body is signed and sent as the very same bytes
+        request_data = self.serialize(payload)
 
         headers = {
             'access_token': self._access_token,
@@ -465,16 +932,11 @@ class WyzeWpkNetServiceClient(WyzeServiceClient):
     def request_id(self, nonce=None):
         if nonce is None:
             nonce = self._nonce()
-        return md5_string(md5_string(nonce))
+        # the nonce and its digest are plain ascii, so skip the utf-8 helpers
+        return md5(md5(nonce.encode('ascii')).hexdigest().encode('ascii')).hexdigest()
 
     def dynamic_signature(self, message=''):
-        _signing_key = md5_string(
-            (self._access_token if self._access_token is not None else '') + WyzeWpkNetServiceClient.SALTS[self.app_id])
-
-        return hmac.new(
-            _signing_key.encode('utf-8'),
-            msg=message.encode('utf-8'),
-            digestmod=md5).hexdigest()
+        return self.signer.sign(message)
 
 
 class WyzeExServiceClient(WyzeWpkNetServiceClient):
@@ -512,18 +974,18 @@ class WyzeVenusServiceClient(WyzeSignatureServiceClient):
         return 'venp_4c30f812828de875'
 
     @property
-    def session(self):
-        if not self._session:
-            self._session = requests.Session()
-            self._session.headers.update({
-                'accept-encoding': 'gzip',
-                'user-agent': 'okhttp/4.7.2',
-                'appid': self.app_id,
-                'appinfo': 'wyze_android_2.16.55',
-                'phoneid': self.phone_id,
-            })
+    def session_headers(self):
+        return {
+            'accept-encoding': 'gzip',
+            'user-agent': 'okhttp/4.7.2',
+            'appid': self.app_id,
+            'appinfo': 'wyze_android_2.16.55',
+            'phoneid': self.phone_id,
+        }
 
-        return self._session
+    @property
+    def pool_name(self):
+        return 'venus'
 
     @property
     def endpoint_url(self):
@@ -531,7 +993,7 @@ class WyzeVenusServiceClient(WyzeSignatureServiceClient):
 
     def get_current_position(self, did):
         return self.get_from_server(
-            self.endpoint_url +
+            self.base_url +
             '/plugin/venus/memory_map/current_position',
             payload={
                 'did': did,
@@ -539,27 +1001,33 @@ class WyzeVenusServiceClient(WyzeSignatureServiceClient):
 
     def get_current_map(self, did):
         return self.get_from_server(
-            self.endpoint_url +
+            self.base_url +
             '/plugin/venus/memory_map/current_map',
             payload={
                 'did': did,
             })
 
-    def get_sweep_records(self, did, keys):
+    def get_sweep_records(self, did, keys, last_time=None, count=20):
+        """
+        Returns up to ``count`` sweep records created before ``last_time``
+        (in milliseconds since the epoch, now by default), newest first.
+        """
+        if last_time is None:
+            last_time = int(time.time() * 1000)
         return self.get_from_server(
-            self.endpoint_url +
+            self.base_url +
             '/plugin/venus/sweep_record/query_data',
             payload={
                 'purpose': 'history_map',
-                'last_time': 1614006488650,
-                'count': 20,
+                'last_time': str(last_time),
+                'count': str(count),
                 'did': did,
                 'keys': ','.join(keys),
             })
 
     def get_iot_prop(self, did, keys):
         return self.get_from_server(
-            self.endpoint_url +
+            self.base_url +
             '/plugin/venus/get_iot_prop',
             payload={
                 'did': did,
@@ -568,7 +1036,7 @@ class WyzeVenusServiceClient(WyzeSignatureServiceClient):
 
     def get_device_info(self, did, keys):
         return self.get_from_server(
-            self.endpoint_url +
+            self.base_url +
             '/plugin/venus/device_info',
             payload={
                 'device_id': did,
@@ -576,16 +1044,17 @@ class WyzeVenusServiceClient(WyzeSignatureServiceClient):
             })
 
     def set_iot_action(self, did, model, cmd, params, is_sub_device=False):
-        return self.post_to_server(
-            self.endpoint_url +
-            '/plugin/venus/set_iot_action',
-            payload={
-                'cmd': cmd,
-                'did': did,
-                'model': model,
-                'is_sub_device': is_sub_device,
-                'params': params,
-            })
+        with request_priority(PRIORITY_COMMAND):
+            return self.post_to_server(
+                self.base_url +
+                '/plugin/venus/set_iot_action',
+                payload={
+                    'cmd': cmd,
+                    'did': did,
+                    'model': model,
+                    'is_sub_device': is_sub_device,
+                    'params': params,
+                })
 
     def sweep_room(self, did, rooms=[]):
         """
@@ -595,15 +1064,16 @@ class WyzeVenusServiceClient(WyzeSignatureServiceClient):
 
         Ref: com.wyze.sweeprobot.model.request.VenusSweepByRoomRequest
         """
-        return self.post_to_server(
-            self.endpoint_url +
-            '/plugin/venus/sweeping',
-            payload={
-                'did': did,
-                'rooms_id': rooms,
-                'type': 1,
-                'value': 1,
-            })
+        with request_priority(PRIORITY_COMMAND):
+            return self.post_to_server(
+                self.base_url +
+                '/plugin/venus/sweeping',
+                payload={
+                    'did': did,
+                    'rooms_id': rooms,
+                    'type': 1,
+                    'value': 1,
+                })
 
 
 class WyzePlatformServiceClient(WyzeExServiceClient):
@@ -617,18 +1087,18 @@ class WyzePlatformServiceClient(WyzeExServiceClient):
                 self.app_id == other.app_id)
 
     @property
-    def session(self):
-        if not self._session:
-            self._session = requests.Session()
-            self._session.headers.update({
-                'accept-encoding': 'gzip',
-                'user-agent': 'okhttp/4.7.2',
-                'appid': self.app_id,
-                'appinfo': 'wyze_android_2.16.55',
-                'phoneid': self.phone_id,
-            })
+    def session_headers(self):
+        return {
+            'accept-encoding': 'gzip',
+            'user-agent': 'okhttp/4.7.2',
+            'appid': self.app_id,
+            'appinfo': 'wyze_android_2.16.55',
+            'phoneid': self.phone_id,
+        }
 
-        return self._session
+    @property
+    def pool_name(self):
+        return 'platform'
 
     @property
     def endpoint_url(self):
@@ -636,7 +1106,7 @@ class WyzePlatformServiceClient(WyzeExServiceClient):
 
     def get_variable(self, keys):
         return self.get_from_server(
-            self.endpoint_url +
+            self.base_url +
             '/app/v2/platform/get_variable',
             payload={
                 'keys': ','.join(keys),
@@ -645,7 +1115,7 @@ class WyzePlatformServiceClient(WyzeExServiceClient):
 
     def get_user_profile(self):
         return self.get_from_server(
-            self.endpoint_url +
+            self.base_url +
             '/app/v2/platform/get_user_profile')
 
 
@@ -661,24 +1131,24 @@ class WyzeAuthServiceClient(WyzeExServiceClient):
                 # pylint:disable=protected-access
                 self.app_id == other.app_id)
 
+    @property
+    def pool_name(self):
+        return 'auth'
+
     @property
     def endpoint_url(self):
         return 'https://auth-prod.api.wyze.com'
 
     @property
-    def session(self):
-        if not self._session:
-            self._session = requests.Session()
-            self._session.headers.update({
-                'accept-encoding': 'gzip',
-                'phone-id': self.phone_id,
-                'x-api-key': WyzeAuthServiceClient.X_API_KEY,
-                'user-agent': 'wyze_android_2.16.55',
-                'appinfo': 'wyze_android_2.16.55',
-                'appid': self.app_id,
-            })
-
-        return self._session
+    def session_headers(self):
+        return {
+            'accept-encoding': 'gzip',
+            'phone-id': self.phone_id,
+            'x-api-key': WyzeAuthServiceClient.X_API_KEY,
+            'user-agent': 'wyze_android_2.16.55',
+            'appinfo': 'wyze_android_2.16.55',
+            'appid': self.app_id,
+        }
 
     def login(self, email='', password=''):
         _nonce = self._nonce()
@@ -689,17 +1159,18 @@ class WyzeAuthServiceClient(WyzeExServiceClient):
             'password': md5_string(md5_string(md5_string(password)))
         }
 
-        with self.session as client:
-            client.headers.update({
-                'requestid': self.request_id(),
-                'signature2': self.dynamic_signature(json.dumps(payload, separators=(',', ':')))
-            })
+        request_data = self.serialize(payload)
 
-            return self.do_post(
-                self.endpoint_url +
-                '/user/login',
-                None,
-                payload)
+        headers = {
+            'requestid': self.request_id(),
+            'signature2': self.dynamic_signature(request_data)
+        }
+
+        return self.do_post(
+            self.base_url +
+            '/user/login',
+            headers,
+            request_data)
 
 
 class WyzeGeneralApiClient(WyzeServiceClient):
@@ -724,32 +1195,30 @@ class WyzeGeneralApiClient(WyzeServiceClient):
     def sdk_type(self):
         return '100'
 
+    @property
+    def pool_name(self):
+        return 'general'
+
     @property
     def endpoint_url(self):
         return 'https://wyze-general-api.wyzecam.com'
 
     @property
-    def session(self):
-        if not self._session:
-            self._session = requests.Session()
-            self._session.headers.update({
-                'accept-encoding': 'gzip',
-                'user-agent': 'okhttp/4.7.2',
-                'wyzesdktype': self.sdk_type,
-                'wyzesdkversion': self.sdk_version,
-            })
-
-        return self._session
+    def session_headers(self):
+        return {
+            'accept-encoding': 'gzip',
+            'user-agent': 'okhttp/4.7.2',
+            'wyzesdktype': self.sdk_type,
+            'wyzesdkversion': self.sdk_version,
+        }
 
     def post_to_server(self, url, api_key, payload={}):
-        with self.session as client:
-
-            payload['apiKey'] = api_key
-            payload['appId'] = self.app_id
-            payload['appVersion'] = self.app_version
-            payload['deviceId'] = self.phone_id
+        payload['apiKey'] = api_key
+        payload['appId'] = self.app_id
+        payload['appVersion'] = self.app_version
+        payload['deviceId'] = self.phone_id
 
-            return self.do_post(url, None, payload)
+        return self.do_post(url, None, payload)
 
     def post_user_event(self, pid, event_id, event_type):
         # create the time-based nonce and add it to the payload
@@ -768,7 +1237,7 @@ class WyzeGeneralApiClient(WyzeServiceClient):
         }
 
         return self.post_to_server(
-            self.endpoint_url + '/v1/user/event', '', payload)
+            self.base_url + '/v1/user/event', '', payload)
 
 
 class WyzeApiClient(WyzeServiceClient):
@@ -794,39 +1263,38 @@ class WyzeApiClient(WyzeServiceClient):
     def app_ver(self):
         return self.app_name + '___' + self.app_version
 
+    @property
+    def pool_name(self):
+        return 'api'
+
     @property
     def endpoint_url(self):
         return 'https://api.wyzecam.com'
 
     @property
-    def session(self):
-        if not self._session:
-            self._session = requests.Session()
-            self._session.headers.update({
-                'accept-encoding': 'gzip',
-                'user-agent': 'okhttp/4.7.2',
-                'connection': 'keep-alive',
-            })
-
-        return self._session
+    def session_headers(self):
+        return {
+            'accept-encoding': 'gzip',
+            'user-agent': 'okhttp/4.7.2',
+            'connection': 'keep-alive',
+        }
 
     def post_to_server(self, url, payload={}):
-        with self.session as client:
-            payload['access_token'] = self._access_token
-            payload['app_name'] = self.app_name
-            payload['app_ver'] = self.app_ver
-            payload['app_version'] = self.app_version
-            payload['phone_id'] = self.phone_id
-            payload['sc'] = WyzeApiClient.SC
-            # create the time-based nonce and add it to the payload
-            payload['ts'] = str(int(time.time()))
-            return self.do_post(url, None, payload)
+        payload['access_token'] = self._access_token
+        payload['app_name'] = self.app_name
+        payload['app_ver'] = self.app_ver
+        payload['app_version'] = self.app_version
+        payload['phone_id'] = self.phone_id
+        payload['sc'] = WyzeApiClient.SC
+        # create the time-based nonce and add it to the payload
+        payload['ts'] = str(int(time.time()))
+        return self.do_post(url, None, payload)
 
     def refresh_token(self):
         SV_REFRESH_TOKEN = 'd91914dd28b7492ab9dd17f7707d35a3'
 
         return self.post_to_server(
-            self.endpoint_url +
+            self.base_url +
             '/app/user/refresh_token',
             {
                 'refresh_token': self._refresh_token,
@@ -835,21 +1303,22 @@ class WyzeApiClient(WyzeServiceClient):
     def set_device_property(self, mac, model, pid, value):
         SV_SET_DEVICE_PROPERTY = '44b6d5640c4d4978baba65c8ab9a6d6e'
 
-        return self.post_to_server(
-            self.endpoint_url +
-            '/app/v2/device/set_property',
-            {
-                'device_mac': mac,
-                'device_model': model,
-                'pid': pid,
-                'pvalue': str(value),
-                'sv': SV_SET_DEVICE_PROPERTY})
+        with request_priority(PRIORITY_COMMAND):
+            return self.post_to_server(
+                self.base_url +
+                '/app/v2/device/set_property',
+                {
+                    'device_mac': mac,
+                    'device_model': model,
+                    'pid': pid,
+                    'pvalue': str(value),
+                    'sv': SV_SET_DEVICE_PROPERTY})
 
     def get_device_list_property_list(self, devices=[], target_pids=[]):
         SV_GET_DEVICE_LIST_PROPERTY_LIST = 'be9e90755d3445d0a4a583c8314972b6'
 
         return self.post_to_server(
-            self.endpoint_url +
+            self.base_url +
             '/app/v2/device_list/get_property_list',
             {
                 'device_list': devices,
@@ -860,7 +1329,7 @@ class WyzeApiClient(WyzeServiceClient):
         SV_GET_DEVICE_PROPERTY_LIST = '1df2807c63254e16a06213323fe8dec8'
 
         return self.post_to_server(
-            self.endpoint_url +
+            self.base_url +
             '/app/v2/device/get_property_list',
             {
                 'device_mac': mac,
@@ -872,7 +1341,7 @@ class WyzeApiClient(WyzeServiceClient):
         SV_GET_DEVICE_INFO = '81d1abc794ba45a39fdd21233d621e84'
 
         return self.post_to_server(
-            self.endpoint_url +
+            self.base_url +
             '/app/v2/device/get_device_Info',
             {
                 'device_mac': mac,
@@ -883,4 +1352,4 @@ class WyzeApiClient(WyzeServiceClient):
         SV_GET_DEVICE_LIST = 'c417b62d72ee44bf933054bdca183e77'
 
         return self.post_to_server(
-            self.endpoint_url + '/app/v2/home_page/get_object_list', {'sv': SV_GET_DEVICE_LIST})
+            self.base_url + '/app/v2/home_page/get_object_list', {'sv': SV_GET_DEVICE_LIST})
@@ -4,7 +4,9 @@ DataTypes used by this provider
 
 from abc import abstractmethod
 import base64
+import copy
 import logging
+from types import MappingProxyType
 
 from smartbridge.interfaces.devices import VacuumMode
 from smartbridge.interfaces.devices import VacuumSuction
@@ -18,6 +20,7 @@ from smartbridge.base.devices import BaseVacuum
 from smartbridge.base.devices import BaseSensor
 from smartbridge.base.devices import BaseMotionSensor
 from smartbridge.base.devices import BaseContactSensor
+from .cache import WyzeLRUCache
 from enum import Enum
 
 log = logging.getLogger(__name__)
@@ -27,12 +30,34 @@ class DeviceModels(object):
     """
     Defines the model-to-device type mapping for the Wyze service provider.
     """
-    BULB = ['WLPA19', 'WLPA19C']
-    LOCK = ['YD.LO1']
-    PLUG = ['WLPP1', 'WLPP1CFH']
-    CONTACT_SENSOR = ['DWS3U']
-    MOTION_SENSOR = ['PIR3U']
-    VACUUM = ['JA_RO2']
+    BULB = frozenset(['WLPA19', 'WLPA19C'])
+    LOCK = frozenset(['YD.LO1'])
+    PLUG = frozenset(['WLPP1', 'WLPP1CFH'])
+    CONTACT_SENSOR = frozenset(['DWS3U'])
+    MOTION_SENSOR = frozenset(['PIR3U'])
+    VACUUM = frozenset(['JA_RO2'])
+
+    @staticmethod
+    def device_type(model):
+        """
+        Returns the set of models (e.g. ``DeviceModels.BULB``) that the given
+        product model belongs to, or ``None`` for unsupported models.
+        """
+        return _DEVICE_TYPES_BY_MODEL.get(model)
+
+
+# reverse model-to-device type lookup, derived once from DeviceModels
+_DEVICE_TYPES_BY_MODEL = {
+    model: models
+    for models in (
+        DeviceModels.BULB,
+        DeviceModels.LOCK,
+        DeviceModels.PLUG,
+        DeviceModels.CONTACT_SENSOR,
+        DeviceModels.MOTION_SENSOR,
+        DeviceModels.VACUUM)
+    for model in models
+}
 
 
 class WyzeDevice(BaseDevice):
@@ -64,6 +89,41 @@ class WyzeDevice(BaseDevice):
     def _get_property(self, name, default=None):
         pass
 
+    def _property_index(self):
+        """
+        Returns the entries of ``data.property_list`` keyed by PID. The index
+        is built once per payload and rebuilt only when the property list is
+        replaced.
+        :rtype: ``dict``
+        """
+        property_list = self._device['data']['property_list']
+        if self.__dict__.get('_indexed_property_list') is not property_list:
+            self._property_entries = {
+                property['pid']: property for property in property_list}
+            self._indexed_property_list = property_list
+        return self._property_entries
+
+    def _get_indexed_property(self, name, default=None):
+        prop_def = self.props().get(name)
+        if prop_def is None:
+            return default
+        entry = self._property_index().get(prop_def[0])
+        return default if entry is None else entry['value']
+
+    def _set_indexed_property(self, name, value):
+        prop_def = self.props().get(name)
+        if prop_def is not None:
+            entry = self._property_index().get(prop_def[0])
+            if entry is not None:
+                entry['value'] = value
+
+
+def _reverse_pids(props):
+    """
+    Builds the reverse PID-to-name lookup for a ``props()`` table.
+    """
+    return MappingProxyType({prop[0]: name for name, prop in props.items()})
+
 
 class WyzeNetworkedDevice(WyzeDevice, BaseNetworkedDevice):
 
@@ -182,33 +242,36 @@ class WyzeBulb(WyzeSwitchableDevice, BaseBulb):
     def color_temp_pid():
         return WyzeBulb.props().get('color_temp')[0]
 
+    _props = MappingProxyType({
+        "switch_state": ("P3", "int"),
+        "available": ("P5", "int"),
+        "brightness": ("P1501", "int"),
+        "color_temp": ("P1502", "int"),
+        # "": ("P1503", ""), not used?
+        # "": ("P1505", ""), not used?
+        "away_mode": ("P1506", "str"),
+        "power_loss_recovery": ("P1509", "int"),
+    })
+    _pids = tuple(prop[0] for prop in _props.values())
+    _pid_names = _reverse_pids(_props)
+
     @staticmethod
     def props():
-        return {
-            "switch_state": ("P3", "int"),
-            "available": ("P5", "int"),
-            "brightness": ("P1501", "int"),
-            "color_temp": ("P1502", "int"),
-            # "": ("P1503", ""), not used?
-            # "": ("P1505", ""), not used?
-            "away_mode": ("P1506", "str"),
-            "power_loss_recovery": ("P1509", "int"),
-        }
+        return WyzeBulb._props
 
     @staticmethod
     def pids():
-        return [prop[0] for prop in WyzeBulb.props().values()]
+        return WyzeBulb._pids
+
+    @staticmethod
+    def pid_names():
+        return WyzeBulb._pid_names
 
     def _set_property(self, name, value):
         if name in self._device:
             self._device[name] = value
         elif 'data' in self._device and 'property_list' in self._device['data']:
-            if name in self._device['data']['property_list']:
-                self._device['data']['property_list'][name] = value
-            else:
-                prop_def = WyzeBulb.props().get(name)
-                if prop_def[0] in self._device['data']['property_list']:
-                    self._device['data']['property_list'][prop_def[0]] = value
+            self._set_indexed_property(name, value)
         elif 'device_params' in self._device and name in self._device['device_params']:
             if name in self._device['device_params']:
                 self._device['device_params'][name] = value
@@ -221,10 +284,7 @@ class WyzeBulb(WyzeSwitchableDevice, BaseBulb):
         if name in self._device:
             return self._device[name]
         elif 'data' in self._device and 'property_list' in self._device['data']:
-            for property in self._device['data']['property_list']:
-                prop_def = WyzeBulb.props().get(name)
-                if (prop_def[0] == property['pid']):
-                    return property['value']
+            return self._get_indexed_property(name, default)
         elif 'device_params' in self._device and name in self._device['device_params']:
             return self._device['device_params'][name]
 
@@ -242,25 +302,33 @@ class WyzePlug(WyzeSwitchableDevice, BasePlug):
     def switch_off_props():
         return { WyzePlug.props().get('switch_state')[0]: "0" }
 
+    _props = MappingProxyType({
+        "switch_state": ("P3", "int"),
+        "available": ("P5", "int"),
+        "status_light": ("P13", "int"),
+        "rssi": ("P1612", "str"),
+        "away_mode": ("P1614", "str"),
+    })
+    _pids = tuple(prop[0] for prop in _props.values())
+    _pid_names = _reverse_pids(_props)
+
     @staticmethod
     def props():
-        return {
-            "switch_state": ("P3", "int"),
-            "available": ("P5", "int"),
-            "status_light": ("P13", "int"),
-            "rssi": ("P1612", "str"),
-            "away_mode": ("P1614", "str"),
-        }
+        return WyzePlug._props
 
     @staticmethod
     def pids():
-        return [prop[0] for prop in WyzePlug.props().values()]
+        return WyzePlug._pids
+
+    @staticmethod
+    def pid_names():
+        return WyzePlug._pid_names
 
     def _set_property(self, name, value):
         if name in self._device:
             self._device[name] = value
-        elif 'data' in self._device and 'property_list' in self._device['data'] and name in self._device['data']['property_list']:
-            self._device['data']['property_list'][name] = value
+        elif 'data' in self._device and 'property_list' in self._device['data']:
+            self._set_indexed_property(name, value)
         elif 'device_params' in self._device and name in self._device['device_params']:
             self._device['device_params'][name] = value
 
@@ -268,16 +336,17 @@ class WyzePlug(WyzeSwitchableDevice, BasePlug):
         if name in self._device:
             return self._device[name]
         elif 'data' in self._device and 'property_list' in self._device['data']:
-            for property in self._device['data']['property_list']:
-                prop_def = WyzePlug.props().get(name)
-                if (prop_def[0] == property['pid']):
-                    return property['value']
+            return self._get_indexed_property(name, default)
         elif 'device_params' in self._device and name in self._device['device_params']:
             return self._device['device_params'][name]
 
         return default
 
 
+# decoded vacuum maps, keyed by the digest of the map blob
+_decoded_maps = WyzeLRUCache(maxsize=8)
+
+
 class WyzeVacuumMapRoom(object):
 
     def __init__(self, *, id = None, name = None, clean_state = None, room_clean = None, **others: dict):
@@ -323,7 +392,8 @@ class WyzeVacuum(WyzeDevice, BaseVacuum):
     }
 
     """
-    The protobuf definition for a vacuum map
+    The protobuf definition for a vacuum map, decoded by
+    :func:`.decode_robot_map`
     """
     _robot_map_proto = {
       '1': {'type': 'int', 'name': 'mapType_'},
@@ -415,47 +485,92 @@ class WyzeVacuum(WyzeDevice, BaseVacuum):
         This method returns a dictionary of map data after parsing the
         protobuf using the above definition.
         The map from the Wyze API is a zip-compressed base64-encoded
-        blob of data, so we have to decode it, unzip it, then base64-
-        encode it for parsing. Pain in the ass.
+        blob of data, so we have to decode it and unzip it before parsing.
         :rtype: ``dict``
         :return: A dictionary of map properties
         """
+        decoded = self._decoded_map_entry()
+        if decoded is None:
+            return self._get_property('current_map', None)
+        if decoded[2] is None:
+            # built once per device, as it holds every path point
+            decoded[2] = decoded[1].to_dict()
+        return decoded[2]
+
+    def get_robot_map(self):
+        """
+        Returns the current map, decoded into typed objects. The map is
+        shared with other devices showing the same map and is read-only.
+        :rtype: :class:`.WyzeRobotMap`
+        """
+        decoded = self._decoded_map_entry()
+        return decoded[1] if decoded is not None else None
+
+    def _decoded_map_entry(self):
+        """
+        Returns ``[blob, robot map, current_map dict]`` for the map blob in
+        the payload, or ``None``. The payload keeps the blob; the decoded
+        map is remembered on the device for it.
+        """
         current_map = self._get_property('current_map', None)
-        if current_map is not None and 'map' in current_map:
-            if isinstance(current_map['map'], str):
-                current_map['map'] = self.parse_map(current_map['map'])
-            return current_map['map']
+        blob = current_map.get('map') if current_map else None
+        if not isinstance(blob, str):
+            return None
 
-        return current_map
+        decoded = self.__dict__.get('_decoded_map')
+        if decoded is None or decoded[0] is not blob:
+            decoded = self._decoded_map = [
+                blob, self.parse_robot_map(blob), None]
+        return decoded
 
     def parse_map(self, blob):
-        import base64
-        import binascii
-        import blackboxprotobuf
-        import json
-        import zlib
-
-        try:
-            compressed = base64.b64decode(blob)
-            if compressed is None:
-                raise InvalidValueException('current_map', '')
-
-            decompressed = zlib.decompress(compressed)
+        """
+        Decodes a map blob into a dictionary of native Python values.
+        :rtype: ``dict``
+        """
+        return self.parse_robot_map(blob).to_dict()
 
-            # add the protobuf definition to the known types
-            blackboxprotobuf.known_messages['robot_map'] = self._robot_map_proto
-            
-            # for some reason we have to re-encode and then re-decode the bytes
-            map, typedef = blackboxprotobuf.protobuf_to_json(base64.b64decode(base64.b64encode(decompressed)), 'robot_map')
+    @staticmethod
+    def parse_robot_map(blob):
+        """
+        Decodes a map blob into a :class:`.WyzeRobotMap`. Decoded maps are
+        cached by the digest of the blob, so an unchanged map is only parsed
+        once.
+        :rtype: :class:`.WyzeRobotMap`
+        """
+        import hashlib
+        from .robotmap import decode_robot_map_blob
+
+        if isinstance(blob, str):
+            blob = blob.encode('ascii')
+        digest = hashlib.blake2b(blob, digest_size=16).digest()
+        decoded = _decoded_maps.get(digest)
+        if decoded is None:
+            decoded = decode_robot_map_blob(blob)
+            _decoded_maps.put(digest, decoded)
+        return decoded
+
+    def get_occupancy_map(self):
+        """
+        Returns the current map as a :class:`.WyzeVacuumMap`, exposing its
+        grids as ``numpy`` arrays. Requires the ``maps`` extra. This is a
+        method rather than a property so that ``to_json()`` does not build
+        the map.
+        :rtype: :class:`.WyzeVacuumMap`
+        """
+        robot_map = self.get_robot_map()
+        if robot_map is None or robot_map.head is None:
+            return None
 
-            return json.loads(map)
-        except (binascii.Error, zlib.error):
-                raise InvalidValueException('current_map', '')
+        from .maps import WyzeVacuumMap
+        return WyzeVacuumMap(robot_map)
 
     @property
     def rooms(self):
-        if self.current_map is not None and '12' in self.current_map:
-            return [WyzeVacuumMapRoom(**room) for room in self.current_map['12']]
+        robot_map = self.get_robot_map()
+        if robot_map is not None and robot_map.rooms:
+            # the rooms of the shared map are copied for the caller
+            return [copy.copy(room) for room in robot_map.rooms]
 
     @property
     def suction_level(self):
@@ -506,23 +621,34 @@ class WyzeVacuum(WyzeDevice, BaseVacuum):
     def mode(self):
         return self._modes.get(self._get_property('mode'), VacuumMode.IDLE)
 
+    _props = MappingProxyType({
+        "iot_state": ("iot_state", "str"),
+        "battary": ("battery", "int"),
+        "mode": ("mode", "int"),
+        "chargeState": ("charge_state", "int"),
+        "cleanSize": ("clean_size", "int"),
+        "cleanTime": ("clean_time", "int"),
+        "fault_type": ("fault_type", "str"),
+        "fault_code": ("fault_code", "int"),
+        "current_mapid": ("current_mapid", "int"),
+        "count": ("count", "int"),
+        "cleanlevel": ("fan_speed", "int"),
+        "notice_save_map": ("notice_save_map", "bool"),
+        "memory_map_update_time": ("memory_map_update_time", "int"),
+    })
+    _pids = tuple(_props.keys())
+
+    _device_info_props = MappingProxyType({
+        "mac": ("mac", "str"),
+        "ipaddr": ("ip", "str"),
+        "device_type": ("device_type", "str"),
+        "mcu_sys_version": ("mcu_sys_version", "str"),
+    })
+    _device_info_pids = tuple(_device_info_props.keys())
+
     @staticmethod
     def props():
-        return {
-            "iot_state": ("iot_state", "str"),
-            "battary": ("battery", "int"),
-            "mode": ("mode", "int"),
-            "chargeState": ("charge_state", "int"),
-            "cleanSize": ("clean_size", "int"),
-            "cleanTime": ("clean_time", "int"),
-            "fault_type": ("fault_type", "str"),
-            "fault_code": ("fault_code", "int"),
-            "current_mapid": ("current_mapid", "int"),
-            "count": ("count", "int"),
-            "cleanlevel": ("fan_speed", "int"),
-            "notice_save_map": ("notice_save_map", "bool"),
-            "memory_map_update_time": ("memory_map_update_time", "int"),
-        }
+        return WyzeVacuum._props
 
     @staticmethod
     def clean_props():
@@ -545,20 +671,15 @@ class WyzeVacuum(WyzeDevice, BaseVacuum):
 
     @staticmethod
     def device_info_props():
-        return {
-            "mac": ("mac", "str"),
-            "ipaddr": ("ip", "str"),
-            "device_type": ("device_type", "str"),
-            "mcu_sys_version": ("mcu_sys_version", "str"),
-        }
+        return WyzeVacuum._device_info_props
 
     @staticmethod
     def device_info_pids():
-        return [pid for pid in WyzeVacuum.device_info_props().keys()]
+        return WyzeVacuum._device_info_pids
 
     @staticmethod
     def pids():
-        return [pid for pid in WyzeVacuum.props().keys()]
+        return WyzeVacuum._pids
 
     @property
     def ip(self):
@@ -578,20 +699,71 @@ class WyzeSensor(WyzeDevice, BaseSensor):
     def voltage(self):
         return self._get_property('voltage')
 
+    _props = MappingProxyType({
+        "notification": ("P1", "int"),
+        "available": ("P5", "int"),
+        # "": ("P6", ""),
+        # "": ("P1303", ""),
+        "rssi": ("P1304", "int"),
+        "voltage": ("P1329", "int"),
+    })
+    _pids = tuple(prop[0] for prop in _props.values())
+    _pid_names = _reverse_pids(_props)
+
     @staticmethod
     def props():
-        return {
-            "notification": ("P1", "int"),
-            "available": ("P5", "int"),
-            # "": ("P6", ""),
-            # "": ("P1303", ""),
-            "rssi": ("P1304", "int"),
-            "voltage": ("P1329", "int"),
-        }
+        return WyzeSensor._props
+
+    @staticmethod
+    def pids():
+        return WyzeSensor._pids
+
+    @staticmethod
+    def pid_names():
+        return WyzeSensor._pid_names
+
+    def _set_property(self, name, value):
+        if name in self._device:
+            self._device[name] = value
+        elif 'data' in self._device and 'property_list' in self._device['data']:
+            self._set_indexed_property(name, value)
+        elif 'device_params' in self._device and name in self._device['device_params']:
+            self._device['device_params'][name] = value
+
+    def _get_property(self, name, default=None):
+        if name in self._device:
+            return self._device[name]
+        elif 'data' in self._device and 'property_list' in self._device['data']:
+            return self._get_indexed_property(name, default)
+        elif 'device_params' in self._device and name in self._device['device_params']:
+            return self._device['device_params'][name]
+
+        return default
 
 
 class WyzeContactSensor(WyzeSensor, BaseContactSensor):
 
+    """
+    See: com.hualai.dws3u.device.WyzeEventSettingPage
+    """
+    _props = MappingProxyType(dict(WyzeSensor.props(), **{
+        "power_state": ("P3", "int"),
+        "open_close_state": ("P1301", "int"),
+        "open_notification": ("P1306", "int"), # "opens"
+        "close_notification": ("P1307", "int"), # "closes"
+        "open_notification_delay": ("P1308", "int"), # "left open"
+        "close_notification_delay": ("P1309", "int"), # "left closed"
+        "open_notification_time": ("P1310", ""),
+        "close_notification_time": ("P1311", ""),
+        # "": ("P1312", ""),
+        # "": ("P1321", ""),
+        # "": ("P1322", ""),
+        # "": ("P1323", ""),
+        # "": ("P1324", ""),
+    }))
+    _pids = tuple(prop[0] for prop in _props.values())
+    _pid_names = _reverse_pids(_props)
+
     def __init__(self, provider, sensor):
         super(WyzeContactSensor, self).__init__(provider, sensor)
 
@@ -601,43 +773,42 @@ class WyzeContactSensor(WyzeSensor, BaseContactSensor):
 
     @staticmethod
     def props():
-        """
-        See: com.hualai.dws3u.device.WyzeEventSettingPage
-        """
-        props = WyzeSensor.props()
-        props.update({
-            "power_state": ("P3", "int"),
-            "open_close_state": ("P1301", "int"),
-            "open_notification": ("P1306", "int"), # "opens"
-            "close_notification": ("P1307", "int"), # "closes"
-            "open_notification_delay": ("P1308", "int"), # "left open"
-            "close_notification_delay": ("P1309", "int"), # "left closed"
-            "open_notification_time": ("P1310", ""),
-            "close_notification_time": ("P1311", ""),
-            # "": ("P1312", ""),
-            # "": ("P1321", ""),
-            # "": ("P1322", ""),
-            # "": ("P1323", ""),
-            # "": ("P1324", ""),
-        })
-        return props
+        return WyzeContactSensor._props
 
-    def _get_property(self, name, default=None):
-        if name in self._device:
-            return self._device[name]
-        elif 'data' in self._device and 'property_list' in self._device['data']:
-            for property in self._device['data']['property_list']:
-                prop_def = WyzeContactSensor.props().get(name)
-                if (prop_def[0] == property['pid']):
-                    return property['value']
-        elif 'device_params' in self._device and name in self._device['device_params']:
-            return self._device['device_params'][name]
+    @staticmethod
+    def pids():
+        return WyzeContactSensor._pids
 
-        return default
+    @staticmethod
+    def pid_names():
+        return WyzeContactSensor._pid_names
 
 
 class WyzeMotionSensor(WyzeSensor, BaseMotionSensor):
 
+    """
+    See: com.hualai.pir3u.device.WyzeEventSettingPage
+    """
+    _props = MappingProxyType(dict(WyzeSensor.props(), **{
+        # "": ("P2", "int"),
+        "": ("P4", "int"),
+        # "": ("P1300", ""), not used
+        "motion_state": ("P1302", "int"),
+        "motion_notification": ("P1314", "int"), # "detects motion"
+        "clear_notification": ("P1315", "int"), # "becomes clear"
+        # "": ("P1316", "int"),
+        # "": ("P1317", "int"),
+        # "": ("P1318", "int"),
+        # "": ("P1319", "int"),
+        # "": ("P1320", "int"),
+        # "": ("P1325", "int"),
+        # "": ("P1326", "int"),
+        # "": ("P1327", "int"),
+        # "": ("P1328", "int"),
+    }))
+    _pids = tuple(prop[0] for prop in _props.values())
+    _pid_names = _reverse_pids(_props)
+
     def __init__(self, provider, sensor):
         super(WyzeMotionSensor, self).__init__(provider, sensor)
 
@@ -647,38 +818,12 @@ class WyzeMotionSensor(WyzeSensor, BaseMotionSensor):
 
     @staticmethod
     def props():
-        """
-        See: com.hualai.pir3u.device.WyzeEventSettingPage
-        """
-        props = WyzeSensor.props()
-        props.update({
-            "": ("P2", "int"),
-            "": ("P4", "int"),
-            # "": ("P1300", ""), not used
-            "motion_state": ("P1302", "int"),
-            "motion_notification": ("P1314", "int"), # "detects motion"
-            "clear_notification": ("P1315", "int"), # "becomes clear"
-            # "": ("P1316", "int"),
-            # "": ("P1317", "int"),
-            # "": ("P1318", "int"),
-            # "": ("P1319", "int"),
-            # "": ("P1320", "int"),
-            # "": ("P1325", "int"),
-            # "": ("P1326", "int"),
-            # "": ("P1327", "int"),
-            # "": ("P1328", "int"),
-        })
-        return props
+        return WyzeMotionSensor._props
 
-    def _get_property(self, name, default=None):
-        if name in self._device:
-            return self._device[name]
-        elif 'data' in self._device and 'property_list' in self._device['data']:
-            for property in self._device['data']['property_list']:
-                prop_def = WyzeMotionSensor.props().get(name)
-                if (prop_def[0] == property['pid']):
-                    return property['value']
-        elif 'device_params' in self._device and name in self._device['device_params']:
-            return self._device['device_params'][name]
+    @staticmethod
+    def pids():
+        return WyzeMotionSensor._pids
 
-        return default
+    @staticmethod
+    def pid_names():
+        return WyzeMotionSensor._pid_names
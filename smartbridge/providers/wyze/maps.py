@@ -0,0 +1,168 @@
+"""
+Structured, array-backed view of a decoded Wyze vacuum map.
+
+``numpy`` is only imported when a map is created, so it is only needed by
+users of this module (``pip install smartbridge[maps]``).
+"""
+import logging
+
+from smartbridge.interfaces.exceptions import InvalidValueException
+
+log = logging.getLogger(__name__)
+
+
+class WyzeVacuumMap(object):
+    """
+    Exposes the occupancy grid (``mapData_``) and the room matrix
+    (``roomMatrix_``) of a :class:`.WyzeRobotMap` as ``numpy`` arrays of shape
+    ``(size_y, size_x)``. The arrays are zero-copy, read-only views of the
+    decoded map bytes.
+
+    Grid cells are indexed as ``(row, column)``; world coordinates are in
+    meters, with ``origin`` the world position of the corner of cell
+    ``(0, 0)``.
+    """
+
+    def __init__(self, robot_map):
+        import numpy
+
+        self._np = numpy
+        self._map = robot_map
+        head = robot_map.head
+        self._size_x = int(head.size_x or 0)
+        self._size_y = int(head.size_y or 0)
+        self._min_x = float(head.min_x or 0.0)
+        self._min_y = float(head.min_y or 0.0)
+        self._max_x = float(head.max_x or 0.0)
+        self._max_y = float(head.max_y or 0.0)
+        self._resolution = float(head.resolution or 0.0)
+        self._grid = None
+        self._room_matrix = None
+
+    @property
+    def size_x(self):
+        return self._size_x
+
+    @property
+    def size_y(self):
+        return self._size_y
+
+    @property
+    def shape(self):
+        return (self._size_y, self._size_x)
+
+    @property
+    def resolution(self):
+        """
+        The edge length of a grid cell in meters.
+        :rtype: ``float``
+        """
+        return self._resolution
+
+    @property
+    def origin(self):
+        return (self._min_x, self._min_y)
+
+    @property
+    def bounds(self):
+        return (self._min_x, self._min_y, self._max_x, self._max_y)
+
+    def _as_grid(self, data, name):
+        if data is None:
+            return None
+        if len(data) != self._size_x * self._size_y:
+            raise InvalidValueException(name, len(data))
+        return self._np.frombuffer(data, dtype=self._np.uint8).reshape(
+            self.shape)
+
+    @property
+    def grid(self):
+        """
+        The raw occupancy value of every cell.
+        :rtype: ``numpy.ndarray`` of ``uint8``
+        """
+        if self._grid is None:
+            self._grid = self._as_grid(self._map.map_data, 'mapData_')
+        return self._grid
+
+    @property
+    def room_matrix(self):
+        """
+        The id of the room every cell belongs to, ``0`` outside of rooms.
+        :rtype: ``numpy.ndarray`` of ``uint8``
+        """
+        if self._room_matrix is None:
+            self._room_matrix = self._as_grid(
+                self._map.room_matrix, 'roomMatrix_')
+        return self._room_matrix
+
+    @property
+    def rooms(self):
+        return self._map.rooms
+
+    def room_mask(self, room_id):
+        """
+        Returns a boolean mask of the cells of the given room.
+        :rtype: ``numpy.ndarray`` of ``bool``
+        """
+        if self.room_matrix is None:
+            return None
+        return self.room_matrix == room_id
+
+    def room_masks(self):
+        """
+        Returns the boolean cell mask of every room on the map, by room id.
+        Rooms without an id are left out.
+        :rtype: ``dict``
+        """
+        return {room.id: self.room_mask(room.id) for room in self.rooms
+                if room.id is not None}
+
+    def room_areas(self):
+        """
+        Returns the floor area of every room on the map in square meters,
+        by room id. Rooms without an id are left out.
+        :rtype: ``dict``
+        """
+        if self.room_matrix is None:
+            return {}
+        counts = self._np.bincount(
+            self.room_matrix.ravel(), minlength=256)
+        cell_area = self._resolution * self._resolution
+        return {room.id: float(counts[room.id]) * cell_area
+                for room in self.rooms
+                if room.id is not None and 0 <= room.id < len(counts)}
+
+    def world_to_grid(self, x, y):
+        """
+        Converts world coordinates (scalars or arrays) to the ``(row,
+        column)`` indices of the cells containing them.
+        :rtype: ``tuple`` of ``numpy.ndarray``
+        """
+        np = self._np
+        columns = np.floor(
+            (np.asarray(x, dtype=float) - self._min_x) / self._resolution)
+        rows = np.floor(
+            (np.asarray(y, dtype=float) - self._min_y) / self._resolution)
+        return rows.astype(np.intp), columns.astype(np.intp)
+
+    def grid_to_world(self, rows, columns):
+        """
+        Converts cell indices (scalars or arrays) to the world coordinates
+        of the cell centers.
+        :rtype: ``tuple`` of ``numpy.ndarray``
+        """
+        np = self._np
+        x = self._min_x + (np.asarray(columns, dtype=float) + 0.5) * self._resolution
+        y = self._min_y + (np.asarray(rows, dtype=float) + 0.5) * self._resolution
+        return x, y
+
+    def contains(self, rows, columns):
+        """
+        Returns whether the given cell indices lie on the grid.
+        :rtype: ``numpy.ndarray`` of ``bool``
+        """
+        rows = self._np.asarray(rows)
+        columns = self._np.asarray(columns)
+        return ((rows >= 0) & (rows < self._size_y) &
+                (columns >= 0) & (columns < self._size_x))
@@ -1,14 +1,10 @@
 """Provider implementation based on wyze.com ReSTful API."""
 import logging
-import uuid
-
-import requests
+import threading
 
 from smartbridge.base import BaseProvider
 from smartbridge.base.helpers import get_env
 
-from .client import WyzeClient
-
 from .services import WyzeBulbService
 from .services import WyzePlugService
 from .services import WyzeVacuumService
@@ -35,8 +31,12 @@ class WyzeProvider(BaseProvider):
         self.app_version = self._get_config_value(
             'wyze_app_version', '2.16.55')
 
-        self.phone_id = self._get_config_value(
-            'wyze_phone_id', str(uuid.uuid4()))
+        self.phone_id = self._get_config_value('wyze_phone_id', None)
+        if not self.phone_id:
+            # uuid pulls in platform, so it is only imported when needed
+            import uuid
+
+            self.phone_id = str(uuid.uuid4())
         self.phone_system_type = self._get_config_value(
             'wyze_phone_system_type', 2)
 
@@ -51,6 +51,76 @@ class WyzeProvider(BaseProvider):
                 'wyze_access_token',
                 None)}
 
+        # how long the account-wide device list is shared between calls
+        self.device_list_ttl = self._get_config_value(
+            'wyze_device_list_ttl', 30)
+        self.device_list_stale_ttl = self._get_config_value(
+            'wyze_device_list_stale_ttl', 30)
+        # how many devices are batched into one property list request
+        self.property_list_chunk_size = self._get_config_value(
+            'wyze_property_list_chunk_size', 50)
+        # whether independent requests (e.g. the vacuum state) are issued in
+        # parallel, and how long each request may take
+        self.concurrent_requests = self._get_config_value(
+            'wyze_concurrent_requests', True)
+        self.max_workers = self._get_config_value('wyze_max_workers', 8)
+        self.request_timeout = self._get_config_value(
+            'wyze_request_timeout', 10)
+        # connections kept alive per service host, e.g. wyze_venus_pool_size
+        # overrides wyze_pool_size for the vacuum service
+        pool_size = self._get_config_value('wyze_pool_size', 10)
+        self.pool_sizes = {
+            name: self._get_config_value(
+                'wyze_{0}_pool_size'.format(name), pool_size)
+            for name in ('api', 'venus', 'platform', 'auth', 'general')}
+        # requests per second sent to each service host, e.g.
+        # wyze_venus_rate_limit overrides wyze_rate_limit for the vacuum
+        # service; unlimited unless configured. Requests are paused and the
+        # rate lowered when a service responds with HTTP 429 or 503, or with
+        # one of the wyze_throttled_codes (none by default, as the services
+        # report throttling with HTTP statuses). Without a rate limit,
+        # request priorities only matter while requests are paused.
+        rate_limit = self._get_config_value('wyze_rate_limit', None)
+        self.rate_limits = {
+            name: self._get_config_value(
+                'wyze_{0}_rate_limit'.format(name), rate_limit)
+            for name in ('api', 'venus', 'platform', 'auth', 'general')}
+        self.throttled_codes = self._get_config_value(
+            'wyze_throttled_codes', ())
+        if isinstance(self.throttled_codes, str):
+            self.throttled_codes = [
+                code.strip() for code in self.throttled_codes.split(',')
+                if code.strip()]
+        self.max_backoff = self._get_config_value('wyze_max_backoff', 60)
+        # alternative service hosts, e.g. wyze_venus_endpoint_url; services
+        # without one talk to the public Wyze endpoints
+        self.endpoint_urls = {
+            name: self._get_config_value(
+                'wyze_{0}_endpoint_url'.format(name), None)
+            for name in ('api', 'venus', 'platform', 'auth', 'general')}
+
+        # how requests are sent: wyze_transport is 'requests' or 'httpx'
+        # (HTTP/2), and exchanges can be recorded to, or replayed from, a file
+        self.transport = self._get_config_value('wyze_transport', 'requests')
+        self.record_path = self._get_config_value('wyze_record_path', None)
+        self.replay_path = self._get_config_value('wyze_replay_path', None)
+        self.replay_loop = self._get_config_value('wyze_replay_loop', False)
+
+        # how often a vacuum tracker polls the position, in seconds
+        self.vacuum_tracking_interval = self._get_config_value(
+            'wyze_vacuum_tracking_interval', 1.0)
+
+        # how often a device watcher polls the properties without an
+        # interval of their own, and the device list, in seconds
+        self.watch_interval = self._get_config_value(
+            'wyze_watch_interval', 30)
+        self.watch_device_list_interval = self._get_config_value(
+            'wyze_watch_device_list_interval', 300)
+
+        # where the cleaning history of vacuums is cached, if anywhere
+        self.sweep_record_cache_dir = self._get_config_value(
+            'wyze_sweep_record_cache_dir', None)
+
         self.client_cfg = {
             'use_ssl': self._get_config_value('wyze_is_secure', True),
             'verify': self._get_config_value('wyze_validate_certs', True)
@@ -59,6 +129,8 @@ class WyzeProvider(BaseProvider):
         # service connections, lazily initialized
         self._session = None
         self._wyze_client = None
+        self._async_wyze_client = None
+        self._client_lock = threading.Lock()
 
         # Initialize provider services
         self._bulb = WyzeBulbService(self)
@@ -67,36 +139,99 @@ class WyzeProvider(BaseProvider):
         self._contact_sensor = WyzeContactSensorService(self)
         self._motion_sensor = WyzeMotionSensorService(self)
 
+    def _client_config(self):
+        # create a dict with both optional and mandatory configuration
+        # values to pass to the client class, rather
+        # than passing the provider object and taking a dependency.
+        return {
+            'app_id': self.app_id,
+            'app_name': self.app_name,
+            'app_version': self.app_version,
+            'phone_id': self.phone_id,
+            'phone_system_type': self.phone_system_type,
+            'access_token': self.access_token,
+            'refresh_token': self.refresh_token,
+            'user_id': self.user_id,
+            'device_list_ttl': self.device_list_ttl,
+            'device_list_stale_ttl': self.device_list_stale_ttl,
+            'property_list_chunk_size': self.property_list_chunk_size,
+            'concurrent_requests': self.concurrent_requests,
+            'max_workers': self.max_workers,
+            'request_timeout': self.request_timeout,
+            'pool_sizes': self.pool_sizes,
+            'endpoint_urls': self.endpoint_urls,
+            'rate_limits': self.rate_limits,
+            'throttled_codes': self.throttled_codes,
+            'max_backoff': self.max_backoff,
+            'transport': self.transport,
+            'record_path': self.record_path,
+            'replay_path': self.replay_path,
+            'replay_loop': self.replay_loop,
+        }
+
     @property
     def wyze_client(self):
         if not self._wyze_client:
-            # create a dict with both optional and mandatory configuration
-            # values to pass to the client class, rather
-            # than passing the provider object and taking a dependency.
-            provider_config = {
-                'app_id': self.app_id,
-                'app_name': self.app_name,
-                'app_version': self.app_version,
-                'phone_id': self.phone_id,
-                'phone_system_type': self.phone_system_type,
-                'access_token': self.access_token,
-                'refresh_token': self.refresh_token,
-                'user_id': self.user_id,
-            }
-            self._wyze_client = WyzeClient(provider_config)
+            with self._client_lock:
+                if not self._wyze_client:
+                    from .client import WyzeClient
+
+                    self._wyze_client = WyzeClient(self._client_config())
 
         return self._wyze_client
 
+    @property
+    def async_wyze_client(self):
+        '''
+        The asyncio counterpart of ``wyze_client``, used by the ``async_*``
+        service methods. Requires the ``aiohttp`` package.
+        '''
+        if not self._async_wyze_client:
+            with self._client_lock:
+                if not self._async_wyze_client:
+                    from .aio import AsyncWyzeClient
+
+                    self._async_wyze_client = AsyncWyzeClient(
+                        self._client_config())
+
+        return self._async_wyze_client
+
     @property
     def session(self):
         '''Get a low-level session object or create one if needed'''
         if not self._session:
+            import requests
+
             if self.config.debug_mode:
                 requests.set_stream_logger(level=log.DEBUG)
             self._session = requests.Session()
 
         return self._session
 
+    def close(self):
+        '''
+        Closes the connections of ``wyze_client``. The aiohttp sessions of
+        ``async_wyze_client`` belong to an event loop and are closed with
+        ``await provider.async_close()`` instead.
+        '''
+        with self._client_lock:
+            if self._wyze_client:
+                self._wyze_client.close()
+                self._wyze_client = None
+        if self._session:
+            self._session.close()
+            self._session = None
+
+    async def async_close(self):
+        '''
+        Closes the aiohttp sessions of ``async_wyze_client``, if it was used.
+        '''
+        with self._client_lock:
+            async_wyze_client = self._async_wyze_client
+            self._async_wyze_client = None
+        if async_wyze_client:
+            await async_wyze_client.close()
+
     @property
     def plug(self):
         return self._plug
@@ -116,3 +251,24 @@ class WyzeProvider(BaseProvider):
     @property
     def motion_sensor(self):
         return self._motion_sensor
+
+    def watch(self, callback=None, intervals=None):
+        '''
+        Starts watching the bulbs, plugs and sensors of the account.
+        ``callback``, if given, receives a :class:`.WyzeDeviceChange` with
+        the changed properties of a device whenever a poll finds any.
+        ``intervals`` overrides the seconds between polls of individual
+        properties, e.g. ``{'rssi': 600}``. Call ``stop()`` on the returned
+        watcher (or use it as a context manager) to stop polling.
+        :rtype: :class:`.WyzeDeviceWatcher`
+        '''
+        from .watch import WyzeDeviceWatcher
+
+        watcher = WyzeDeviceWatcher(
+            self.wyze_client,
+            interval=float(self.watch_interval),
+            intervals=intervals,
+            device_list_interval=float(self.watch_device_list_interval))
+        if callback is not None:
+            watcher.subscribe(callback)
+        return watcher.start()
@@ -0,0 +1,187 @@
+"""
+Vacuum cleaning history (sweep records) and its on-disk cache
+"""
+import json
+import logging
+import os
+import re
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class WyzeSweepRecord(object):
+    """
+    One cleaning run of a vacuum. The history map embedded in the record is
+    only decoded when ``robot_map`` is first accessed.
+    """
+
+    def __init__(self, record):
+        self._record = record
+        self._robot_map = None
+
+    @staticmethod
+    def keys():
+        """
+        The record fields requested from the sweep record service.
+        """
+        return ['record_id', 'create_time', 'clean_time', 'clean_size',
+                'clean_type', 'map']
+
+    @property
+    def raw(self):
+        return self._record
+
+    def __getitem__(self, name):
+        return self._record[name]
+
+    def get(self, name, default=None):
+        return self._record.get(name, default)
+
+    @property
+    def id(self):
+        return self._record.get('record_id')
+
+    @property
+    def create_time(self):
+        """
+        When the run started, in milliseconds since the epoch.
+        :rtype: ``int``
+        """
+        return int(self._record.get('create_time') or 0)
+
+    @property
+    def clean_time(self):
+        return self._record.get('clean_time')
+
+    @property
+    def clean_size(self):
+        return self._record.get('clean_size')
+
+    @property
+    def robot_map(self):
+        """
+        The history map of the run, decoded on first access.
+        :rtype: :class:`.WyzeRobotMap`
+        """
+        if self._robot_map is None and isinstance(self._record.get('map'), str):
+            from .robotmap import decode_robot_map_blob
+            self._robot_map = decode_robot_map_blob(self._record['map'])
+        return self._robot_map
+
+    def __repr__(self):
+        return '<WyzeSweepRecord: {0} ({1})>'.format(self.id, self.create_time)
+
+
+class WyzeSweepRecordCache(object):
+    """
+    Keeps the sweep records of every vacuum under ``directory``: a
+    JSON-lines file per MAC address holding the records in the order they
+    were added, and a small index next to it with the ``create_time``,
+    offset and length of every record. Records are read from disk only
+    when they are reached, so the map blobs of old runs are not parsed
+    when only the newest runs are needed.
+
+    The cached records are always a gapless part of the history, from the
+    newest cached run back to the oldest one; the index records whether the
+    oldest cached run is the first run of the vacuum.
+    """
+
+    COMPLETE = 'complete'
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, mac, suffix='.jsonl'):
+        return os.path.join(
+            self._directory, re.sub(r'[^\w.-]', '_', mac) + suffix)
+
+    def index(self, mac):
+        """
+        Returns the index of the cached records of a vacuum as a list of
+        ``(create_time, offset, length)`` tuples, newest first, and whether
+        the cache holds the whole history.
+        :rtype: ``tuple`` of ``list`` and ``bool``
+        """
+        path = self._path(mac, '.index')
+        if not os.path.exists(path):
+            return [], False
+
+        entries = {}
+        complete = False
+        with self._lock, open(path, encoding='utf-8') as f:
+            size = os.path.getsize(self._path(mac))
+            for line in f:
+                if line.strip() == self.COMPLETE:
+                    complete = True
+                    continue
+                try:
+                    create_time, offset, length = map(int, line.split())
+                except ValueError:
+                    # a partially written line, e.g. after a crash
+                    log.warning('skipping unreadable line in %s', path)
+                    continue
+                if offset + length <= size:
+                    entries.setdefault(create_time, (offset, length))
+        return ([(create_time,) + entries[create_time]
+                 for create_time in sorted(entries, reverse=True)],
+                complete)
+
+    def records(self, mac, entries):
+        """
+        Yields the cached records of the given index entries, reading each
+        one when it is reached.
+        :rtype: generator of ``dict``
+        """
+        if not entries:
+            return
+
+        with open(self._path(mac), 'rb') as f:
+            for _, offset, length in entries:
+                f.seek(offset)
+                yield json.loads(f.read(length).decode('utf-8'))
+
+    def load(self, mac):
+        """
+        Returns the cached records of a vacuum, newest first.
+        :rtype: ``list`` of ``dict``
+        """
+        return list(self.records(mac, self.index(mac)[0]))
+
+    def latest_time(self, mac):
+        """
+        Returns the ``create_time`` of the newest cached record, or ``None``.
+        """
+        entries = self.index(mac)[0]
+        return entries[0][0] if entries else None
+
+    def add(self, mac, records, complete=False):
+        """
+        Adds records to the cache of a vacuum. They must adjoin the cached
+        records, i.e. reach from the newest cached record onwards or from
+        the oldest one back. ``complete`` tells that the oldest of them is
+        the first run of the vacuum.
+        """
+        if not records and not complete:
+            return
+
+        os.makedirs(self._directory, exist_ok=True)
+        with self._lock:
+            lines = []
+            with open(self._path(mac), 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                for record in records:
+                    data = (json.dumps(record, separators=(',', ':')) +
+                            '\n').encode('utf-8')
+                    f.write(data)
+                    lines.append('{0} {1} {2}\n'.format(
+                        WyzeSweepRecord(record).create_time, offset,
+                        len(data) - 1))
+                    offset += len(data)
+            if complete:
+                lines.append(self.COMPLETE + '\n')
+            # the index is written after the records it points to, so it
+            # never refers to a record that is not on disk
+            with open(self._path(mac, '.index'), 'a', encoding='utf-8') as f:
+                f.writelines(lines)
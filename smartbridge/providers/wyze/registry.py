@@ -0,0 +1,131 @@
+"""
+Indexed view over the Wyze account device list
+"""
+import logging
+import threading
+
+from .devices import DeviceModels
+
+log = logging.getLogger(__name__)
+
+
+class WyzeDeviceRegistry(object):
+    """
+    Indexes a Wyze device list by MAC address and by device type.
+
+    Device types are the model sets defined by :class:`.DeviceModels` (e.g.
+    ``DeviceModels.BULB``), so ``get()`` is a single dictionary hit and
+    ``list()`` only touches the devices of the requested type.
+
+    The indexes are replaced copy-on-write, so readers never need to take a
+    lock and always see a consistent snapshot while ``update()`` runs.
+    """
+
+    def __init__(self, device_list=None):
+        self._lock = threading.Lock()
+        self._by_mac = {}
+        self._by_type = {}
+        if device_list is not None:
+            self.update(device_list)
+
+    def __len__(self):
+        return len(self._by_mac)
+
+    def __iter__(self):
+        return iter(list(self._by_mac.values()))
+
+    def get(self, mac, default=None):
+        """
+        Returns the device with the given MAC address.
+        """
+        return self._by_mac.get(mac, default)
+
+    def list(self, models=None):
+        """
+        Returns the devices whose product model is in ``models``. All devices
+        are returned when no models are given.
+        """
+        if models is None:
+            return list(self._by_mac.values())
+
+        by_type = self._by_type
+        if isinstance(models, frozenset) and models in by_type:
+            return list(by_type[models].values())
+
+        # an ad hoc collection of models rather than a DeviceModels type
+        matching = []
+        for device_type in set(DeviceModels.device_type(model) for model in models):
+            for device in by_type.get(device_type, {}).values():
+                if device['product_model'] in models:
+                    matching.append(device)
+        return matching
+
+    def update(self, device_list):
+        """
+        Reconciles the indexes with a freshly fetched device list. Only the
+        per-type indexes that contain added, changed or removed devices are
+        rebuilt; unchanged device entries are kept as they are.
+        """
+        with self._lock:
+            indexes = self._reconcile(device_list)
+            if indexes is not None:
+                self._by_type = indexes[1]
+                self._by_mac = indexes[0]
+
+    def updated(self, device_list):
+        """
+        Returns a new registry for a freshly fetched device list, leaving
+        this one unchanged. Unchanged device entries and per-type indexes
+        are shared between the two.
+        :rtype: :class:`.WyzeDeviceRegistry`
+        """
+        registry = WyzeDeviceRegistry()
+        with self._lock:
+            indexes = self._reconcile(device_list)
+            registry._by_mac, registry._by_type = (
+                indexes or (self._by_mac, self._by_type))
+        return registry
+
+    def _reconcile(self, device_list):
+        """
+        Returns the ``(by_mac, by_type)`` indexes for a device list, or
+        ``None`` if it matches the current ones. The current indexes are
+        never modified.
+        """
+        old_by_mac = self._by_mac
+        by_mac = {}
+        changed = {}
+        for device in device_list:
+            mac = device['mac']
+            current = old_by_mac.get(mac)
+            if current is not None and current == device:
+                by_mac[mac] = current
+            else:
+                by_mac[mac] = device
+                changed[mac] = device
+        removed = [mac for mac in old_by_mac if mac not in by_mac]
+
+        if not changed and not removed:
+            return None
+
+        by_type = dict(self._by_type)
+        copied = set()
+
+        def _index_for(device):
+            device_type = DeviceModels.device_type(device['product_model'])
+            if device_type not in copied:
+                by_type[device_type] = dict(by_type.get(device_type, {}))
+                copied.add(device_type)
+            return by_type[device_type]
+
+        for mac in removed:
+            _index_for(old_by_mac[mac]).pop(mac, None)
+        for mac, device in changed.items():
+            previous = old_by_mac.get(mac)
+            if previous is not None and previous['product_model'] != device['product_model']:
+                _index_for(previous).pop(mac, None)
+            _index_for(device)[mac] = device
+
+        log.debug('device registry updated: %d changed, %d removed',
+                  len(changed), len(removed))
+        return by_mac, by_type
@@ -0,0 +1,371 @@
+"""
+Schema-specific decoder for the Wyze robot vacuum map message.
+
+The map is a protocol buffer whose schema is fixed (see
+``WyzeVacuum._robot_map_proto``), so instead of a generic decoder this module
+walks the wire format directly and builds typed objects. Unknown fields are
+skipped, so newer firmware adding fields does not break decoding.
+"""
+import base64
+import binascii
+from collections import namedtuple
+import logging
+import struct
+import zlib
+
+from smartbridge.interfaces.exceptions import InvalidValueException
+
+from .devices import WyzeVacuumMapRoom
+
+log = logging.getLogger(__name__)
+
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+_FIXED32 = 5
+
+_float = struct.Struct('<f').unpack_from
+
+MapHeadInfo = namedtuple(
+    'MapHeadInfo',
+    'head_id size_x size_y min_x min_y max_x max_y resolution')
+MapInfo = namedtuple('MapInfo', 'head_id name')
+MapPose = namedtuple('MapPose', 'pose_id update x y phi')
+PathPoint = namedtuple('PathPoint', 'update x y')
+ChargeStation = namedtuple('ChargeStation', 'x y phi')
+NavigationPoint = namedtuple(
+    'NavigationPoint', 'point_id status point_type x y phi')
+RoomChainPoint = namedtuple('RoomChainPoint', 'x y value')
+RoomChain = namedtuple('RoomChain', 'room points')
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _signed(value):
+    # int32/int64 values are sent as 64 bit two's complement varints
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _fields(buf, start=0, end=None):
+    """
+    Yields ``(field_number, wire_type, value)`` for every field of the
+    message in ``buf[start:end]``. Varints are returned as signed ints,
+    fixed32 values as floats and length-delimited values as ``(start, end)``
+    offsets, so nested messages are never copied.
+    """
+    pos = start
+    end = len(buf) if end is None else end
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        wire_type = key & 0x7
+        if wire_type == _VARINT:
+            value, pos = _read_varint(buf, pos)
+            value = _signed(value)
+        elif wire_type == _FIXED32:
+            value = _float(buf, pos)[0]
+            pos += 4
+        elif wire_type == _LENGTH_DELIMITED:
+            length, pos = _read_varint(buf, pos)
+            value = (pos, pos + length)
+            pos += length
+        elif wire_type == _FIXED64:
+            value = None
+            pos += 8
+        else:
+            raise InvalidValueException('current_map', wire_type)
+        yield key >> 3, wire_type, value
+
+    if pos != end:
+        raise InvalidValueException('current_map', pos)
+
+
+def _scalars(buf, span, names):
+    """
+    Decodes a message of scalar fields numbered ``1..len(names)`` into a
+    dict of the given names.
+    """
+    values = dict.fromkeys(names)
+    for number, wire_type, value in _fields(buf, *span):
+        if 0 < number <= len(names) and wire_type != _LENGTH_DELIMITED:
+            values[names[number - 1]] = value
+    return values
+
+
+def _text(buf, span):
+    return bytes(buf[span[0]:span[1]]).decode('utf-8', 'replace')
+
+
+def _base64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _bytes_field(buf, span, field=1):
+    for number, wire_type, value in _fields(buf, *span):
+        if number == field and wire_type == _LENGTH_DELIMITED:
+            return bytes(buf[value[0]:value[1]])
+    return None
+
+
+class WyzeRobotMap(object):
+    """
+    A decoded robot map. Grids are kept as ``bytes``; see
+    :class:`.WyzeVacuumMap` for an array view of them.
+
+    Decoded maps are shared by every device showing the same map blob, so
+    they are read-only once decoded: repeated fields are tuples and setting
+    an attribute raises ``AttributeError``.
+    """
+    _REPEATED_FIELDS = ('map_infos', 'history', 'navigation_points', 'rooms',
+                        'room_chains')
+
+    def __init__(self):
+        self.map_type = None
+        self.task_begin_date = None
+        self.map_upload_date = None
+        self.head = None
+        self.map_data = None
+        self.map_infos = []
+        self.history_pose_id = None
+        self.history = []
+        self.charge_station = None
+        self.current_pose = None
+        self.navigation_points = []
+        self.rooms = []
+        self.room_matrix = None
+        self.room_chains = []
+        self._frozen = False
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen'):
+            raise AttributeError('decoded robot maps are read-only')
+        super(WyzeRobotMap, self).__setattr__(name, value)
+
+    def freeze(self):
+        """
+        Makes the map read-only, see above.
+        :rtype: :class:`.WyzeRobotMap`
+        """
+        for name in WyzeRobotMap._REPEATED_FIELDS:
+            setattr(self, name, tuple(getattr(self, name)))
+        self.room_chains = tuple(RoomChain(chain.room, tuple(chain.points))
+                                 for chain in self.room_chains)
+        self._frozen = True
+        return self
+
+    def to_dict(self):
+        """
+        Returns the map in the layout of the generic protobuf decoder, i.e.
+        keyed by the names of ``WyzeVacuum._robot_map_proto`` and by field
+        number for its nameless fields. Repeated fields are always lists,
+        and grids are base64 strings, so the dictionary can be serialized
+        to JSON. It is built on every call and belongs to the caller.
+        :rtype: ``dict``
+        """
+        as_dict = {}
+        if self.map_type is not None:
+            as_dict['mapType_'] = self.map_type
+        if self.task_begin_date is not None or self.map_upload_date is not None:
+            as_dict['mapExtInfo_'] = {
+                'taskBeginDate_': self.task_begin_date,
+                'mapUploadDate_': self.map_upload_date}
+        if self.head is not None:
+            as_dict['mapHeadInfo_'] = {
+                'mapHeadId_': self.head.head_id,
+                'sizeX_': self.head.size_x,
+                'sizeY_': self.head.size_y,
+                'minX_': self.head.min_x,
+                'minY_': self.head.min_y,
+                'maxX_': self.head.max_x,
+                'maxY_': self.head.max_y,
+                'resolution_': self.head.resolution}
+        if self.map_data is not None:
+            as_dict['mapData_'] = {'mapData_': _base64(self.map_data)}
+        if self.map_infos:
+            as_dict['mapInfo_'] = [
+                {'mapHeadId_': info.head_id, 'mapName_': info.name}
+                for info in self.map_infos]
+        if self.history_pose_id is not None or self.history:
+            as_dict['historyPose_'] = {
+                'poseId_': self.history_pose_id,
+                '2': [{'update_': point.update, 'x_': point.x, 'y_': point.y}
+                      for point in self.history]}
+        if self.charge_station is not None:
+            as_dict['chargeStation_'] = {
+                'x_': self.charge_station.x,
+                'y_': self.charge_station.y,
+                'phi_': self.charge_station.phi}
+        if self.current_pose is not None:
+            as_dict['currentPose_'] = {
+                'poseId_': self.current_pose.pose_id,
+                'update_': self.current_pose.update,
+                'x_': self.current_pose.x,
+                'y_': self.current_pose.y,
+                'phi_': self.current_pose.phi}
+        if self.navigation_points:
+            as_dict['navigationPoints_'] = [{
+                'pointId_': point.point_id,
+                'status_': point.status,
+                'pointType_': point.point_type,
+                'x_': point.x,
+                'y_': point.y,
+                'phi_': point.phi} for point in self.navigation_points]
+        if self.rooms:
+            as_dict['12'] = [{
+                'id': room.id,
+                'name': room.name,
+                'clean_state': room.clean_state,
+                'room_clean': room.room_clean} for room in self.rooms]
+        if self.room_matrix is not None:
+            as_dict['roomMatrix_'] = {'matrix_': _base64(self.room_matrix)}
+        if self.room_chains:
+            as_dict['14'] = [{
+                'room': chain.room,
+                '2': [{'x_': point.x, 'y_': point.y, 'value_': point.value}
+                      for point in chain.points]} for chain in self.room_chains]
+        return as_dict
+
+
+def _decode_path_point(buf, pos, end):
+    # path points make up most of a map, so their fields are read inline
+    # rather than through _fields()
+    update = x = y = None
+    while pos < end:
+        key = buf[pos]
+        pos += 1
+        if key == 0x08:
+            update, pos = _read_varint(buf, pos)
+            update = _signed(update)
+        elif key == 0x15:
+            x = _float(buf, pos)[0]
+            pos += 4
+        elif key == 0x1d:
+            y = _float(buf, pos)[0]
+            pos += 4
+        else:
+            # unexpected layout, fall back to the generic decoder
+            point = _scalars(buf, (pos - 1, end), ('update', 'x', 'y'))
+            return PathPoint(
+                update if point['update'] is None else point['update'],
+                x if point['x'] is None else point['x'],
+                y if point['y'] is None else point['y'])
+    return PathPoint(update, x, y)
+
+
+def _decode_history(robot_map, buf, span):
+    history = robot_map.history
+    for number, wire_type, value in _fields(buf, *span):
+        if number == 1 and wire_type == _VARINT:
+            robot_map.history_pose_id = value
+        elif number == 2 and wire_type == _LENGTH_DELIMITED:
+            history.append(_decode_path_point(buf, *value))
+
+
+def _decode_room(buf, span):
+    room = {'id': None, 'name': None, 'clean_state': None, 'room_clean': None}
+    for number, wire_type, value in _fields(buf, *span):
+        if number == 1 and wire_type == _VARINT:
+            room['id'] = value
+        elif number == 2 and wire_type == _LENGTH_DELIMITED:
+            room['name'] = _text(buf, value)
+        elif number == 5 and wire_type == _VARINT:
+            room['clean_state'] = value
+        elif number == 6 and wire_type == _VARINT:
+            room['room_clean'] = value
+    return WyzeVacuumMapRoom(**room)
+
+
+def _decode_room_chain(buf, span):
+    room = None
+    points = []
+    for number, wire_type, value in _fields(buf, *span):
+        if number == 1 and wire_type == _VARINT:
+            room = value
+        elif number == 2 and wire_type == _LENGTH_DELIMITED:
+            points.append(RoomChainPoint(**_scalars(
+                buf, value, ('x', 'y', 'value'))))
+    return RoomChain(room, points)
+
+
+def _decode_map_info(buf, span):
+    head_id = None
+    name = None
+    for number, wire_type, value in _fields(buf, *span):
+        if number == 1 and wire_type == _VARINT:
+            head_id = value
+        elif number == 2 and wire_type == _LENGTH_DELIMITED:
+            name = _text(buf, value)
+    return MapInfo(head_id, name)
+
+
+def decode_robot_map(data):
+    """
+    Decodes the (decompressed) bytes of a robot map message.
+    :rtype: :class:`.WyzeRobotMap`
+    """
+    buf = memoryview(data)
+    robot_map = WyzeRobotMap()
+    try:
+        for number, wire_type, value in _fields(buf):
+            if wire_type != _LENGTH_DELIMITED:
+                if number == 1 and wire_type == _VARINT:
+                    robot_map.map_type = value
+                continue
+
+            if number == 2:
+                ext = _scalars(buf, value, ('task_begin_date', 'map_upload_date'))
+                robot_map.task_begin_date = ext['task_begin_date']
+                robot_map.map_upload_date = ext['map_upload_date']
+            elif number == 3:
+                robot_map.head = MapHeadInfo(**_scalars(
+                    buf, value, MapHeadInfo._fields))
+            elif number == 4:
+                robot_map.map_data = _bytes_field(buf, value)
+            elif number == 5:
+                robot_map.map_infos.append(_decode_map_info(buf, value))
+            elif number == 6:
+                _decode_history(robot_map, buf, value)
+            elif number == 7:
+                robot_map.charge_station = ChargeStation(**_scalars(
+                    buf, value, ChargeStation._fields))
+            elif number == 8:
+                robot_map.current_pose = MapPose(**_scalars(
+                    buf, value, MapPose._fields))
+            elif number == 11:
+                robot_map.navigation_points.append(NavigationPoint(**_scalars(
+                    buf, value, NavigationPoint._fields)))
+            elif number == 12:
+                robot_map.rooms.append(_decode_room(buf, value))
+            elif number == 13:
+                robot_map.room_matrix = _bytes_field(buf, value)
+            elif number == 14:
+                robot_map.room_chains.append(_decode_room_chain(buf, value))
+    except (IndexError, struct.error):
+        raise InvalidValueException('current_map', '')
+
+    return robot_map.freeze()
+
+
+def decode_robot_map_blob(blob):
+    """
+    Decodes a map blob as returned by the API: the base64 encoding of the
+    zlib-compressed map message.
+    :rtype: :class:`.WyzeRobotMap`
+    """
+    try:
+        compressed = base64.b64decode(blob)
+        if not compressed:
+            raise InvalidValueException('current_map', '')
+
+        return decode_robot_map(zlib.decompress(compressed))
+    except (binascii.Error, zlib.error):
+        raise InvalidValueException('current_map', '')
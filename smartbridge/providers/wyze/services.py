@@ -1,3 +1,4 @@
+from collections import namedtuple
 import logging
 from smartbridge.interfaces.devices import VacuumSuction
 
@@ -7,6 +8,7 @@ from smartbridge.base.services import BasePlugService
 from smartbridge.base.services import BaseVacuumService
 from smartbridge.base.services import BaseContactSensorService
 from smartbridge.base.services import BaseMotionSensorService
+from smartbridge.interfaces.exceptions import InvalidParamException
 from smartbridge.interfaces.exceptions import ProviderConnectionException, InvalidValueException
 
 from .devices import WyzeBulb
@@ -18,6 +20,59 @@ from .devices import WyzeMotionSensor
 log = logging.getLogger(__name__)
 
 
+WyzeCommandResult = namedtuple('WyzeCommandResult', 'device properties error')
+WyzeCommandResult.__doc__ = """
+The outcome of a batch command for one device: the ``properties`` that
+were set, by name, and the ``error`` that stopped it (``None`` on success).
+"""
+
+
+def _switch_property(device_class, switch_state):
+    props = (device_class.switch_on_props() if switch_state
+             else device_class.switch_off_props())
+    pid, value = props.popitem()
+    return ('switch_state', pid, value)
+
+
+def _apply_properties(provider, devices, properties, max_parallel=None):
+    """
+    Sets the same ``(name, pid, value)`` properties on every device with a
+    single batch of concurrent requests.
+    :rtype: ``list`` of :class:`WyzeCommandResult`
+    """
+    devices = list({device.mac: device for device in devices}.values())
+    errors = provider.wyze_client.set_device_properties(
+        {device.mac: (device.model,
+                      [(pid, value) for _, pid, value in properties])
+         for device in devices},
+        max_parallel)
+
+    values = {name: value for name, _, value in properties}
+    results = []
+    for device in devices:
+        error = errors.get(device.mac)
+        if error is None:
+            for name, value in values.items():
+                device._set_property(name, value)
+        results.append(WyzeCommandResult(device, values, error))
+    return results
+
+
+def _wrap_devices(provider, device_class, payloads, compact=False):
+    """
+    Wraps device payloads in ``device_class`` objects. With ``compact``,
+    each payload is reduced to a :class:`.WyzeDeviceSnapshot` first and the
+    raw dictionary is not retained; the devices return the same values
+    either way.
+    """
+    if compact:
+        from .snapshot import WyzeDeviceSnapshot
+
+        payloads = [WyzeDeviceSnapshot.from_payload(device_class, payload)
+                    for payload in payloads]
+    return [device_class(provider, payload) for payload in payloads]
+
+
 class WyzeSessionService(BaseSessionService):
 
     def __init__(self, provider):
@@ -37,9 +92,11 @@ class WyzeBulbService(BaseBulbService):
     def __init__(self, provider):
         super(WyzeBulbService, self).__init__(provider)
 
-    def list(self):
-        wyze_bulbs = self.provider.wyze_client.list_bulbs()
-        return [WyzeBulb(self.provider, bulb) for bulb in wyze_bulbs]
+    def list(self, with_properties=False, compact=False):
+        wyze_bulbs = self.provider.wyze_client.list_bulbs(
+            WyzeBulb.pids() if with_properties else None)
+        return _wrap_devices(
+            self.provider, WyzeBulb, wyze_bulbs, compact)
 
     def get(self, bulb_mac):
         try:
@@ -49,12 +106,47 @@ class WyzeBulbService(BaseBulbService):
         except ProviderConnectionException:
             return None
 
+    def apply(self, bulbs, switch_state=None, brightness=None,
+              color_temp=None, max_parallel=None):
+        """
+        Applies the given changes to many bulbs at once. All changes to a
+        bulb are sent by one task; bulbs are updated concurrently, at most
+        ``max_parallel`` at a time.
+        :rtype: ``list`` of :class:`WyzeCommandResult`
+        """
+        properties = []
+        if brightness is not None:
+            if not isinstance(brightness, int):
+                raise InvalidParamException('brightness', brightness)
+            if brightness < 0 or brightness > 100:
+                raise InvalidValueException('brightness', brightness)
+            properties.append(
+                ('brightness', WyzeBulb.brightness_pid(), brightness))
+        if color_temp is not None:
+            if not isinstance(color_temp, int):
+                raise InvalidParamException('color_temp', color_temp)
+            if color_temp < 2700 or color_temp > 6500:
+                raise InvalidValueException('color_temp', color_temp)
+            properties.append(
+                ('color_temp', WyzeBulb.color_temp_pid(), color_temp))
+        if switch_state is not None:
+            # switch on before, and off after, changing the light settings
+            position = 0 if switch_state else len(properties)
+            properties.insert(
+                position, _switch_property(WyzeBulb, switch_state))
+
+        if not properties:
+            return []
+        return _apply_properties(
+            self.provider, bulbs, properties, max_parallel)
+
     def set_color_temp(self, bulb, value: int):
         pid = WyzeBulb.color_temp_pid()
         if pid is not None:
             try:
                 self.provider.wyze_client.set_bulb_property(
                     bulb.mac, bulb.model, pid, value)
+                self.provider.wyze_client.invalidate_device_list()
             except ProviderConnectionException as e:
                 raise e
         else:
@@ -67,6 +159,7 @@ class WyzeBulbService(BaseBulbService):
             try:
                 self.provider.wyze_client.set_bulb_property(
                     bulb.mac, bulb.model, pid, value)
+                self.provider.wyze_client.invalidate_device_list()
             except ProviderConnectionException as e:
                 raise e
         else:
@@ -80,6 +173,7 @@ class WyzeBulbService(BaseBulbService):
             try:
                 self.provider.wyze_client.set_bulb_property(
                     bulb.mac, bulb.model, prop[0], prop[1])
+                self.provider.wyze_client.invalidate_device_list()
             except ProviderConnectionException as e:
                 raise e
         else:
@@ -93,21 +187,53 @@ class WyzeBulbService(BaseBulbService):
             try:
                 self.provider.wyze_client.set_bulb_property(
                     bulb.mac, bulb.model, prop[0], prop[1])
+                self.provider.wyze_client.invalidate_device_list()
             except ProviderConnectionException as e:
                 raise e
         else:
             raise InvalidValueException(
                 "switch_off_props() must return at least one property.")
 
+    async def async_list(self, with_properties=False, compact=False):
+        wyze_bulbs = await self.provider.async_wyze_client.list_bulbs(
+            WyzeBulb.pids() if with_properties else None)
+        return _wrap_devices(
+            self.provider, WyzeBulb, wyze_bulbs, compact)
+
+    async def async_get(self, bulb_mac):
+        try:
+            bulb = await self.provider.async_wyze_client.get_bulb(
+                bulb_mac, WyzeBulb.pids())
+            return WyzeBulb(self.provider, bulb)
+        except ProviderConnectionException:
+            return None
+
+    async def async_switch_on(self, bulb):
+        await self._async_set_switch(bulb, WyzeBulb.switch_on_props())
+
+    async def async_switch_off(self, bulb):
+        await self._async_set_switch(bulb, WyzeBulb.switch_off_props())
+
+    async def _async_set_switch(self, bulb, props):
+        if len(props) != 1:
+            raise InvalidValueException(
+                "switch props must return exactly one property.")
+        prop = props.popitem()
+        await self.provider.async_wyze_client.set_bulb_property(
+            bulb.mac, bulb.model, prop[0], prop[1])
+        self.provider.async_wyze_client.invalidate_device_list()
+
 
 class WyzePlugService(BasePlugService):
 
     def __init__(self, provider):
         super(WyzePlugService, self).__init__(provider)
 
-    def list(self):
-        wyze_plugs = self.provider.wyze_client.list_plugs()
-        return [WyzePlug(self.provider, plug) for plug in wyze_plugs]
+    def list(self, with_properties=False, compact=False):
+        wyze_plugs = self.provider.wyze_client.list_plugs(
+            WyzePlug.pids() if with_properties else None)
+        return _wrap_devices(
+            self.provider, WyzePlug, wyze_plugs, compact)
 
     def get(self, plug_mac):
         try:
@@ -117,6 +243,18 @@ class WyzePlugService(BasePlugService):
         except ProviderConnectionException:
             return None
 
+    def apply(self, plugs, switch_state=None, max_parallel=None):
+        """
+        Applies the given changes to many plugs at once, updating at most
+        ``max_parallel`` plugs at a time.
+        :rtype: ``list`` of :class:`WyzeCommandResult`
+        """
+        if switch_state is None:
+            return []
+        return _apply_properties(
+            self.provider, plugs,
+            [_switch_property(WyzePlug, switch_state)], max_parallel)
+
     def switch_on(self, plug):
         props = WyzePlug.switch_on_props()
         if len(props) == 1:
@@ -124,6 +262,7 @@ class WyzePlugService(BasePlugService):
             try:
                 self.provider.wyze_client.set_plug_property(
                     plug.mac, plug.model, prop[0], prop[1])
+                self.provider.wyze_client.invalidate_device_list()
             except ProviderConnectionException:
                 return None
         else:
@@ -137,21 +276,70 @@ class WyzePlugService(BasePlugService):
             try:
                 self.provider.wyze_client.set_plug_property(
                     plug.mac, plug.model, prop[0], prop[1])
+                self.provider.wyze_client.invalidate_device_list()
             except ProviderConnectionException:
                 return None
         else:
             raise InvalidValueException(
                 "switch_off_props() must return at least one property.")
 
+    async def async_list(self, with_properties=False, compact=False):
+        wyze_plugs = await self.provider.async_wyze_client.list_plugs(
+            WyzePlug.pids() if with_properties else None)
+        return _wrap_devices(
+            self.provider, WyzePlug, wyze_plugs, compact)
+
+    async def async_get(self, plug_mac):
+        try:
+            plug = await self.provider.async_wyze_client.get_plug(
+                plug_mac, WyzePlug.pids())
+            return WyzePlug(self.provider, plug)
+        except ProviderConnectionException:
+            return None
+
+    async def async_switch_on(self, plug):
+        await self._async_set_switch(plug, WyzePlug.switch_on_props())
+
+    async def async_switch_off(self, plug):
+        await self._async_set_switch(plug, WyzePlug.switch_off_props())
+
+    async def _async_set_switch(self, plug, props):
+        if len(props) != 1:
+            raise InvalidValueException(
+                "switch props must return exactly one property.")
+        prop = props.popitem()
+        try:
+            await self.provider.async_wyze_client.set_plug_property(
+                plug.mac, plug.model, prop[0], prop[1])
+            self.provider.async_wyze_client.invalidate_device_list()
+        except ProviderConnectionException:
+            return None
+
 
 class WyzeVacuumService(BaseVacuumService):
 
     def __init__(self, provider):
         super(WyzeVacuumService, self).__init__(provider)
-
-    def list(self):
+        self._sweep_record_cache = None
+
+    @property
+    def sweep_record_cache(self):
+        """
+        The on-disk sweep record cache, if ``wyze_sweep_record_cache_dir``
+        is configured.
+        :rtype: :class:`.WyzeSweepRecordCache`
+        """
+        directory = self.provider.sweep_record_cache_dir
+        if self._sweep_record_cache is None and directory:
+            from .records import WyzeSweepRecordCache
+
+            self._sweep_record_cache = WyzeSweepRecordCache(directory)
+        return self._sweep_record_cache
+
+    def list(self, compact=False):
         wyze_vacuums = self.provider.wyze_client.list_vacuums()
-        return [WyzeVacuum(self.provider, vac) for vac in wyze_vacuums]
+        return _wrap_devices(
+            self.provider, WyzeVacuum, wyze_vacuums, compact)
 
     def get(self, vacuum_mac):
         try:
@@ -160,7 +348,139 @@ class WyzeVacuumService(BaseVacuumService):
             return WyzeVacuum(self.provider, vacuum)
         except ProviderConnectionException:
             return None
-    
+
+    async def async_list(self, compact=False):
+        wyze_vacuums = await self.provider.async_wyze_client.list_vacuums()
+        return _wrap_devices(
+            self.provider, WyzeVacuum, wyze_vacuums, compact)
+
+    async def async_get(self, vacuum_mac):
+        try:
+            vacuum = await self.provider.async_wyze_client.get_vacuum(
+                vacuum_mac, WyzeVacuum.pids(), WyzeVacuum.device_info_pids())
+            return WyzeVacuum(self.provider, vacuum)
+        except ProviderConnectionException:
+            return None
+
+    def track(self, vacuum, callback=None, interval=None, capacity=10000):
+        """
+        Starts tracking the position and path of a vacuum. ``callback``, if
+        given, receives a :class:`.WyzeVacuumTrack` whenever the vacuum
+        moved or its map changed. Call ``stop()`` on the returned tracker
+        (or use it as a context manager) to stop polling.
+        :rtype: :class:`.WyzeVacuumTracker`
+        """
+        from .tracking import WyzeVacuumTracker
+
+        tracker = WyzeVacuumTracker(
+            self.provider.wyze_client,
+            vacuum.mac,
+            interval=float(
+                interval if interval is not None
+                else self.provider.vacuum_tracking_interval),
+            capacity=capacity)
+        if callback is not None:
+            tracker.subscribe(callback)
+        return tracker.start()
+
+    def sweep_records(self, vacuum, since=None, page_size=20):
+        """
+        Yields the cleaning history of a vacuum, newest first, fetching one
+        page of ``page_size`` records at a time as the generator advances.
+        Records created at or before ``since`` (milliseconds since the epoch)
+        are not returned.
+
+        With the sweep record cache, only records newer than the newest
+        cached record and older than the oldest one are fetched; the cached
+        ones are read from disk as they are reached. Fetched pages are added
+        to the cache as soon as they adjoin the cached records, so reading
+        only the newest few runs fills the cache as well.
+        :rtype: generator of :class:`.WyzeSweepRecord`
+        """
+        from .records import WyzeSweepRecord
+
+        cache = self.sweep_record_cache
+        if cache is None:
+            for page, _ in self._fetch_sweep_record_pages(
+                    vacuum.mac, since, page_size):
+                for record in page:
+                    yield WyzeSweepRecord(record)
+            return
+
+        entries, complete = cache.index(vacuum.mac)
+        if not entries:
+            # every page adjoins the pages fetched before it
+            for page, exhausted in self._fetch_sweep_record_pages(
+                    vacuum.mac, since, page_size):
+                cache.add(vacuum.mac, page, complete=exhausted)
+                for record in page:
+                    yield WyzeSweepRecord(record)
+            return
+
+        latest = entries[0][0]
+        if since is not None and since >= latest:
+            # nothing cached is returned, and the new records do not reach
+            # the cached ones
+            for page, _ in self._fetch_sweep_record_pages(
+                    vacuum.mac, since, page_size):
+                for record in page:
+                    yield WyzeSweepRecord(record)
+            return
+
+        # the new records are cached once the fetch reaches the newest cached
+        # record, as the cache must not have gaps
+        fetched = []
+        for page, _ in self._fetch_sweep_record_pages(
+                vacuum.mac, latest, page_size):
+            fetched.extend(page)
+            for record in page:
+                yield WyzeSweepRecord(record)
+        cache.add(vacuum.mac, fetched)
+
+        for record in cache.records(vacuum.mac, [
+                entry for entry in entries
+                if since is None or entry[0] > since]):
+            yield WyzeSweepRecord(record)
+        if complete or (since is not None and entries[-1][0] <= since):
+            return
+
+        # the backlog older than the oldest cached record
+        for page, exhausted in self._fetch_sweep_record_pages(
+                vacuum.mac, since, page_size, cursor=entries[-1][0]):
+            cache.add(vacuum.mac, page, complete=exhausted)
+            for record in page:
+                yield WyzeSweepRecord(record)
+
+    def _fetch_sweep_record_pages(self, vacuum_mac, since, page_size,
+                                  cursor=None):
+        """
+        Yields pages of sweep records created before ``cursor``, newest
+        first, as ``(records, exhausted)``, where ``exhausted`` tells that
+        the page ends with the first run of the vacuum.
+        """
+        from .records import WyzeSweepRecord
+
+        while True:
+            records, next_cursor = (
+                self.provider.wyze_client.get_vacuum_sweep_records(
+                    vacuum_mac, WyzeSweepRecord.keys(), cursor, page_size))
+            page = []
+            for record in records:
+                create_time = WyzeSweepRecord(record).create_time
+                if cursor is not None and create_time >= cursor:
+                    # already returned with the previous page
+                    continue
+                if since is not None and create_time <= since:
+                    yield page, False
+                    return
+                page.append(record)
+
+            exhausted = len(records) < page_size or next_cursor is None
+            yield page, exhausted
+            if exhausted or next_cursor == cursor:
+                return
+            cursor = next_cursor
+
     def clean(self, vacuum):
         self.start(vacuum, [])
 
@@ -244,9 +564,11 @@ class WyzeContactSensorService(BaseContactSensorService):
     def __init__(self, provider):
         super(WyzeContactSensorService, self).__init__(provider)
 
-    def list(self):
-        wyze_contact_sensors = self.provider.wyze_client.list_contact_sensors()
-        return [WyzeContactSensor(self.provider, contact_sensor) for contact_sensor in wyze_contact_sensors]
+    def list(self, with_properties=False, compact=False):
+        wyze_contact_sensors = self.provider.wyze_client.list_contact_sensors(
+            WyzeContactSensor.pids() if with_properties else None)
+        return _wrap_devices(
+            self.provider, WyzeContactSensor, wyze_contact_sensors, compact)
 
     def get(self, contact_sensor_mac):
         try:
@@ -256,15 +578,31 @@ class WyzeContactSensorService(BaseContactSensorService):
         except ProviderConnectionException:
             return None
 
+    async def async_list(self, with_properties=False, compact=False):
+        wyze_contact_sensors = await self.provider.async_wyze_client.list_contact_sensors(
+            WyzeContactSensor.pids() if with_properties else None)
+        return _wrap_devices(
+            self.provider, WyzeContactSensor, wyze_contact_sensors, compact)
+
+    async def async_get(self, contact_sensor_mac):
+        try:
+            contact_sensor = await self.provider.async_wyze_client.get_contact_sensor(
+                contact_sensor_mac)
+            return WyzeContactSensor(self.provider, contact_sensor)
+        except ProviderConnectionException:
+            return None
+
 
 class WyzeMotionSensorService(BaseMotionSensorService):
 
     def __init__(self, provider):
         super(WyzeMotionSensorService, self).__init__(provider)
 
-    def list(self):
-        wyze_motion_sensors = self.provider.wyze_client.list_motion_sensors()
-        return [WyzeMotionSensor(self.provider, motion_sensor) for motion_sensor in wyze_motion_sensors]
+    def list(self, with_properties=False, compact=False):
+        wyze_motion_sensors = self.provider.wyze_client.list_motion_sensors(
+            WyzeMotionSensor.pids() if with_properties else None)
+        return _wrap_devices(
+            self.provider, WyzeMotionSensor, wyze_motion_sensors, compact)
 
     def get(self, motion_sensor_mac):
         try:
@@ -273,3 +611,17 @@ class WyzeMotionSensorService(BaseMotionSensorService):
             return WyzeMotionSensor(self.provider, motion_sensor)
         except ProviderConnectionException:
             return None
+
+    async def async_list(self, with_properties=False, compact=False):
+        wyze_motion_sensors = await self.provider.async_wyze_client.list_motion_sensors(
+            WyzeMotionSensor.pids() if with_properties else None)
+        return _wrap_devices(
+            self.provider, WyzeMotionSensor, wyze_motion_sensors, compact)
+
+    async def async_get(self, motion_sensor_mac):
+        try:
+            motion_sensor = await self.provider.async_wyze_client.get_motion_sensor(
+                motion_sensor_mac)
+            return WyzeMotionSensor(self.provider, motion_sensor)
+        except ProviderConnectionException:
+            return None
@@ -0,0 +1,153 @@
+"""
+Compact, normalized snapshots of Wyze device payloads
+"""
+import logging
+
+from .devices import WyzeNetworkedDevice
+from .devices import WyzeVacuum
+
+log = logging.getLogger(__name__)
+
+_IDENTITY_FIELDS = ('mac', 'product_model', 'nickname')
+_NETWORK_FIELDS = ('ip', 'rssi', 'ssid')
+
+class WyzeSnapshotSchema(object):
+    """
+    The field layout shared by every snapshot of one device class. Fields
+    are the identity fields of the device list followed by the names
+    declared in the class ``props()`` table.
+    """
+    __slots__ = ('names', 'pids', 'index')
+
+    _schemas = {}
+
+    def __init__(self, fields):
+        self.names = tuple(field[0] for field in fields)
+        self.pids = tuple(field[1] for field in fields)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    @staticmethod
+    def for_class(device_class):
+        """
+        Returns the schema of the given device class, built on first use.
+        :rtype: :class:`.WyzeSnapshotSchema`
+        """
+        schema = WyzeSnapshotSchema._schemas.get(device_class)
+        if schema is None:
+            fields = [(name, None) for name in _IDENTITY_FIELDS]
+            props = dict(device_class.props())
+            if issubclass(device_class, WyzeVacuum):
+                props.update(device_class.device_info_props())
+            if issubclass(device_class, WyzeNetworkedDevice):
+                fields.extend((name, None) for name in _NETWORK_FIELDS
+                              if name not in props)
+            fields.extend((name, prop[0]) for name, prop in props.items()
+                          if name and name not in _IDENTITY_FIELDS)
+            schema = WyzeSnapshotSchema(fields)
+            WyzeSnapshotSchema._schemas[device_class] = schema
+        return schema
+
+
+def _lookup(payload, name, pid):
+    """
+    Finds a raw value in a device payload, searching the same places as
+    the device classes do.
+    """
+    if name in payload:
+        return payload[name]
+
+    data = payload.get('data')
+    if data is not None:
+        if pid is not None and 'property_list' in data:
+            for property in data['property_list']:
+                if property['pid'] == pid:
+                    return property['value']
+        for section in ('props', 'settings'):
+            if name in data.get(section, ()):
+                return data[section][name]
+
+    for section in ('props', 'settings', 'device_params'):
+        if name in payload.get(section, ()):
+            return payload[section][name]
+
+    return None
+
+
+class WyzeDeviceSnapshot(object):
+    """
+    A compact replacement for the raw API dictionary of a device.
+
+    Values are looked up once and kept in a tuple laid out by the device
+    class :class:`.WyzeSnapshotSchema`, and the raw payload is dropped unless
+    ``keep_raw`` is set. Values are kept as the API returned them (e.g. the
+    string ``'1'`` for a switched on bulb), so devices read the same values
+    from a snapshot as from the payload. The snapshot supports the mapping operations the
+    device classes use on their payload, so it can be passed to them in
+    place of the dictionary, e.g.
+    ``WyzeBulb(provider, WyzeDeviceSnapshot.from_payload(WyzeBulb, bulb))``.
+    """
+    __slots__ = ('_schema', '_values', '_raw')
+
+    def __init__(self, schema, values, raw=None):
+        self._schema = schema
+        self._values = values
+        self._raw = raw
+
+    @staticmethod
+    def from_payload(device_class, payload, keep_raw=False):
+        """
+        Reads the fields of a device list or device detail payload.
+        :rtype: :class:`.WyzeDeviceSnapshot`
+        """
+        schema = WyzeSnapshotSchema.for_class(device_class)
+        values = tuple(_lookup(payload, name, pid)
+                       for name, pid in zip(schema.names, schema.pids))
+        return WyzeDeviceSnapshot(
+            schema, values, payload if keep_raw else None)
+
+    @property
+    def raw(self):
+        """
+        The payload the snapshot was decoded from, if it was kept.
+        :rtype: ``dict``
+        """
+        return self._raw
+
+    def __contains__(self, name):
+        i = self._schema.index.get(name)
+        if i is not None and self._values[i] is not None:
+            return True
+        return self._raw is not None and name in self._raw
+
+    def __getitem__(self, name):
+        i = self._schema.index.get(name)
+        if i is not None and self._values[i] is not None:
+            return self._values[i]
+        if self._raw is not None:
+            return self._raw[name]
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        i = self._schema.index.get(name)
+        if i is None:
+            if self._raw is None:
+                raise KeyError(name)
+            self._raw[name] = value
+            return
+        values = list(self._values)
+        values[i] = value
+        self._values = tuple(values)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def to_dict(self):
+        """
+        Returns the fields that have a value.
+        :rtype: ``dict``
+        """
+        return {name: value for name, value in zip(
+            self._schema.names, self._values) if value is not None}
+
+    def __repr__(self):
+        return '<WyzeDeviceSnapshot: {0}>'.format(self.to_dict())
@@ -0,0 +1,261 @@
+"""
+Request rate limiting and scheduling for the Wyze service clients
+
+Every service host (api, venus, platform, ...) gets a token bucket of its
+own. Requests waiting for a token are served by priority, so commands sent
+on behalf of a user go ahead of background polling, and the rate is halved
+(and sending paused) whenever the service reports throttling, then slowly
+raised back to the configured ceiling.
+"""
+from contextlib import contextmanager
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# request priorities, lower values are sent first
+PRIORITY_COMMAND = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+# HTTP statuses that mean the service wants fewer requests
+THROTTLED_STATUSES = frozenset([429, 503])
+
+# how often coroutines queued behind another request check their turn, in
+# seconds
+ASYNC_POLL_INTERVAL = 0.01
+
+# a context variable rather than a thread local, so that every asyncio task
+# has a priority of its own
+_priority = contextvars.ContextVar(
+    'wyze_request_priority', default=PRIORITY_NORMAL)
+
+
+def current_priority():
+    """
+    Returns the priority of the requests sent by the current thread or
+    asyncio task.
+    :rtype: ``int``
+    """
+    return _priority.get()
+
+
+@contextmanager
+def request_priority(priority):
+    """
+    Sends the requests made by the current thread or asyncio task within
+    the block with the given priority, e.g. ``PRIORITY_BACKGROUND`` for
+    polling loops. Coroutines must be awaited within the block.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class WyzeRateLimiter(object):
+    """
+    A token bucket for the requests to one service host.
+
+    ``rate`` is the ceiling in requests per second (``None`` for no limit),
+    and ``burst`` how many requests may be sent at once after a quiet
+    period. After each throttled response, sending is paused for an
+    exponentially growing period of up to ``max_backoff`` seconds and the
+    rate is halved; every successful response halves the pause used for
+    the next throttled response, and raises the rate again by a sixteenth
+    of the ceiling.
+
+    Without a ``rate``, requests are only ever delayed while sending is
+    paused after a throttled response, and only then are they ordered by
+    priority.
+    """
+
+    def __init__(self, rate=None, burst=None, max_backoff=60):
+        self._ceiling = float(rate) if rate else None
+        self._rate = self._ceiling
+        self._burst = float(burst or max(1.0, self._ceiling or 1.0))
+        self._tokens = self._burst
+        self._updated_at = time.monotonic()
+        self._max_backoff = float(max_backoff)
+        self._backoff = 0.0
+        self._blocked_until = 0.0
+        self._throttled = 0
+        # (priority, arrival) of the requests waiting for a token
+        self._waiting = []
+        self._arrivals = itertools.count()
+        self._condition = threading.Condition()
+
+    @property
+    def rate(self):
+        """
+        The current rate, in requests per second, or ``None`` if unlimited.
+        :rtype: ``float``
+        """
+        return self._rate
+
+    def stats(self):
+        """
+        Returns the current rate, the configured ceiling, the available
+        tokens, the number of waiting requests, how many responses were
+        throttled and the pause applied after the last one.
+        :rtype: ``dict``
+        """
+        with self._condition:
+            self._refill(time.monotonic())
+            return {
+                'rate': self._rate,
+                'ceiling': self._ceiling,
+                'tokens': self._tokens,
+                'waiting': len(self._waiting),
+                'throttled': self._throttled,
+                'backoff': self._backoff,
+            }
+
+    def _refill(self, now):
+        if self._rate is not None:
+            self._tokens = min(
+                self._burst,
+                self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def ready(self):
+        """
+        Returns whether a request may be sent right away without taking a
+        token, i.e. the rate is unlimited and sending is not paused.
+        :rtype: ``bool``
+        """
+        return (self._rate is None and not self._waiting and
+                time.monotonic() >= self._blocked_until)
+
+    def _delay(self, now):
+        # how long until the first waiting request may be sent
+        wait = self._blocked_until - now
+        if self._rate is not None and self._tokens < 1:
+            wait = max(wait, (1 - self._tokens) / self._rate)
+        return wait
+
+    def _enqueue(self, priority):
+        ticket = (priority, next(self._arrivals))
+        heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _take(self, ticket):
+        """
+        Takes a token for the request of ``ticket`` if it is the first one
+        waiting and may be sent now. Otherwise returns how many seconds it
+        should wait before trying again: until a token is available for the
+        first request, or ``None`` for the requests behind it, which are
+        notified once it was sent.
+        :rtype: ``float``
+        """
+        now = time.monotonic()
+        self._refill(now)
+        wait = self._delay(now)
+        if self._waiting[0] != ticket:
+            return None
+        if wait > 0:
+            return wait
+        if self._rate is not None:
+            self._tokens -= 1
+        return 0.0
+
+    def _dequeue(self, ticket):
+        self._waiting.remove(ticket)
+        heapq.heapify(self._waiting)
+        self._condition.notify_all()
+
+    def acquire(self, priority=PRIORITY_NORMAL):
+        """
+        Blocks until a request with the given priority may be sent, and
+        returns how many seconds that took.
+        :rtype: ``float``
+        """
+        started = time.monotonic()
+        if self.ready():
+            return 0.0
+
+        with self._condition:
+            ticket = self._enqueue(priority)
+            try:
+                while True:
+                    wait = self._take(ticket)
+                    if wait == 0:
+                        break
+                    self._condition.wait(wait)
+            finally:
+                self._dequeue(ticket)
+
+        return time.monotonic() - started
+
+    async def async_acquire(self, priority=PRIORITY_NORMAL):
+        """
+        Like :meth:`acquire`, but waits with ``asyncio.sleep`` instead of
+        blocking the thread. Coroutines and threads waiting for the same
+        limiter are served in the same priority order.
+        :rtype: ``float``
+        """
+        started = time.monotonic()
+        if self.ready():
+            return 0.0
+
+        import asyncio
+
+        with self._condition:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._take(ticket)
+                    if wait is None:
+                        # coroutines cannot wait for the notification, so
+                        # the ones behind the first poll
+                        wait = max(ASYNC_POLL_INTERVAL, self._delay(
+                            time.monotonic()))
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            with self._condition:
+                self._dequeue(ticket)
+
+        return time.monotonic() - started
+
+    def throttled(self):
+        """
+        Reports a throttled response: pauses sending and lowers the rate.
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            self._throttled += 1
+            self._backoff = min(self._max_backoff, self._backoff * 2 or 1.0)
+            self._blocked_until = max(self._blocked_until,
+                                      now + self._backoff)
+            if self._ceiling is not None:
+                self._rate = max(self._ceiling / 16, self._rate / 2)
+                self._tokens = min(self._tokens, 0.0)
+            log.warning('throttled, pausing requests for %.1fs at %s '
+                        'requests/s', self._backoff, self._rate)
+            self._condition.notify_all()
+
+    def succeeded(self):
+        """
+        Reports a successful response, raising the rate back towards the
+        ceiling after throttling.
+        """
+        if not self._backoff and self._rate == self._ceiling:
+            return
+        with self._condition:
+            # the pause shrinks as gradually as it grew, so that a single
+            # success between throttled responses does not reset it
+            self._backoff /= 2
+            if self._backoff < min(1.0, self._max_backoff):
+                self._backoff = 0.0
+            if self._ceiling is not None:
+                self._rate = min(
+                    self._ceiling, self._rate + self._ceiling / 16)
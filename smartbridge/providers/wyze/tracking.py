@@ -0,0 +1,250 @@
+"""
+Live position and path tracking for Wyze robot vacuums
+"""
+from array import array
+from collections import namedtuple
+import logging
+import threading
+
+from smartbridge.interfaces.exceptions import InvalidValueException
+from smartbridge.interfaces.exceptions import ProviderConnectionException
+from smartbridge.interfaces.exceptions import ProviderInternalException
+
+from .robotmap import PathPoint
+from .robotmap import decode_robot_map_blob
+from .throttle import PRIORITY_BACKGROUND
+from .throttle import request_priority
+
+log = logging.getLogger(__name__)
+
+# the most intervals the polling thread waits after consecutive failures
+MAX_BACKOFF_INTERVALS = 16
+
+WyzeVacuumTrack = namedtuple(
+    'WyzeVacuumTrack', 'mac pose points reset robot_map')
+WyzeVacuumTrack.__doc__ = """
+An update delivered to tracker subscribers: the current ``pose``, the path
+``points`` added since the previous update, whether the path was ``reset``
+(e.g. a new cleaning run started), and the ``robot_map`` when it was
+refetched because ``memory_map_update_time`` changed (``None`` otherwise).
+"""
+
+
+class WyzePathBuffer(object):
+    """
+    A fixed-capacity ring buffer of path points. Storage is preallocated as
+    typed arrays, so appending never allocates; once full, the oldest points
+    are overwritten.
+    """
+
+    def __init__(self, capacity=10000):
+        self._capacity = capacity
+        self._updates = array('q', bytes(8 * capacity))
+        self._xs = array('f', bytes(4 * capacity))
+        self._ys = array('f', bytes(4 * capacity))
+        self._next = 0
+        self._count = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def append(self, update, x, y):
+        i = self._next
+        self._updates[i] = update or 0
+        self._xs[i] = x or 0.0
+        self._ys[i] = y or 0.0
+        self._next = (i + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def extend(self, points):
+        for point in points:
+            self.append(point.update, point.x, point.y)
+
+    def points(self):
+        """
+        Returns the buffered points, oldest first.
+        :rtype: ``list`` of :class:`.PathPoint`
+        """
+        start = (self._next - self._count) % self._capacity
+        return [PathPoint(self._updates[i], self._xs[i], self._ys[i])
+                for i in ((start + n) % self._capacity
+                          for n in range(self._count))]
+
+
+class WyzeVacuumTracker(object):
+    """
+    Polls the current position of a vacuum at a fixed interval and delivers
+    path deltas to subscribers.
+
+    Every poll requests the position and ``memory_map_update_time``; the
+    full map is only refetched (and decoded) when that timestamp changes.
+    Subscribers are called on the polling thread with a
+    :class:`WyzeVacuumTrack`.
+    """
+
+    def __init__(self, wyze_client, device_mac, interval=1.0, capacity=10000):
+        self._client = wyze_client
+        self._mac = device_mac
+        self._interval = interval
+        self._path = WyzePathBuffer(capacity)
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self._history_pose_id = None
+        self._history_count = 0
+        self._last_update = None
+        self._map_update_time = None
+        self._robot_map = None
+        self._pose = None
+
+    @property
+    def mac(self):
+        return self._mac
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def path(self):
+        """
+        The buffered path of the vacuum, oldest point first.
+        :rtype: ``list`` of :class:`.PathPoint`
+        """
+        with self._lock:
+            return self._path.points()
+
+    @property
+    def pose(self):
+        return self._pose
+
+    @property
+    def robot_map(self):
+        """
+        The last fetched map.
+        :rtype: :class:`.WyzeRobotMap`
+        """
+        return self._robot_map
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [
+                subscriber for subscriber in self._subscribers
+                if subscriber != callback]
+
+    def start(self):
+        if not self.running:
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='wyze-tracker-{0}'.format(self._mac),
+                daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _run(self):
+        failures = 0
+        while not self._stop_event.is_set():
+            try:
+                with request_priority(PRIORITY_BACKGROUND):
+                    self.poll()
+                failures = 0
+            except (ProviderConnectionException, ProviderInternalException,
+                    InvalidValueException) as e:
+                # service errors are retried, backing off while they last
+                failures += 1
+                log.warning('tracking %s failed: %r', self._mac, e)
+            self._stop_event.wait(self._interval * min(
+                2 ** failures, MAX_BACKOFF_INTERVALS))
+
+    def poll(self):
+        """
+        Polls the vacuum once and notifies subscribers when anything
+        changed.
+        :rtype: :class:`WyzeVacuumTrack`
+        """
+        robot_map = None
+        props = self._client.get_vacuum_props(
+            self._mac, ['memory_map_update_time']) or {}
+        map_update_time = props.get('memory_map_update_time')
+        if map_update_time is None or map_update_time != self._map_update_time:
+            current_map = self._client.get_vacuum_map(self._mac)
+            if current_map and isinstance(current_map.get('map'), str):
+                robot_map = decode_robot_map_blob(current_map['map'])
+                self._robot_map = robot_map
+            self._map_update_time = map_update_time
+
+        position = self._client.get_vacuum_position(self._mac)
+        if position and isinstance(position.get('map'), str):
+            track = self._apply_position(
+                decode_robot_map_blob(position['map']), robot_map)
+        elif robot_map is not None:
+            track = self._apply_position(robot_map, robot_map)
+        else:
+            return None
+
+        if track.points or track.reset or robot_map is not None:
+            for subscriber in self._subscribers:
+                try:
+                    subscriber(track)
+                except Exception as e:
+                    log.exception(e)
+        return track
+
+    def _apply_position(self, position, robot_map):
+        with self._lock:
+            reset = False
+            history = position.history
+            if history or position.history_pose_id is not None:
+                if (position.history_pose_id != self._history_pose_id or
+                        len(history) < self._history_count):
+                    # a new run, or a path we cannot continue from
+                    self._path.clear()
+                    self._history_count = 0
+                    self._history_pose_id = position.history_pose_id
+                    reset = True
+                points = history[self._history_count:]
+                self._history_count = len(history)
+            elif (position.current_pose is not None and
+                    position.current_pose.update != self._last_update):
+                pose = position.current_pose
+                points = [PathPoint(pose.update, pose.x, pose.y)]
+            else:
+                points = []
+
+            self._path.extend(points)
+            if position.current_pose is not None:
+                self._pose = position.current_pose
+                self._last_update = position.current_pose.update
+
+        return WyzeVacuumTrack(self._mac, self._pose, points, reset, robot_map)
@@ -0,0 +1,468 @@
+"""
+HTTP transports used by the Wyze service clients
+
+A transport sends one request and returns the status and the raw body of
+the response; building, signing and parsing requests stays in the service
+clients. Besides the default ``requests`` transport, there is an HTTP/2
+capable ``httpx`` transport, and a pair of transports that record
+exchanges to a file and replay them without any network access.
+"""
+from abc import ABCMeta
+from abc import abstractmethod
+from collections import deque
+from collections import namedtuple
+import functools
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from urllib.parse import parse_qsl
+from urllib.parse import urlsplit
+
+from smartbridge.base.helpers import to_bool
+from smartbridge.interfaces.exceptions import InvalidConfigurationException
+from smartbridge.interfaces.exceptions import ProviderConnectionException
+
+log = logging.getLogger(__name__)
+
+WyzeTransportResponse = namedtuple('WyzeTransportResponse', 'status content')
+WyzeTransportResponse.__doc__ = """
+The HTTP ``status`` and the raw ``content`` (``bytes``) of a response.
+"""
+
+
+def _without_empty_values(headers):
+    return {name: value for name, value in (headers or {}).items()
+            if value is not None}
+
+
+class WyzeTransport(object):
+    """
+    Sends the requests of one service client.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def request(self, method, url, headers, params=None, data=None):
+        """
+        Sends a request and returns the response, raising
+        :class:`.ProviderConnectionException` if no response was received.
+        :rtype: :class:`WyzeTransportResponse`
+        """
+        pass
+
+    @property
+    def session(self):
+        """
+        The ``requests`` session of the transport, or ``None`` if it does
+        not send requests with ``requests``.
+        :rtype: :class:`requests.Session`
+        """
+        return None
+
+    def pool_stats(self):
+        """
+        Returns usage metrics of the connection pools, one entry per
+        connected host.
+        :rtype: ``list`` of ``dict``
+        """
+        return []
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(WyzeTransport):
+    """
+    Sends requests over a pooled ``requests`` session. Only the default
+    ``headers`` are stored on the session, so it can be used from several
+    threads at once.
+    """
+
+    def __init__(self, headers, pool_size, timeout):
+        self._headers = headers
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if not self._session:
+            with self._session_lock:
+                if not self._session:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    session.headers.update(self._headers)
+                    # connections are kept alive and reused for as long as
+                    # the client lives; the pool is sized for the number of
+                    # threads expected to talk to this service at once
+                    adapter = HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self._pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+
+        return self._session
+
+    def request(self, method, url, headers, params=None, data=None):
+        import requests
+
+        session = self.session
+        try:
+            # the request-specific headers are merged into the prepared
+            # request only, so concurrent requests on the same session
+            # cannot see each other's signatures
+            request = session.prepare_request(requests.Request(
+                method, url, params=params, data=data, headers=headers))
+            settings = session.merge_environment_settings(
+                request.url, {}, None, None, None)
+            response = session.send(
+                request, timeout=self._timeout, **settings)
+        except requests.exceptions.RequestException as request_exception:
+            log.exception(request_exception)
+            raise ProviderConnectionException(request_exception)
+
+        return WyzeTransportResponse(response.status_code, response.content)
+
+    def pool_stats(self):
+        """
+        ``connections`` counts the connections that were ever opened, so a
+        value that stays flat while ``requests`` grows means that sockets
+        are being reused.
+        """
+        if not self._session:
+            return []
+
+        stats = []
+        adapters = {id(adapter): adapter
+                    for adapter in self._session.adapters.values()}
+        for adapter in adapters.values():
+            pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+            if pools is None:
+                continue
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats.append({
+                    'host': pool.host,
+                    'maxsize': self._pool_size,
+                    'connections': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle': pool.pool.qsize() if pool.pool is not None else 0,
+                })
+
+        return stats
+
+    def close(self):
+        with self._session_lock:
+            if self._session:
+                self._session.close()
+                self._session = None
+
+
+class HttpxTransport(WyzeTransport):
+    """
+    Sends requests over a pooled ``httpx`` client, multiplexing them over
+    HTTP/2 connections where the server supports it. Requires the ``http2``
+    extra (``httpx`` and ``h2``); without ``h2`` it falls back to HTTP/1.1.
+    """
+
+    def __init__(self, headers, pool_size, timeout, http2=True):
+        self._headers = _without_empty_values(headers)
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._http2 = http2
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if not self._client:
+            with self._client_lock:
+                if not self._client:
+                    import httpx
+
+                    limits = httpx.Limits(
+                        max_connections=self._pool_size,
+                        max_keepalive_connections=self._pool_size)
+                    try:
+                        self._client = httpx.Client(
+                            http2=self._http2, headers=self._headers,
+                            limits=limits, timeout=self._timeout)
+                    except ImportError:
+                        log.warning('h2 is not installed, using HTTP/1.1')
+                        self._client = httpx.Client(
+                            headers=self._headers, limits=limits,
+                            timeout=self._timeout)
+
+        return self._client
+
+    def request(self, method, url, headers, params=None, data=None):
+        import httpx
+
+        try:
+            response = self.client.request(
+                method, url, params=params, content=data,
+                headers=_without_empty_values(headers))
+        except httpx.HTTPError as request_exception:
+            log.exception(request_exception)
+            raise ProviderConnectionException(request_exception)
+
+        return WyzeTransportResponse(response.status_code, response.content)
+
+    def close(self):
+        with self._client_lock:
+            if self._client:
+                self._client.close()
+                self._client = None
+
+
+# request fields that change with every request (or every login) and are
+# left out when matching a request with a recorded one
+VOLATILE_FIELDS = frozenset([
+    'nonce', 'ts', 'logTime', 'access_token', 'refresh_token', 'phone_id',
+    'deviceId', 'password', 'app_ver', 'app_version', 'appVersion',
+])
+
+
+# response fields that are replaced before a response is recorded
+SECRET_FIELDS = frozenset(['access_token', 'refresh_token'])
+SCRUBBED = 'scrubbed'
+
+
+def _scrubbed(value):
+    if isinstance(value, dict):
+        return {name: SCRUBBED if name in SECRET_FIELDS and field else
+                _scrubbed(field) for name, field in value.items()}
+    if isinstance(value, list):
+        return [_scrubbed(item) for item in value]
+    return value
+
+
+def scrub_secrets(content):
+    """
+    Replaces the values of the ``SECRET_FIELDS`` in a JSON response body.
+    Other bodies are returned unchanged.
+    :rtype: ``bytes``
+    """
+    try:
+        body = json.loads(content)
+    except ValueError:
+        return content
+    scrubbed = _scrubbed(body)
+    if scrubbed == body:
+        return content
+    return json.dumps(scrubbed, separators=(',', ':')).encode('utf-8')
+
+
+def exchange_key(method, url, params=None, data=None):
+    """
+    Returns the key that a request is recorded and replayed under: the
+    method and path and a digest of the request fields, except for the
+    ``VOLATILE_FIELDS``. The host is not part of the key, so a recording
+    can be replayed against any endpoint configuration.
+    :rtype: ``str``
+    """
+    url = urlsplit(url)
+    fields = dict(parse_qsl(url.query, keep_blank_values=True))
+    fields.update(params or {})
+    if data:
+        try:
+            body = json.loads(data)
+        except ValueError:
+            body = None
+        if isinstance(body, dict):
+            fields.update(body)
+        else:
+            fields['body'] = hashlib.md5(data).hexdigest()
+    stable = json.dumps(
+        {name: value for name, value in fields.items()
+         if name not in VOLATILE_FIELDS},
+        sort_keys=True, separators=(',', ':'), default=str)
+    return '{0} {1} {2}'.format(
+        method, url.path,
+        hashlib.blake2b(stable.encode('utf-8'), digest_size=8).hexdigest())
+
+
+class WyzeRecording(object):
+    """
+    A file of recorded exchanges, one JSON line per response, gzip
+    compressed if the path ends with ``.gz``. Response bodies are recorded
+    as they were received, except that access and refresh tokens are
+    scrubbed (see ``SECRET_FIELDS``). Other personal data, like device
+    names, addresses and maps, is kept.
+
+    Exchanges are written through one file handle, opened on the first one
+    and kept until ``close()``; a gzip recording gets one member per handle.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._exchanges = None
+        self._file = None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def for_path(path):
+        """
+        Returns the recording shared by every transport using ``path``.
+        :rtype: :class:`.WyzeRecording`
+        """
+        return WyzeRecording(path)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def compressed(self):
+        return self._path.endswith('.gz')
+
+    def _open(self, mode):
+        if self.compressed:
+            return gzip.open(self._path, mode + 't', encoding='utf-8')
+        return open(self._path, mode, encoding='utf-8')
+
+    def add(self, key, response):
+        line = json.dumps({
+            'k': key,
+            's': response.status,
+            'b': scrub_secrets(response.content).decode(
+                'utf-8', 'surrogateescape'),
+        }, separators=(',', ':'))
+        with self._lock:
+            if self._file is None:
+                self._file = self._open('a')
+            self._file.write(line + '\n')
+            if not self.compressed:
+                # a plain recording stays readable if the process dies;
+                # flushing a gzip stream would cost compression instead
+                self._file.flush()
+            self._exchanges = None
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """
+        Closes the file handle, if any. Later exchanges open a new one.
+        """
+        with self._lock:
+            self._close()
+
+    def exchanges(self):
+        """
+        Returns the recorded responses in the order they were recorded,
+        keyed by request.
+        :rtype: ``dict`` of ``list`` of :class:`WyzeTransportResponse`
+        """
+        with self._lock:
+            if self._exchanges is None:
+                # the pending gzip member can only be read once it is closed
+                self._close()
+                exchanges = {}
+                with self._open('r') as f:
+                    for line in f:
+                        exchange = json.loads(line)
+                        exchanges.setdefault(exchange['k'], []).append(
+                            WyzeTransportResponse(exchange['s'], exchange['b'].encode(
+                                'utf-8', 'surrogateescape')))
+                self._exchanges = exchanges
+            return self._exchanges
+
+
+class RecordingTransport(WyzeTransport):
+    """
+    Sends requests with another transport and records every response.
+    """
+
+    def __init__(self, transport, recording):
+        self._transport = transport
+        self._recording = recording
+
+    @property
+    def session(self):
+        return self._transport.session
+
+    def request(self, method, url, headers, params=None, data=None):
+        response = self._transport.request(method, url, headers, params, data)
+        self._recording.add(exchange_key(method, url, params, data), response)
+        return response
+
+    def pool_stats(self):
+        return self._transport.pool_stats()
+
+    def close(self):
+        self._transport.close()
+        self._recording.close()
+
+
+class ReplayTransport(WyzeTransport):
+    """
+    Answers requests from a recording, without any network access.
+    Responses to matching requests are returned in the order they were
+    recorded; with ``loop``, they start over once all were returned,
+    otherwise running out of responses is a connection error.
+    """
+
+    def __init__(self, recording, loop=False):
+        self._recording = recording
+        self._loop = loop
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, headers, params=None, data=None):
+        key = exchange_key(method, url, params, data)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque(
+                    self._recording.exchanges().get(key, ()))
+            if not queue:
+                raise ProviderConnectionException(
+                    'no recorded response for {0} {1}'.format(method, url))
+            response = queue.popleft()
+            if self._loop:
+                queue.append(response)
+        return response
+
+
+TRANSPORTS = {
+    'requests': RequestsTransport,
+    'httpx': HttpxTransport,
+}
+
+
+def create_transport(config, headers, pool_size, timeout):
+    """
+    Creates the transport selected by the ``transport`` (``requests`` or
+    ``httpx``), ``record_path``, ``replay_path`` and ``replay_loop`` values
+    of a client configuration.
+    :rtype: :class:`WyzeTransport`
+    """
+    replay_path = config.get('replay_path')
+    if replay_path:
+        return ReplayTransport(
+            WyzeRecording.for_path(replay_path),
+            loop=to_bool(config.get('replay_loop', False)))
+
+    name = config.get('transport') or 'requests'
+    if name not in TRANSPORTS:
+        raise InvalidConfigurationException(
+            'Unknown transport {0}, expected one of {1}'.format(
+                name, ', '.join(sorted(TRANSPORTS))))
+    transport = TRANSPORTS[name](headers, pool_size, timeout)
+
+    record_path = config.get('record_path')
+    if record_path:
+        transport = RecordingTransport(
+            transport, WyzeRecording.for_path(record_path))
+    return transport
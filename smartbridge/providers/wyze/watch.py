@@ -0,0 +1,256 @@
+"""
+Polling and change detection for the state of Wyze devices
+"""
+from collections import namedtuple
+from types import MappingProxyType
+import logging
+import threading
+import time
+
+from smartbridge.interfaces.exceptions import InvalidValueException
+from smartbridge.interfaces.exceptions import ProviderConnectionException
+from smartbridge.interfaces.exceptions import ProviderInternalException
+
+from .devices import DeviceModels
+from .devices import WyzeBulb
+from .devices import WyzeContactSensor
+from .devices import WyzeMotionSensor
+from .devices import WyzePlug
+from .throttle import PRIORITY_BACKGROUND
+from .throttle import request_priority
+
+log = logging.getLogger(__name__)
+
+WyzeDeviceChange = namedtuple(
+    'WyzeDeviceChange', 'mac device_class changes added removed')
+WyzeDeviceChange.__doc__ = """
+An update delivered to watcher subscribers: the ``changes`` of one device,
+as a ``dict`` of property name to ``(old value, new value)``. A device seen
+for the first time is ``added`` (with every property changing from
+``None``); a device that left the device list is ``removed``.
+"""
+
+# the device types that are watched, with the class whose props() map their
+# property names to PIDs
+WATCHED_DEVICE_TYPES = (
+    (DeviceModels.BULB, WyzeBulb),
+    (DeviceModels.PLUG, WyzePlug),
+    (DeviceModels.CONTACT_SENSOR, WyzeContactSensor),
+    (DeviceModels.MOTION_SENSOR, WyzeMotionSensor),
+)
+
+# seconds between polls of a property; properties that are not listed are
+# polled at the watcher's default interval
+DEFAULT_WATCH_INTERVALS = MappingProxyType({
+    'open_close_state': 2,
+    'motion_state': 2,
+    'switch_state': 10,
+    'available': 60,
+    'rssi': 300,
+    'voltage': 300,
+})
+
+
+class _WatchLane(object):
+    """
+    The properties of one device type that are polled at the same interval.
+    """
+
+    def __init__(self, device_class, models, interval, pids):
+        self.device_class = device_class
+        self.models = models
+        self.interval = interval
+        self.pids = pids
+        self.due = 0.0
+
+
+class WyzeDeviceWatcher(object):
+    """
+    Polls the state of bulbs, plugs and sensors and notifies subscribers of
+    the properties that changed.
+
+    Properties are polled at intervals of their own (see
+    ``DEFAULT_WATCH_INTERVALS``), so that e.g. contact and motion states are
+    checked every couple of seconds while signal strength is checked every
+    few minutes. Each poll only requests the PIDs that are due, for all of
+    the devices of a type at once, in ``property_list_chunk_size`` batches.
+    The device list is refetched every ``device_list_interval`` seconds.
+    Subscribers are called on the polling thread with a
+    :class:`WyzeDeviceChange` per changed device. Failed polls are logged
+    and retried when the properties are next due.
+    """
+
+    def __init__(self, wyze_client, interval=30, intervals=None,
+                 device_list_interval=300):
+        self._client = wyze_client
+        self._interval = interval
+        self._intervals = dict(DEFAULT_WATCH_INTERVALS, **(intervals or {}))
+        self._device_list_interval = device_list_interval
+        self._device_list_due = 0.0
+        self._lanes = self._create_lanes()
+        # mac -> (device class, last seen property values)
+        self._devices = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _create_lanes(self):
+        lanes = []
+        for models, device_class in WATCHED_DEVICE_TYPES:
+            by_interval = {}
+            for name, prop in device_class.props().items():
+                if name:
+                    interval = self._intervals.get(name, self._interval)
+                    by_interval.setdefault(interval, []).append(prop[0])
+            for interval, pids in sorted(by_interval.items()):
+                lanes.append(_WatchLane(
+                    device_class, models, float(interval), tuple(pids)))
+        return lanes
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def state(self, mac):
+        """
+        Returns the last seen properties of a device.
+        :rtype: ``dict``
+        """
+        with self._lock:
+            return dict(self._devices.get(mac, (None, {}))[1])
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [
+                subscriber for subscriber in self._subscribers
+                if subscriber != callback]
+
+    def start(self):
+        if not self.running:
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='wyze-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _next_due(self):
+        return min([self._device_list_due] +
+                   [lane.due for lane in self._lanes])
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                with request_priority(PRIORITY_BACKGROUND):
+                    self.poll()
+            except Exception as e:
+                # the polling thread outlives any failure
+                log.exception(e)
+            self._stop_event.wait(
+                max(0.0, self._next_due() - time.monotonic()))
+
+    def poll(self, force=False):
+        """
+        Polls the properties that are due (all of them with ``force``) and
+        notifies subscribers of the devices that changed.
+        :rtype: ``list`` of :class:`WyzeDeviceChange`
+        """
+        now = time.monotonic()
+        if force or now >= self._device_list_due:
+            self._device_list_due = now + self._device_list_interval
+            try:
+                # refreshed in place, other users of the device list keep
+                # the cached one until the new one is loaded
+                self._client.refresh_device_list()
+            except (ProviderConnectionException, ProviderInternalException,
+                    InvalidValueException) as e:
+                log.warning('refreshing the device list failed: %r', e)
+
+        changes = []
+        seen = set()
+        for models, device_class in WATCHED_DEVICE_TYPES:
+            lanes = [lane for lane in self._lanes
+                     if lane.models is models and (force or now >= lane.due)]
+            try:
+                devices = self._client.devices.list(models)
+                seen.update(device['mac'] for device in devices)
+                if lanes and devices:
+                    changes.extend(self._poll_devices(
+                        device_class, devices,
+                        [pid for lane in lanes for pid in lane.pids]))
+            except (ProviderConnectionException, ProviderInternalException,
+                    InvalidValueException) as e:
+                log.warning('watching %s failed: %r',
+                            device_class.__name__, e)
+                seen.update(mac for mac, (known_class, _) in
+                            list(self._devices.items())
+                            if known_class is device_class)
+            for lane in lanes:
+                lane.due = now + lane.interval
+
+        with self._lock:
+            for mac, (device_class, _) in list(self._devices.items()):
+                if mac not in seen:
+                    del self._devices[mac]
+                    changes.append(
+                        WyzeDeviceChange(mac, device_class, {}, False, True))
+
+        for change in changes:
+            for subscriber in self._subscribers:
+                try:
+                    subscriber(change)
+                except Exception as e:
+                    log.exception(e)
+        return changes
+
+    def _poll_devices(self, device_class, devices, pids):
+        new_devices = [device for device in devices
+                       if device['mac'] not in self._devices]
+        known_devices = [device for device in devices
+                         if device['mac'] in self._devices]
+
+        fetched = []
+        if new_devices:
+            # devices seen for the first time get all of their properties
+            fetched.extend(self._client.get_device_list_properties(
+                new_devices, device_class.pids()))
+        if known_devices:
+            fetched.extend(self._client.get_device_list_properties(
+                known_devices, pids))
+
+        pid_names = device_class.pid_names()
+        changes = []
+        with self._lock:
+            for device in fetched:
+                mac = device['mac']
+                added = mac not in self._devices
+                state = self._devices.setdefault(mac, (device_class, {}))[1]
+                changed = {}
+                for entry in device['data']['property_list']:
+                    name = pid_names.get(entry['pid'])
+                    if not name:
+                        continue
+                    old_value = state.get(name)
+                    if added or old_value != entry['value']:
+                        changed[name] = (old_value, entry['value'])
+                        state[name] = entry['value']
+                if changed or added:
+                    changes.append(WyzeDeviceChange(
+                        mac, device_class, changed, added, False))
+        return changes
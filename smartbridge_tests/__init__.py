@@ -1,5 +1,9 @@
 import unittest
 from .wyze_provider_tests import *
+from .wyze_client_tests import *
+from .mock_provider_tests import *
+from .import_tests import *
+from .config_tests import *
 from os.path import join, dirname
 from dotenv import load_dotenv
 
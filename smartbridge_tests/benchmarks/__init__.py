@@ -0,0 +1,11 @@
+"""
+Micro-benchmarks for the provider hot paths. These are not part of the test
+suite; run a benchmark module directly, e.g.::
+
+    python -m smartbridge_tests.benchmarks.signing_benchmark
+
+or run all of them and save the results for comparison with a later run::
+
+    python -m smartbridge_tests.benchmarks --output before.json
+    python -m smartbridge_tests.benchmarks --compare before.json
+"""
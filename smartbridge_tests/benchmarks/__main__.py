@@ -0,0 +1,116 @@
+"""
+Runs every benchmark, saves the results as JSON and optionally compares
+them with the results of an earlier run (e.g. of the previous release)::
+
+    python -m smartbridge_tests.benchmarks --compare 0.0.1.json
+
+The exit status is 1 if any benchmark got slower than ``--threshold``
+times its baseline.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import platform
+import sys
+
+import smartbridge
+
+MODULES = (
+    'signing_benchmark',
+    'map_decode_benchmark',
+    'provider_benchmark',
+    'transport_benchmark',
+)
+
+
+def run_all(modules=MODULES, repeat=3):
+    """
+    Runs the given benchmark modules.
+    :rtype: ``dict``
+    """
+    benchmarks = {}
+    for name in modules:
+        module = importlib.import_module(
+            '{0}.{1}'.format(__package__, name))
+        benchmarks[name] = {
+            'unit': module.UNIT,
+            'results': module.run(repeat=repeat),
+        }
+    return {
+        'version': smartbridge.get_version(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'benchmarks': benchmarks,
+    }
+
+
+def compare(baseline, current, threshold=1.2):
+    """
+    Returns ``(module, benchmark, baseline, current, ratio)`` for every
+    benchmark found in both runs, and whether any ratio exceeds
+    ``threshold``.
+    """
+    rows = []
+    regressed = False
+    for module, entry in current['benchmarks'].items():
+        old_entry = baseline['benchmarks'].get(module)
+        if old_entry is None or old_entry['unit'] != entry['unit']:
+            continue
+        for name, value in entry['results'].items():
+            old_value = old_entry['results'].get(name)
+            if not old_value:
+                continue
+            ratio = value / old_value
+            regressed = regressed or ratio > threshold
+            rows.append((module, name, old_value, value, ratio))
+    return rows, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m smartbridge_tests.benchmarks')
+    parser.add_argument(
+        '-o', '--output',
+        help='where to save the results (default: <version>.json)')
+    parser.add_argument(
+        '-c', '--compare', help='results of an earlier run to compare with')
+    parser.add_argument(
+        '-t', '--threshold', type=float, default=1.2,
+        help='slowdown ratio reported as a regression (default: 1.2)')
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=3,
+        help='measurements per benchmark, the best one is kept')
+    parser.add_argument(
+        'modules', nargs='*', default=list(MODULES),
+        help='benchmark modules to run (default: all)')
+    args = parser.parse_args(argv)
+
+    current = run_all(args.modules, args.repeat)
+    for module, entry in current['benchmarks'].items():
+        for name, value in entry['results'].items():
+            print('{0:<22} {1:<42} {2:12.3f} {3}'.format(
+                module, name, value, entry['unit']))
+
+    output = args.output or '{0}.json'.format(current['version'])
+    with open(output, 'w') as f:
+        json.dump(current, f, indent=2, sort_keys=True)
+    print('saved results to {0}'.format(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressed = compare(baseline, current, args.threshold)
+        print('\ncompared with {0} ({1}):'.format(
+            baseline.get('version'), args.compare))
+        for module, name, old_value, value, ratio in rows:
+            print('{0:<22} {1:<42} {2:12.3f} -> {3:12.3f} {4:6.2f}x{5}'.format(
+                module, name, old_value, value, ratio,
+                '  REGRESSION' if ratio > args.threshold else ''))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Compares decoding a vacuum map with the schema-specific decoder against the
+generic blackboxprotobuf decoder it replaced (when that is installed).
+"""
+import copy
+import json
+import struct
+import timeit
+
+from smartbridge.providers.wyze.devices import WyzeVacuum
+from smartbridge.providers.wyze.robotmap import decode_robot_map
+
+try:
+    import blackboxprotobuf
+except ImportError:
+    blackboxprotobuf = None
+
+UNIT = 'msec/map'
+
+
+def _varint(value):
+    value &= (1 << 64) - 1
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _field(number, value):
+    if isinstance(value, float):
+        return _varint(number << 3 | 5) + struct.pack('<f', value)
+    if isinstance(value, int):
+        return _varint(number << 3) + _varint(value)
+    if isinstance(value, list):
+        value = b''.join(value)
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def sample_map(size=400, history=5000, rooms=8):
+    """
+    Returns the encoded bytes of a map with a ``size`` x ``size`` grid,
+    ``history`` path points and ``rooms`` rooms.
+    """
+    grid = bytes(i % 3 * 127 for i in range(size * size))
+    matrix = bytes(i * rooms // (size * size) + 1 for i in range(size * size))
+    return b''.join([
+        _field(1, 1),
+        _field(3, [_field(1, 1), _field(2, size), _field(3, size),
+                   _field(4, -10.0), _field(5, -10.0), _field(6, 10.0),
+                   _field(7, 10.0), _field(8, 0.05)]),
+        _field(4, [_field(1, grid)]),
+        _field(6, [_field(1, 1)] + [
+            _field(2, [_field(1, i), _field(2, i * 0.001), _field(3, -i * 0.001)])
+            for i in range(history)]),
+        _field(8, [_field(1, 1), _field(2, 1), _field(3, 0.5),
+                   _field(4, 0.5), _field(5, 0.0)]),
+    ] + [
+        _field(12, [_field(1, room + 1), _field(2, b'Room %d' % room),
+                    _field(5, 0), _field(6, 1)])
+        for room in range(rooms)
+    ] + [
+        _field(13, [_field(1, matrix)]),
+    ])
+
+
+def run(number=5, repeat=3):
+    """
+    Returns the best time per decode, in milliseconds, for each decoder.
+    """
+    message = sample_map()
+    benchmarks = {'decode_robot_map': lambda: decode_robot_map(message)}
+
+    if blackboxprotobuf is not None:
+        typedef = copy.deepcopy(WyzeVacuum._robot_map_proto)
+        blackboxprotobuf.known_messages['robot_map'] = typedef
+
+        benchmarks['blackboxprotobuf.decode_message'] = (
+            lambda: blackboxprotobuf.decode_message(message, 'robot_map'))
+        benchmarks['blackboxprotobuf.protobuf_to_json'] = (
+            lambda: json.loads(blackboxprotobuf.protobuf_to_json(
+                message, 'robot_map')[0]))
+
+    return {name: min(timeit.repeat(
+        benchmark, number=number, repeat=repeat)) / number * 1e3
+        for name, benchmark in benchmarks.items()}
+
+
+if __name__ == '__main__':
+    for name, msec in run().items():
+        print('{0:<36} {1:8.2f} {2}'.format(name, msec, UNIT))
@@ -0,0 +1,88 @@
+"""
+Measures the provider hot paths end to end against a local Wyze stand-in
+server, so the numbers include request building, signing, parsing and
+object construction but no internet round trips.
+"""
+import timeit
+
+from smartbridge.providers.mock import MockWyzeProvider
+from smartbridge.providers.mock.fleet import WyzeFleet
+from smartbridge.providers.mock.fleet import encode_map_blob
+from smartbridge.providers.mock.fleet import synthetic_map
+from smartbridge.providers.mock.server import WyzeStandInServer
+from smartbridge.providers.wyze.devices import WyzeBulb
+from smartbridge.providers.wyze.devices import WyzeVacuum
+from smartbridge.providers.wyze.devices import _decoded_maps
+
+UNIT = 'usec/call'
+
+MESSAGE = (b'{"cmd":"set_mode","did":"JA_RO2_ABCDEF","model":"JA_RO2",'
+           b'"is_sub_device":false,"params":{"type":0,"value":1},'
+           b'"nonce":"1614006488650"}')
+
+
+def _benchmarks(provider, map_blob):
+    client = provider.wyze_client
+    bulbs = provider.bulb.list()
+    bulb = provider.bulb.get(bulbs[0].mac)
+    vacuum = WyzeVacuum(provider, {})
+    venus_client = client.venus_client
+
+    def list_devices():
+        client.invalidate_device_list()
+        return client.list_devices()
+
+    def parse_map():
+        # every call decodes, rather than hitting the map cache
+        _decoded_maps.clear()
+        return vacuum.parse_map(map_blob)
+
+    # (name, function, calls per measurement)
+    return [
+        ('WyzeClient.list_devices', list_devices, 20),
+        ('WyzeClient.list_devices (cached)', client.list_devices, 2000),
+        ('WyzeBulbService.list', provider.bulb.list, 500),
+        ('WyzeBulbService.list (with properties)',
+         lambda: provider.bulb.list(with_properties=True), 10),
+        ('WyzeClient.get_bulb',
+         lambda: client.get_bulb(bulb.mac, WyzeBulb.pids()), 50),
+        ('WyzeBulb._get_property',
+         lambda: bulb._get_property('brightness'), 100000),
+        ('dynamic_signature',
+         lambda: venus_client.dynamic_signature(MESSAGE), 100000),
+        ('WyzeVacuum.parse_map', parse_map, 5),
+        ('WyzeVacuum.parse_map (cached)',
+         lambda: vacuum.parse_map(map_blob), 2000),
+        ('BaseDevice.to_json', bulb.to_json, 2000),
+    ]
+
+
+def run(repeat=3, fleet_size=100, scale=1.0):
+    """
+    Returns the best time per call, in microseconds, of each hot path
+    against a stand-in account with ``fleet_size`` bulbs, plugs and sensors
+    of each kind. ``scale`` multiplies the number of calls measured.
+    """
+    fleet = WyzeFleet(bulbs=fleet_size, plugs=fleet_size,
+                      contact_sensors=fleet_size, motion_sensors=fleet_size,
+                      vacuums=1, sweep_records=0)
+    map_blob = encode_map_blob(synthetic_map(size=400, rooms=8, history=5000))
+
+    with WyzeStandInServer(fleet=fleet) as server:
+        provider = MockWyzeProvider({
+            'mock_server_url': server.url,
+            'wyze_property_list_chunk_size': 50})
+        try:
+            results = {}
+            for name, benchmark, number in _benchmarks(provider, map_blob):
+                number = max(1, int(number * scale))
+                results[name] = min(timeit.repeat(
+                    benchmark, number=number, repeat=repeat)) / number * 1e6
+            return results
+        finally:
+            provider.tearDownMock()
+
+
+if __name__ == '__main__':
+    for name, usec in run().items():
+        print('{0:<42} {1:12.3f} {2}'.format(name, usec, UNIT))
@@ -0,0 +1,57 @@
+"""
+Measures the per-request cost of signing a Wyze wpk request.
+"""
+import hmac
+import timeit
+from hashlib import md5
+
+from smartbridge.base.helpers import md5_string
+from smartbridge.providers.wyze.client import WyzeVenusServiceClient
+
+UNIT = 'usec/request'
+
+ACCESS_TOKEN = 'lvtx.' + 'x' * 400
+MESSAGE = (b'{"cmd":"set_mode","did":"JA_RO2_ABCDEF","model":"JA_RO2",'
+           b'"is_sub_device":false,"params":{"type":0,"value":1},'
+           b'"nonce":"1614006488650"}')
+
+
+def _unprepared_signature(client, message):
+    # the signing path before the key was cached per access token
+    _signing_key = md5_string(
+        ACCESS_TOKEN + WyzeVenusServiceClient.SALTS[client.app_id])
+    return hmac.new(
+        _signing_key.encode('utf-8'),
+        msg=message,
+        digestmod=md5).hexdigest()
+
+
+def _unprepared_request_id(nonce):
+    return md5_string(md5_string(nonce))
+
+
+def run(number=100000, repeat=5):
+    """
+    Returns the best time per call, in microseconds, for each signing step.
+    """
+    client = WyzeVenusServiceClient({}, ACCESS_TOKEN)
+    assert client.dynamic_signature(MESSAGE) == _unprepared_signature(
+        client, MESSAGE)
+
+    benchmarks = {
+        'dynamic_signature (uncached key)':
+            lambda: _unprepared_signature(client, MESSAGE),
+        'dynamic_signature': lambda: client.dynamic_signature(MESSAGE),
+        'request_id (string helpers)':
+            lambda: _unprepared_request_id('1614006488650'),
+        'request_id': lambda: client.request_id('1614006488650'),
+    }
+
+    return {name: min(timeit.repeat(
+        benchmark, number=number, repeat=repeat)) / number * 1e6
+        for name, benchmark in benchmarks.items()}
+
+
+if __name__ == '__main__':
+    for name, usec in run().items():
+        print('{0:<36} {1:8.3f} {2}'.format(name, usec, UNIT))
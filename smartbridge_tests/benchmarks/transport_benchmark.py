@@ -0,0 +1,84 @@
+"""
+Compares the transports on the same requests against a local Wyze stand-in
+server, and on a replay of them, which measures the client without any
+network costs.
+"""
+import os
+import shutil
+import tempfile
+import timeit
+
+from smartbridge.providers.mock import MockWyzeProvider
+from smartbridge.providers.mock.fleet import WyzeFleet
+from smartbridge.providers.mock.server import WyzeStandInServer
+from smartbridge.providers.wyze.devices import WyzeBulb
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+UNIT = 'usec/call'
+
+
+def _benchmarks(provider, number):
+    client = provider.wyze_client
+    mac = provider.bulb.list()[0].mac
+    return {
+        'get_bulb': (lambda: client.get_bulb(mac, WyzeBulb.pids()), number),
+        'list_bulbs (with properties)': (
+            lambda: provider.bulb.list(with_properties=True),
+            max(1, number // 10)),
+    }
+
+
+def _record(server, recording):
+    # a separate pass, so the timed transports run with the same config
+    provider = MockWyzeProvider({'mock_server_url': server.url,
+                                 'wyze_record_path': recording})
+    for function, _ in _benchmarks(provider, 1).values():
+        function()
+    provider.tearDownMock()
+
+
+def _measure(provider, name, repeat, number, results):
+    for benchmark, (function, calls) in _benchmarks(provider, number).items():
+        results['{0} ({1})'.format(benchmark, name)] = min(timeit.repeat(
+            function, number=calls, repeat=repeat)) / calls * 1e6
+
+
+def run(repeat=3, fleet_size=100, number=100):
+    """
+    Returns the best time per call, in microseconds, of the same requests
+    sent with every available transport.
+    """
+    fleet = WyzeFleet(bulbs=fleet_size, plugs=0, contact_sensors=0,
+                      motion_sensors=0, vacuums=0)
+    directory = tempfile.mkdtemp()
+    recording = os.path.join(directory, 'recording.jsonl')
+    transports = ['requests'] + (['httpx'] if httpx is not None else [])
+
+    results = {}
+    try:
+        with WyzeStandInServer(fleet=fleet) as server:
+            _record(server, recording)
+            for transport in transports:
+                provider = MockWyzeProvider({'mock_server_url': server.url,
+                                             'wyze_transport': transport})
+                _measure(provider, transport, repeat, number, results)
+                provider.tearDownMock()
+
+        provider = MockWyzeProvider({
+            'mock_server_url': 'http://127.0.0.1:9',
+            'wyze_replay_path': recording,
+            'wyze_replay_loop': True})
+        _measure(provider, 'replay', repeat, number, results)
+        provider.tearDownMock()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+if __name__ == '__main__':
+    for name, usec in run().items():
+        print('{0:<42} {1:12.3f} {2}'.format(name, usec, UNIT))
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from smartbridge.base import provider as base_provider
+from smartbridge.base.provider import SmartbridgeConfigFiles
+from smartbridge.factory import ProviderFactory
+from smartbridge.factory import ProviderList
+
+
+class TestConfigFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'smartbridge.ini')
+        self._write('wyze_app_name = from-file\nwyze_max_workers = 3\n')
+        self.config_files = SmartbridgeConfigFiles(
+            [self.path, os.path.join(self.directory, 'missing')],
+            check_interval=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, options, mtime=None):
+        with open(self.path, 'w') as f:
+            f.write('[wyze]\n' + options)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_reloads_changed_files(self):
+        self.assertEqual(
+            self.config_files.section('wyze')['wyze_app_name'], 'from-file')
+        self.assertEqual(self.config_files.section('other'), {})
+
+        self._write('wyze_app_name = changed\n', mtime=1000000000)
+        self.assertEqual(
+            self.config_files.section('wyze')['wyze_app_name'], 'changed')
+
+    def test_checks_files_at_interval(self):
+        config_files = SmartbridgeConfigFiles([self.path], check_interval=60)
+        config_files.section('wyze')
+        self._write('wyze_app_name = changed\n', mtime=1000000000)
+        self.assertEqual(
+            config_files.section('wyze')['wyze_app_name'], 'from-file')
+        config_files.reload()
+        self.assertEqual(
+            config_files.section('wyze')['wyze_app_name'], 'changed')
+
+    def test_effective_config(self):
+        with mock.patch.object(
+                base_provider, 'config_files', self.config_files):
+            provider = ProviderFactory().create_provider(
+                ProviderList.WYZE, {'wyze_max_workers': 5, 'user_id': ''})
+        self.assertEqual(provider.app_name, 'from-file')
+        self.assertEqual(provider.max_workers, 5)
+        self.assertIsNone(provider.user_id)
+        with self.assertRaises(TypeError):
+            provider._effective_config['wyze_app_name'] = 'other'
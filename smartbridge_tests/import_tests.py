@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from smartbridge.factory import PROVIDER_MANIFEST
+from smartbridge.factory import ProviderFactory
+from smartbridge.factory import ProviderList
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = ("from smartbridge.factory import ProviderFactory; "
+           "ProviderFactory().create_provider('wyze', {})")
+
+# modules that creating a provider must not import; they are only needed
+# once the provider talks to a service (or decodes maps)
+DEFERRED = ('requests', 'asyncio', 'aiohttp', 'httpx', 'numpy',
+            'blackboxprotobuf', 'smartbridge.providers.mock',
+            'smartbridge.providers.wyze.client')
+
+
+def import_times(code):
+    """
+    Runs ``code`` in a fresh interpreter and returns the cumulative import
+    time, in microseconds, of every imported module, and whether it was
+    imported by another module.
+    :rtype: ``dict`` of ``tuple``
+    """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, stderr=subprocess.PIPE, check=True,
+        universal_newlines=True).stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nested imports are indented, and already part of the cumulative
+        # time of the import that triggered them
+        times[name.strip()] = (int(cumulative), name.startswith('  '))
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_deferred_imports(self):
+        imported = import_times(STARTUP)
+        for name in DEFERRED:
+            self.assertNotIn(name, imported)
+
+    def test_imported_on_first_use(self):
+        imported = import_times(
+            STARTUP.replace("create_provider('wyze', {})",
+                            "create_provider('wyze', {}).wyze_client"))
+        self.assertIn('smartbridge.providers.wyze.client', imported)
+        self.assertNotIn('smartbridge.providers.mock', imported)
+
+    @unittest.skipUnless(os.environ.get('SMARTBRIDGE_IMPORT_BUDGET_MS'),
+                         'set SMARTBRIDGE_IMPORT_BUDGET_MS to check the '
+                         'startup time')
+    def test_startup_budget(self):
+        # wall-clock time depends on the machine and its load, so the
+        # budget is only checked on request
+        budget = float(os.environ['SMARTBRIDGE_IMPORT_BUDGET_MS']) * 1000
+        imported = import_times(STARTUP)
+        spent = sum(value for name, (value, nested) in imported.items()
+                    if name.startswith('smartbridge') and not nested)
+        self.assertLess(spent, budget)
+
+
+class TestProviderManifest(unittest.TestCase):
+
+    def test_manifest_matches_providers(self):
+        factory = ProviderFactory()
+        for provider_id in PROVIDER_MANIFEST:
+            cls = factory.get_provider_class(provider_id)
+            self.assertEqual(cls.PROVIDER_ID, provider_id)
+        self.assertEqual(
+            set(factory.list_providers()), set(PROVIDER_MANIFEST))
+
+    def test_register_provider_path(self):
+        factory = ProviderFactory()
+        factory.register_provider_path(
+            'broken', 'smartbridge.providers.missing:MissingProvider')
+        self.assertIsNone(factory.get_provider_class('broken'))
+        self.assertIsNone(factory.get_provider_class('unknown'))
+        self.assertIsNotNone(factory.get_provider_class(ProviderList.WYZE))
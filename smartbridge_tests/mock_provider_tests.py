@@ -0,0 +1,583 @@
+import asyncio
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from smartbridge.factory import ProviderFactory
+from smartbridge.factory import ProviderList
+from smartbridge.interfaces import InvalidConfigurationException
+from smartbridge.interfaces.devices import VacuumMode
+from smartbridge.interfaces.exceptions import ProviderConnectionException
+from smartbridge.interfaces.exceptions import ProviderInternalException
+from smartbridge.providers.mock import MockWyzeProvider
+from smartbridge.providers.mock.fleet import WyzeFleet
+from smartbridge.providers.mock.server import WyzeStandInServer
+from smartbridge.providers.wyze.client import WyzeRequestSigner
+from smartbridge.providers.wyze.devices import WyzeBulb
+from smartbridge.providers.wyze.devices import WyzeContactSensor
+from smartbridge.providers.wyze.watch import WyzeDeviceWatcher
+from smartbridge.providers.wyze.transport import SCRUBBED
+from smartbridge.providers.wyze.transport import WyzeRecording
+from smartbridge.providers.wyze.transport import exchange_key
+
+
+class TestMockProvider(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = ProviderFactory().create_provider(
+            ProviderList.MOCK, {'mock_fleet': {'bulbs': 3, 'plugs': 2}})
+        self.provider.setUpMock()
+
+    def tearDown(self):
+        self.provider.tearDownMock()
+
+    def test_registered(self):
+        self.assertIsInstance(self.provider, MockWyzeProvider)
+        self.assertNotIn(
+            MockWyzeProvider,
+            ProviderFactory().get_all_provider_classes(ignore_mocks=True))
+
+    def test_list_and_get(self):
+        bulbs = self.provider.bulb.list(with_properties=True)
+        self.assertEqual(len(bulbs), 3)
+        self.assertEqual(len(self.provider.plug.list()), 2)
+
+        bulb = self.provider.bulb.get(bulbs[0].mac)
+        self.assertEqual(bulb.brightness, bulbs[0].brightness)
+        self.assertIsNotNone(bulb.color_temp)
+
+        sensor = self.provider.contact_sensor.list()[0]
+        self.assertIsNotNone(
+            self.provider.contact_sensor.get(sensor.mac).voltage)
+
+    def test_commands_change_state(self):
+        bulb = self.provider.bulb.list()[0]
+        self.provider.bulb.switch_off(bulb)
+        self.assertEqual(self.provider.bulb.get(bulb.mac).switch_state, '0')
+        self.provider.bulb.switch_on(bulb)
+        self.assertEqual(self.provider.bulb.get(bulb.mac).switch_state, '1')
+
+        vacuum = self.provider.vacuum.list()[0]
+        self.provider.vacuum.clean(vacuum)
+        vacuum = self.provider.vacuum.get(vacuum.mac)
+        self.assertEqual(vacuum.mode, VacuumMode.SWEEPING)
+        self.assertEqual(len(vacuum.rooms), 4)
+
+        tracker = self.provider.vacuum.track(vacuum, interval=60)
+        tracker.stop()
+        track = tracker.poll()
+        # a sweeping vacuum moves on every position read
+        self.assertTrue(track.points)
+
+    def test_sweep_records(self):
+        vacuum = self.provider.vacuum.list()[0]
+        records = list(self.provider.vacuum.sweep_records(vacuum, page_size=2))
+        self.assertEqual(len(records), 5)
+        self.assertIsNotNone(records[0].robot_map.head)
+
+    def test_sweep_record_pages(self):
+        vacuum = self.provider.vacuum.list()[0]
+        wyze_client = self.provider.wyze_client
+        keys = ['record_id', 'create_time']
+
+        records, cursor = wyze_client.get_vacuum_sweep_records(
+            vacuum.mac, keys, count=3)
+        self.assertEqual(len(records), 3)
+        older, _ = wyze_client.get_vacuum_sweep_records(
+            vacuum.mac, keys, cursor, 3)
+        self.assertEqual(len(older), 2)
+        self.assertLess(
+            max(record['create_time'] for record in older),
+            min(record['create_time'] for record in records))
+
+    def test_rejects_bad_signature(self):
+        venus_client = self.provider.wyze_client.venus_client
+        venus_client._signer = WyzeRequestSigner(
+            'another token', 'another salt')
+        vacuum = self.provider.vacuum.list()[0]
+        with self.assertRaises(ProviderInternalException):
+            venus_client.get_iot_prop(vacuum.mac, ['mode'])
+
+    def test_rejects_bad_sv(self):
+        api_client = self.provider.wyze_client.api_client
+        with self.assertRaises(ProviderInternalException):
+            api_client.post_to_server(
+                api_client.base_url + '/app/v2/home_page/get_object_list',
+                {'sv': 'wrong'})
+
+    def test_expired_token(self):
+        self.provider.server.expire_tokens()
+        with self.assertRaises(ProviderConnectionException):
+            self.provider.wyze_client.list_devices()
+
+        self.provider.wyze_client.refresh_token()
+        self.assertEqual(len(self.provider.wyze_client.list_devices()), 10)
+
+    def test_injected_errors(self):
+        bulb = self.provider.bulb.list()[0]
+        self.provider.server.inject_error(
+            '/app/v2/device/get_property_list', status=503)
+        self.assertIsNone(self.provider.bulb.get(bulb.mac))
+        self.assertIsNotNone(self.provider.bulb.get(bulb.mac))
+
+
+class TestAsyncClient(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = ProviderFactory().create_provider(
+            ProviderList.MOCK, {'mock_fleet': {'bulbs': 3, 'plugs': 2}})
+        self.provider.setUpMock()
+
+    def tearDown(self):
+        asyncio.run(self.provider.async_close())
+        self.provider.tearDownMock()
+
+    def run_async(self, coroutine):
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                # the aiohttp sessions belong to this event loop
+                await self.provider.async_close()
+        return asyncio.run(run())
+
+    def test_list_and_get(self):
+        async def list_and_get():
+            client = self.provider.async_wyze_client
+            bulbs = await client.list_bulbs(WyzeBulb.pids())
+            bulb = await client.get_bulb(bulbs[0]['mac'], WyzeBulb.pids())
+            return bulbs, bulb
+
+        bulbs, bulb = self.run_async(list_and_get())
+        self.assertEqual(len(bulbs), 3)
+        self.assertEqual(bulb['mac'], bulbs[0]['mac'])
+        self.assertTrue(bulb['data']['property_list'])
+
+    def test_set_changes_state(self):
+        bulb = self.provider.bulb.list()[0]
+        self.run_async(self.provider.bulb.async_switch_off(bulb))
+        self.assertEqual(self.provider.bulb.get(bulb.mac).switch_state, '0')
+        bulb = self.run_async(self.provider.bulb.async_get(bulb.mac))
+        self.assertEqual(bulb.switch_state, '0')
+
+    def test_vacuum_partial_failure(self):
+        vacuum = self.provider.vacuum.list()[0]
+        self.provider.server.inject_error(
+            '/plugin/venus/memory_map/current_map', status=503)
+        vacuum = self.run_async(self.provider.vacuum.async_get(vacuum.mac))
+        self.assertIsNotNone(vacuum)
+        self.assertIsNotNone(vacuum.mode)
+        self.assertNotIn('current_map', vacuum._device)
+
+    def test_close(self):
+        client = self.provider.async_wyze_client
+        self.run_async(client.list_devices())
+        self.assertIsNone(self.provider._async_wyze_client)
+        self.assertTrue(client.api_client._session.closed)
+        # a new client is created on next use
+        self.assertIsNot(self.provider.async_wyze_client, client)
+
+
+class TestStandInServer(unittest.TestCase):
+
+    def test_login(self):
+        with WyzeStandInServer(
+                fleet=WyzeFleet(bulbs=1, plugs=0, contact_sensors=0,
+                                motion_sensors=0, vacuums=0),
+                username='user@example.com', password='secret') as server:
+            provider = ProviderFactory().create_provider(
+                ProviderList.MOCK, {'mock_server_url': server.url})
+            self.assertIsNone(provider.server)
+
+            with self.assertRaises(ProviderConnectionException):
+                provider.wyze_client.login('user@example.com', 'wrong')
+            session = provider.wyze_client.login('user@example.com', 'secret')
+            self.assertTrue(session['access_token'])
+            self.assertEqual(len(provider.bulb.list()), 1)
+            provider.tearDownMock()
+
+    def test_large_fleet(self):
+        with WyzeStandInServer(fleet=WyzeFleet(
+                bulbs=250, plugs=0, contact_sensors=0, motion_sensors=0,
+                vacuums=0)) as server:
+            provider = ProviderFactory().create_provider(
+                ProviderList.MOCK, {
+                    'mock_server_url': server.url,
+                    'wyze_property_list_chunk_size': 100})
+            bulbs = provider.bulb.list(with_properties=True)
+            self.assertEqual(len(bulbs), 250)
+            self.assertTrue(all(bulb.brightness for bulb in bulbs))
+            self.assertEqual(
+                server.requests['/app/v2/device_list/get_property_list'], 3)
+            provider.tearDownMock()
+
+
+class TestTransports(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = WyzeStandInServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def _provider(self, **config):
+        return ProviderFactory().create_provider(
+            ProviderList.MOCK, dict(config, mock_server_url=self.server.url))
+
+    def _session(self, provider):
+        bulbs = provider.bulb.list(with_properties=True)
+        bulb = provider.bulb.get(bulbs[0].mac)
+        vacuum = provider.vacuum.get(provider.vacuum.list()[0].mac)
+        return ([(b.mac, b.brightness) for b in bulbs],
+                (bulb.brightness, bulb.color_temp),
+                (vacuum.battery, vacuum.ip, len(vacuum.rooms)))
+
+    def test_record_and_replay(self):
+        path = os.path.join(self.directory, 'session.jsonl.gz')
+        recording = self._provider(wyze_record_path=path)
+        recorded = self._session(recording)
+        recording.tearDownMock()
+        requests = sum(self.server.requests.values())
+
+        replay = self._provider(wyze_replay_path=path)
+        self.assertEqual(self._session(replay), recorded)
+        self.assertEqual(sum(self.server.requests.values()), requests)
+
+        # every recorded response is only replayed once, unless looping
+        bulb = replay.bulb.list()[0]
+        self.assertIsNone(replay.bulb.get(bulb.mac))
+        looping = self._provider(
+            wyze_replay_path=path, wyze_replay_loop=True)
+        for _ in range(3):
+            self.assertIsNotNone(looping.bulb.get(bulb.mac))
+
+    def test_recording_keeps_its_file_open(self):
+        path = os.path.join(self.directory, 'session.jsonl.gz')
+        provider = self._provider(wyze_record_path=path)
+        provider.bulb.list()
+        recording = WyzeRecording.for_path(path)
+        handle = recording._file
+        self.assertIsNotNone(handle)
+        provider.bulb.list()
+        self.assertIs(recording._file, handle)
+
+        provider.tearDownMock()
+        self.assertIsNone(recording._file)
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            self.assertEqual(
+                len(f.read().splitlines()),
+                sum(len(responses)
+                    for responses in recording.exchanges().values()))
+
+    def test_recordings_are_scrubbed(self):
+        path = os.path.join(self.directory, 'session.jsonl')
+        recording = self._provider(wyze_record_path=path)
+        recording.wyze_client.refresh_token()
+        recording.bulb.list()
+        recording.tearDownMock()
+
+        with open(path, encoding='utf-8') as f:
+            recorded = f.read()
+        self.assertNotIn(WyzeStandInServer.ACCESS_TOKEN, recorded)
+        self.assertNotIn(WyzeStandInServer.REFRESH_TOKEN, recorded)
+        self.assertIn(SCRUBBED, recorded)
+
+        # replaying a scrubbed token refresh works all the same
+        replay = self._provider(wyze_replay_path=path)
+        replay.wyze_client.refresh_token()
+        self.assertEqual(len(replay.bulb.list()), 2)
+
+    def test_session(self):
+        provider = self._provider()
+        self.assertIsNotNone(provider.wyze_client.api_client.session)
+        replay = self._provider(
+            wyze_replay_path=os.path.join(self.directory, 'none.jsonl'))
+        self.assertIsNone(replay.wyze_client.api_client.session)
+        if httpx is not None:
+            provider = self._provider(wyze_transport='httpx')
+            self.assertIsNone(provider.wyze_client.api_client.session)
+        provider.tearDownMock()
+
+    def test_exchange_key_ignores_volatile_fields(self):
+        url = 'https://example.com/plugin/venus/get_iot_prop'
+        self.assertEqual(
+            exchange_key('GET', url, {'did': 'a', 'nonce': '1'}),
+            exchange_key('GET', url, {'did': 'a', 'nonce': '2'}))
+        self.assertNotEqual(
+            exchange_key('GET', url, {'did': 'a'}),
+            exchange_key('GET', url, {'did': 'b'}))
+        self.assertEqual(
+            exchange_key('POST', url, data=b'{"ts":"1","pid":"P3"}'),
+            exchange_key('POST', url, data=b'{"pid":"P3","ts":"2"}'))
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_httpx(self):
+        provider = self._provider(wyze_transport='httpx')
+        self.assertEqual(len(provider.bulb.list(with_properties=True)), 2)
+        bulb = provider.bulb.list()[0]
+        provider.bulb.switch_on(bulb)
+        self.assertEqual(provider.bulb.get(bulb.mac).switch_state, '1')
+        provider.tearDownMock()
+
+    def test_unknown_transport(self):
+        provider = self._provider(wyze_transport='carrier-pigeon')
+        with self.assertRaises(InvalidConfigurationException):
+            provider.wyze_client.list_devices()
+
+
+class TestDeviceWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.server = WyzeStandInServer(fleet=WyzeFleet(
+            bulbs=2, plugs=1, contact_sensors=2, motion_sensors=1,
+            vacuums=1)).start()
+        self.provider = ProviderFactory().create_provider(
+            ProviderList.MOCK, {'mock_server_url': self.server.url})
+        self.watcher = WyzeDeviceWatcher(
+            self.provider.wyze_client, interval=60,
+            intervals={'open_close_state': 0, 'rssi': 3600})
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.provider.tearDownMock()
+        self.server.stop()
+
+    def test_reports_changed_properties(self):
+        added = self.watcher.poll()
+        self.assertEqual(len(added), 6)
+        self.assertTrue(all(change.added for change in added))
+        sensor = self.provider.contact_sensor.list()[0]
+        self.assertIn('open_close_state', self.watcher.state(sensor.mac))
+        self.assertEqual(self.watcher.poll(), [])
+
+        fleet = self.server.fleet
+        fleet.set_property(sensor.mac, 'P1301', '1')
+        fleet.set_property(sensor.mac, 'P1304', '-40')
+        changes = self.watcher.poll()
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].mac, sensor.mac)
+        self.assertIs(changes[0].device_class, WyzeContactSensor)
+        # rssi is not due yet
+        self.assertEqual(list(changes[0].changes), ['open_close_state'])
+        self.assertEqual(changes[0].changes['open_close_state'][1], '1')
+
+        changes = self.watcher.poll(force=True)
+        self.assertEqual(list(changes[0].changes), ['rssi'])
+
+    def test_only_due_pids_are_requested(self):
+        self.watcher.poll()
+        requests = self.server.requests[
+            '/app/v2/device_list/get_property_list']
+        self.watcher.poll()
+        # only the contact sensors have a property due
+        self.assertEqual(self.server.requests[
+            '/app/v2/device_list/get_property_list'], requests + 1)
+
+    def test_failed_device_list_refresh_keeps_cached_list(self):
+        self.watcher.poll()
+        device_list = '/app/v2/home_page/get_object_list'
+        self.server.inject_error(device_list, code='3001')
+        requests = self.server.requests[device_list]
+
+        # the failed refresh neither drops the cached list nor the devices
+        self.assertEqual(self.watcher.poll(force=True), [])
+        self.assertEqual(len(self.provider.wyze_client.list_devices()), 7)
+        self.assertEqual(self.server.requests[device_list], requests + 1)
+
+    def test_survives_service_errors(self):
+        self.server.inject_error(
+            '/app/v2/home_page/get_object_list', code='3001')
+        self.server.inject_error(
+            '/app/v2/device_list/get_property_list', code='3001', count=3)
+        received = threading.Event()
+        self.watcher.subscribe(lambda change: received.set())
+
+        self.watcher.start()
+        self.assertTrue(received.wait(10))
+        self.assertTrue(self.watcher.running)
+
+    def test_subscribers(self):
+        received = []
+        all_added = threading.Event()
+
+        def callback(change):
+            received.append(change)
+            if len(received) == 6:
+                all_added.set()
+
+        watcher = self.provider.watch(callback)
+        self.assertTrue(all_added.wait(10))
+        watcher.stop()
+        self.assertFalse(watcher.running)
+
+
+class TestProviderPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = WyzeStandInServer().start()
+        self.factory = ProviderFactory(pool_size=2)
+
+    def tearDown(self):
+        self.factory.pool.clear()
+        self.server.stop()
+
+    def _config(self, token):
+        return {'mock_server_url': self.server.url,
+                'access_token': WyzeStandInServer.ACCESS_TOKEN,
+                'refresh_token': token}
+
+    def test_shared_per_credentials(self):
+        provider = self.factory.get_provider(
+            ProviderList.MOCK, self._config('a'))
+        self.assertIs(self.factory.get_provider(
+            ProviderList.MOCK, self._config('a')), provider)
+        self.assertIsNot(self.factory.get_provider(
+            ProviderList.MOCK, self._config('b')), provider)
+        self.assertEqual(len(self.factory.pool), 2)
+
+        self.factory.pool.remove(ProviderList.MOCK, self._config('a'))
+        self.assertIsNot(self.factory.get_provider(
+            ProviderList.MOCK, self._config('a')), provider)
+
+    def test_least_recently_used_is_closed(self):
+        first = self.factory.get_provider(ProviderList.MOCK, self._config('a'))
+        first.bulb.list()
+        self.factory.get_provider(ProviderList.MOCK, self._config('b'))
+        self.factory.get_provider(ProviderList.MOCK, self._config('a'))
+        self.factory.get_provider(ProviderList.MOCK, self._config('c'))
+
+        self.assertEqual(len(self.factory.pool), 2)
+        self.assertIs(self.factory.get_provider(
+            ProviderList.MOCK, self._config('a')), first)
+        self.assertIsNotNone(first._wyze_client)
+
+        self.factory.get_provider(ProviderList.MOCK, self._config('d'))
+        self.factory.get_provider(ProviderList.MOCK, self._config('c'))
+        self.assertIsNone(first._wyze_client)
+
+    def test_idle_timeout(self):
+        factory = ProviderFactory(pool_idle_timeout=0)
+        provider = factory.get_provider(ProviderList.MOCK, self._config('a'))
+        self.assertIsNot(factory.get_provider(
+            ProviderList.MOCK, self._config('a')), provider)
+        self.assertEqual(len(factory.pool), 1)
+        factory.pool.clear()
+
+    def test_checked_out_provider_is_closed_when_released(self):
+        with self.factory.checkout_provider(
+                ProviderList.MOCK, self._config('a')) as provider:
+            provider.bulb.list()
+            self.factory.get_provider(ProviderList.MOCK, self._config('b'))
+            self.factory.get_provider(ProviderList.MOCK, self._config('c'))
+            self.assertEqual(len(self.factory.pool), 2)
+            self.assertIsNotNone(provider._wyze_client)
+            self.assertEqual(len(provider.bulb.list()), 2)
+        self.assertIsNone(provider._wyze_client)
+
+    def test_checked_out_provider_is_not_idle(self):
+        factory = ProviderFactory(pool_idle_timeout=0)
+        config = self._config('a')
+        with factory.checkout_provider(ProviderList.MOCK, config) as provider:
+            self.assertIs(
+                factory.get_provider(ProviderList.MOCK, config), provider)
+        factory.pool.clear()
+
+    def test_created_outside_the_lock(self):
+        create_provider = self.factory.create_provider
+        created = []
+
+        def create(name, config):
+            provider = create_provider(name, config)
+            created.append(provider)
+            if len(created) == 1:
+                # another caller gets the same provider meanwhile
+                created.append(self.factory.get_provider(name, config))
+            return provider
+
+        self.factory.create_provider = create
+        provider = self.factory.get_provider(
+            ProviderList.MOCK, self._config('a'))
+        self.assertIs(provider, created[1])
+        self.assertEqual(len(self.factory.pool), 1)
+
+
+class TestThrottling(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = ProviderFactory().create_provider(
+            ProviderList.MOCK, {'wyze_rate_limit': 1000,
+                                'wyze_throttled_codes': '3044',
+                                'wyze_max_backoff': 0.01})
+
+    def tearDown(self):
+        self.provider.tearDownMock()
+
+    def test_throttled_responses_lower_the_rate(self):
+        bulb = self.provider.bulb.list()[0]
+        self.provider.server.inject_error(
+            '/app/v2/device/get_property_list', status=429)
+        self.assertIsNone(self.provider.bulb.get(bulb.mac))
+        self.provider.server.inject_error(
+            '/app/v2/device/get_property_list', code='3044')
+        self.assertIsNone(self.provider.bulb.get(bulb.mac))
+
+        stats = self.provider.wyze_client.rate_limiter_stats()['api']
+        self.assertEqual(stats['throttled'], 2)
+        self.assertEqual(stats['rate'], 250)
+
+        self.assertIsNotNone(self.provider.bulb.get(bulb.mac))
+        self.assertGreater(
+            self.provider.wyze_client.rate_limiter_stats()['api']['rate'],
+            250)
+
+    def test_async_requests_are_limited(self):
+        bulb = self.provider.bulb.list()[0]
+        self.provider.server.inject_error(
+            '/app/v2/device/get_property_list', status=429)
+
+        async def get_twice():
+            try:
+                return [await self.provider.bulb.async_get(bulb.mac)
+                        for _ in range(2)]
+            finally:
+                await self.provider.async_close()
+
+        async_client = self.provider.async_wyze_client
+        first, second = asyncio.run(get_twice())
+        self.assertIsNone(first)
+        self.assertIsNotNone(second)
+        stats = async_client.api_client.rate_limiter.stats()
+        self.assertEqual(stats['throttled'], 1)
+        self.assertGreater(stats['rate'], 500)
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_provider_benchmark(self):
+        from .benchmarks import provider_benchmark
+
+        results = provider_benchmark.run(repeat=1, fleet_size=2, scale=0.001)
+        self.assertIn('WyzeClient.get_bulb', results)
+        self.assertTrue(all(value > 0 for value in results.values()))
+
+    def test_compare(self):
+        from .benchmarks.__main__ import compare
+
+        def _run(value):
+            return {'benchmarks': {'provider_benchmark': {
+                'unit': 'usec/call', 'results': {'get_bulb': value}}}}
+
+        rows, regressed = compare(_run(10.0), _run(11.0))
+        self.assertFalse(regressed)
+        self.assertAlmostEqual(rows[0][4], 1.1)
+        self.assertTrue(compare(_run(10.0), _run(13.0))[1])
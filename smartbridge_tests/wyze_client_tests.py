@@ -0,0 +1,1047 @@
+import asyncio
+import base64
+import copy
+from hashlib import md5
+import hmac
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import time
+import unittest
+import zlib
+from urllib.parse import parse_qsl
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+
+try:
+    import blackboxprotobuf
+except ImportError:
+    blackboxprotobuf = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from smartbridge.interfaces.exceptions import InvalidValueException
+from smartbridge.interfaces.exceptions import ProviderInternalException
+from smartbridge.providers.wyze.cache import WyzeDeviceListCache
+from smartbridge.providers.wyze.client import WyzeApiClient
+from smartbridge.providers.wyze.client import WyzeClient
+from smartbridge.providers.wyze.client import WyzeRequestSigner
+from smartbridge.providers.wyze.client import WyzeVenusServiceClient
+from smartbridge.providers.wyze.devices import DeviceModels
+from smartbridge.providers.wyze.devices import WyzeBulb
+from smartbridge.providers.wyze.devices import WyzeContactSensor
+from smartbridge.providers.wyze.devices import WyzeVacuum
+from smartbridge.providers.wyze.devices import _decoded_maps
+from smartbridge.providers.wyze.registry import WyzeDeviceRegistry
+from smartbridge.providers.wyze.robotmap import decode_robot_map
+from smartbridge.providers.wyze.services import WyzeBulbService
+from smartbridge.providers.wyze.services import WyzeVacuumService
+from smartbridge.providers.wyze.snapshot import WyzeDeviceSnapshot
+from smartbridge.providers.wyze.throttle import PRIORITY_BACKGROUND
+from smartbridge.providers.wyze.throttle import PRIORITY_COMMAND
+from smartbridge.providers.wyze.throttle import WyzeRateLimiter
+from smartbridge.providers.wyze.throttle import current_priority
+from smartbridge.providers.wyze.throttle import request_priority
+from smartbridge.providers.wyze.tracking import WyzePathBuffer
+from smartbridge.providers.wyze.tracking import WyzeVacuumTracker
+
+
+class TestDeviceListCache(unittest.TestCase):
+    def setUp(self):
+        self.loads = 0
+
+    def _loader(self):
+        self.loads += 1
+        return [{'mac': 'mac-{0}'.format(self.loads)}]
+
+    def test_collapses_reads(self):
+        cache = WyzeDeviceListCache(self._loader, ttl=60)
+        for _ in range(5):
+            cache.get()
+        self.assertEqual(self.loads, 1)
+
+    def test_invalidate(self):
+        cache = WyzeDeviceListCache(self._loader, ttl=60)
+        cache.get()
+        cache.invalidate()
+        self.assertEqual(cache.get()[0]['mac'], 'mac-2')
+
+    def test_refresh(self):
+        cache = WyzeDeviceListCache(self._loader, ttl=60)
+        cache.get()
+        self.assertEqual(cache.refresh()[0]['mac'], 'mac-2')
+        self.assertEqual(cache.get()[0]['mac'], 'mac-2')
+
+        def failing_loader():
+            raise ProviderInternalException('3001: service error')
+        cache._loader = failing_loader
+        with self.assertRaises(ProviderInternalException):
+            cache.refresh()
+        # a failed refresh keeps the cached value
+        self.assertEqual(cache.get()[0]['mac'], 'mac-2')
+
+    def test_stale_while_revalidate(self):
+        cache = WyzeDeviceListCache(self._loader, ttl=0.01, stale_ttl=60)
+        first = cache.get()
+        time.sleep(0.02)
+        # the stale value is served while a refresh runs in the background
+        self.assertIs(cache.get(), first)
+        deadline = time.monotonic() + 2
+        while self.loads < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.loads, 2)
+
+    def test_expired(self):
+        cache = WyzeDeviceListCache(self._loader, ttl=0, stale_ttl=0)
+        cache.get()
+        cache.get()
+        self.assertEqual(self.loads, 2)
+
+
+class TestDeviceRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = WyzeDeviceRegistry([
+            {'mac': 'b1', 'product_model': 'WLPA19', 'nickname': 'bulb'},
+            {'mac': 'p1', 'product_model': 'WLPP1', 'nickname': 'plug'},
+            {'mac': 'p2', 'product_model': 'WLPP1CFH', 'nickname': 'plug'},
+        ])
+
+    def test_get(self):
+        self.assertEqual(self.registry.get('p1')['nickname'], 'plug')
+        self.assertIsNone(self.registry.get('missing'))
+
+    def test_list_by_type(self):
+        self.assertEqual(
+            [d['mac'] for d in self.registry.list(DeviceModels.PLUG)],
+            ['p1', 'p2'])
+        self.assertEqual(
+            [d['mac'] for d in self.registry.list(['WLPP1CFH'])], ['p2'])
+        self.assertEqual(len(self.registry.list()), 3)
+
+    def test_incremental_update(self):
+        bulb = self.registry.get('b1')
+        self.registry.update([
+            {'mac': 'b1', 'product_model': 'WLPA19', 'nickname': 'bulb'},
+            {'mac': 'p1', 'product_model': 'WLPP1', 'nickname': 'renamed'},
+        ])
+        # unchanged entries are kept, changed and removed ones are reindexed
+        self.assertIs(self.registry.get('b1'), bulb)
+        self.assertEqual(self.registry.get('p1')['nickname'], 'renamed')
+        self.assertIsNone(self.registry.get('p2'))
+        self.assertEqual(len(self.registry.list(DeviceModels.PLUG)), 1)
+
+
+    def test_updated_leaves_registry_unchanged(self):
+        bulb = self.registry.get('b1')
+        updated = self.registry.updated([
+            {'mac': 'b1', 'product_model': 'WLPA19', 'nickname': 'bulb'}])
+        self.assertIs(updated.get('b1'), bulb)
+        self.assertIsNone(updated.get('p1'))
+        self.assertEqual(len(self.registry), 3)
+
+
+class TestDeviceListLoads(unittest.TestCase):
+    def test_outdated_load_does_not_change_registry(self):
+        client = WyzeClient({})
+        client._api_client = StubApiClient(
+            [{'mac': 'b1', 'product_model': 'WLPA19', 'nickname': 'old'}])
+        registry = client.devices
+        cache = client._device_list_cache
+
+        # a load that started before an invalidation finishes after it
+        generation = cache._generation
+        client.invalidate_device_list()
+        client.api_client.device_list = [
+            {'mac': 'b1', 'product_model': 'WLPA19', 'nickname': 'outdated'}]
+        cache._load(generation)
+        self.assertEqual(registry.get('b1')['nickname'], 'old')
+
+        client.api_client.device_list = [
+            {'mac': 'b1', 'product_model': 'WLPA19', 'nickname': 'new'}]
+        self.assertEqual(client.devices.get('b1')['nickname'], 'new')
+        self.assertEqual(registry.get('b1')['nickname'], 'old')
+
+class TestPropertyLookup(unittest.TestCase):
+    def _bulb(self):
+        return WyzeBulb(None, {
+            'mac': 'b1', 'product_model': 'WLPA19', 'nickname': 'bulb',
+            'data': {'property_list': [
+                {'pid': 'P3', 'value': '1'},
+                {'pid': 'P1501', 'value': '40'},
+            ]}})
+
+    def test_tables_are_computed_once(self):
+        self.assertIs(WyzeBulb.props(), WyzeBulb.props())
+        self.assertIs(WyzeBulb.pids(), WyzeBulb.pids())
+        self.assertEqual(WyzeBulb.pid_names()['P1501'], 'brightness')
+        self.assertEqual(
+            WyzeContactSensor.pid_names()['P1329'], 'voltage')
+
+    def test_indexed_reads_and_writes(self):
+        bulb = self._bulb()
+        self.assertEqual(bulb.brightness, '40')
+        self.assertEqual(bulb.switch_state, '1')
+        self.assertIsNone(bulb.color_temp)
+        self.assertIsNone(bulb.ip)
+
+        bulb._set_property('brightness', 60)
+        self.assertEqual(bulb.brightness, 60)
+        self.assertEqual(
+            bulb._device['data']['property_list'][1]['value'], 60)
+
+        # a replaced payload is reindexed
+        bulb._device['data']['property_list'] = [{'pid': 'P1501', 'value': '5'}]
+        self.assertEqual(bulb.brightness, '5')
+
+
+class TestDeviceSnapshot(unittest.TestCase):
+    def test_fields(self):
+        payload = {
+            'mac': 'b1', 'product_model': 'WLPA19', 'nickname': 'bulb',
+            'device_params': {'ip': '10.0.0.2', 'switch_state': 1},
+            'data': {'property_list': [
+                {'pid': 'P3', 'value': '1'},
+                {'pid': 'P1501', 'value': '40'},
+            ]}}
+        bulb = WyzeBulb(None, WyzeDeviceSnapshot.from_payload(WyzeBulb, payload))
+
+        self.assertEqual(bulb.mac, 'b1')
+        self.assertEqual(bulb.brightness, '40')
+        self.assertEqual(bulb.switch_state, '1')
+        self.assertEqual(bulb.ip, '10.0.0.2')
+        self.assertIsNone(bulb.color_temp)
+        self.assertIsNone(bulb._device.raw)
+
+        bulb._set_property('brightness', 60)
+        self.assertEqual(bulb.brightness, 60)
+
+    def test_vacuum_and_raw(self):
+        payload = {
+            'mac': 'v1', 'product_model': 'JA_RO2', 'nickname': 'vacuum',
+            'data': {'props': {'battary': '87', 'mode': '1'}},
+            'current_map': {}}
+        snapshot = WyzeDeviceSnapshot.from_payload(
+            WyzeVacuum, payload, keep_raw=True)
+        vacuum = WyzeVacuum(None, snapshot)
+
+        self.assertEqual(vacuum.battery, '87')
+        self.assertEqual(snapshot['mode'], '1')
+        # fields outside the schema fall back to the kept payload
+        self.assertEqual(snapshot['current_map'], {})
+
+    def test_same_values_as_payload(self):
+        payload = {
+            'mac': 'b1', 'product_model': 'WLPA19', 'nickname': 'bulb',
+            'data': {'property_list': [
+                {'pid': 'P3', 'value': '1'},
+                {'pid': 'P1501', 'value': '40'},
+                {'pid': 'P1502', 'value': '2700'},
+            ]}}
+        bulb = WyzeBulb(None, copy.deepcopy(payload))
+        compact = WyzeBulb(
+            None, WyzeDeviceSnapshot.from_payload(WyzeBulb, payload))
+
+        for name in ('switch_state', 'brightness', 'color_temp', 'ip'):
+            self.assertEqual(getattr(compact, name), getattr(bulb, name))
+
+
+def _varint(value):
+    value &= (1 << 64) - 1
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def _field(number, value):
+    """
+    Encodes an int as a varint, a float as fixed32, and bytes or a list of
+    fields as a length-delimited value.
+    """
+    if isinstance(value, float):
+        return _varint(number << 3 | 5) + struct.pack('<f', value)
+    if isinstance(value, int):
+        return _varint(number << 3) + _varint(value)
+    if isinstance(value, list):
+        value = b''.join(value)
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def encode_map(rooms=('Kitchen', 'Bedroom')):
+    message = b''.join([
+        _field(1, 1),
+        _field(3, [_field(1, 1), _field(2, 4), _field(3, 2), _field(4, -1.0),
+                   _field(5, -0.5), _field(6, 1.0), _field(7, 0.5),
+                   _field(8, 0.5)]),
+        _field(4, [_field(1, bytes([0, 127, 127, 255, 0, 127, 127, 255]))]),
+        _field(6, [_field(1, 7)] + [
+            _field(2, [_field(1, i), _field(2, i * 0.25), _field(3, -0.25)])
+            for i in range(3)]),
+        _field(8, [_field(1, 7), _field(2, 1), _field(3, 0.5),
+                   _field(4, -0.25), _field(5, 1.5)]),
+        # an unknown field is skipped
+        _field(20, b'ignored'),
+    ] + [
+        _field(12, [_field(1, 10 + i), _field(2, name.encode('utf-8')),
+                    _field(5, 0), _field(6, 1)])
+        for i, name in enumerate(rooms)
+    ] + [
+        _field(13, [_field(1, bytes([0, 10, 10, 0, 0, 11, 11, 0]))]),
+        _field(14, [_field(1, 10), _field(2, [
+            _field(1, 1), _field(2, 0), _field(3, -3)])]),
+    ])
+    return base64.b64encode(zlib.compress(message)).decode('ascii')
+
+
+class TestVacuumMapDecoding(unittest.TestCase):
+    def setUp(self):
+        _decoded_maps.clear()
+
+    def _vacuum(self, blob):
+        return WyzeVacuum(None, {
+            'mac': 'v1', 'product_model': 'JA_RO2', 'nickname': 'vacuum',
+            'current_map': {'map': blob}})
+
+    def test_typed_map(self):
+        vacuum = self._vacuum(encode_map())
+        robot_map = vacuum.get_robot_map()
+
+        self.assertEqual(robot_map.head.size_x, 4)
+        self.assertEqual(robot_map.head.min_x, -1.0)
+        self.assertEqual(robot_map.current_pose.x, 0.5)
+        self.assertEqual(robot_map.history_pose_id, 7)
+        self.assertEqual([point.x for point in robot_map.history],
+                         [0.0, 0.25, 0.5])
+        self.assertEqual(robot_map.room_chains[0].points[0].value, -3)
+        self.assertIsInstance(robot_map.map_data, bytes)
+        self.assertEqual(
+            [room.name for room in vacuum.rooms], ['Kitchen', 'Bedroom'])
+        self.assertEqual(
+            vacuum.current_map['mapHeadInfo_']['sizeY_'], 2)
+
+    def test_unchanged_maps_are_decoded_once(self):
+        blob = encode_map()
+        first = self._vacuum(blob).get_robot_map()
+        self.assertIs(self._vacuum(blob).get_robot_map(), first)
+        self.assertIsNot(
+            self._vacuum(encode_map(('Office',))).get_robot_map(), first)
+        self.assertEqual(len(_decoded_maps), 2)
+
+    def test_invalid_map(self):
+        with self.assertRaises(InvalidValueException):
+            self._vacuum('not a map').get_robot_map()
+
+    def test_to_json(self):
+        as_json = self._vacuum(encode_map()).to_json()
+        self.assertNotIn('occupancy_map', as_json)
+        self.assertNotIn('robot_map', as_json)
+        self.assertEqual(len(as_json['rooms']), 2)
+        # the map is JSON-native
+        current_map = json.loads(json.dumps(as_json['current_map']))
+        self.assertEqual(base64.b64decode(
+            current_map['mapData_']['mapData_'])[:2], bytes([0, 127]))
+
+    def test_current_map_is_built_once(self):
+        vacuum = self._vacuum(encode_map())
+        self.assertIs(vacuum.current_map, vacuum.current_map)
+        self.assertIsNot(self._vacuum(encode_map()).current_map,
+                         vacuum.current_map)
+
+    def test_shared_maps_are_read_only(self):
+        blob = encode_map()
+        vacuum = self._vacuum(blob)
+        robot_map = vacuum.get_robot_map()
+        self.assertEqual(vacuum._device['current_map']['map'], blob)
+
+        with self.assertRaises(AttributeError):
+            robot_map.head = None
+        with self.assertRaises(AttributeError):
+            robot_map.rooms.append(None)
+        vacuum.rooms[0].name = 'Pantry'
+        vacuum.current_map['mapHeadInfo_']['sizeY_'] = 0
+
+        other = self._vacuum(blob)
+        self.assertEqual(other.rooms[0].name, 'Kitchen')
+        self.assertEqual(other.current_map['mapHeadInfo_']['sizeY_'], 2)
+
+    @unittest.skipIf(blackboxprotobuf is None,
+                     'blackboxprotobuf is not installed')
+    def test_matches_generic_decoder(self):
+        message = zlib.decompress(base64.b64decode(encode_map()))
+        expected, _ = blackboxprotobuf.decode_message(
+            message, copy.deepcopy(WyzeVacuum._robot_map_proto))
+        decoded = decode_robot_map(message).to_dict()
+
+        self.assertEqual(decoded['mapHeadInfo_'], expected['mapHeadInfo_'])
+        self.assertEqual(decoded['currentPose_'], expected['currentPose_'])
+        self.assertEqual(
+            decoded['historyPose_']['2'], expected['historyPose_']['2'])
+        self.assertEqual(
+            [room['id'] for room in decoded['12']],
+            [room['id'] for room in expected['12']])
+
+
+def encode_position(pose_id, points):
+    message = _field(6, [_field(1, pose_id)] + [
+        _field(2, [_field(1, i), _field(2, i * 0.5), _field(3, 0.0)])
+        for i in range(points)])
+    return base64.b64encode(zlib.compress(message)).decode('ascii')
+
+
+class StubVacuumClient(object):
+    def __init__(self):
+        self.map_update_time = 1
+        self.position = encode_position(1, 3)
+        self.map_fetches = 0
+
+    def get_vacuum_props(self, device_mac, props):
+        return {'memory_map_update_time': self.map_update_time}
+
+    def get_vacuum_map(self, device_mac):
+        self.map_fetches += 1
+        return {'map': encode_map()}
+
+    def get_vacuum_position(self, device_mac):
+        return {'map': self.position}
+
+
+class TestVacuumTracker(unittest.TestCase):
+    def setUp(self):
+        self.client = StubVacuumClient()
+        self.tracker = WyzeVacuumTracker(self.client, 'v1', capacity=4)
+        self.tracks = []
+        self.tracker.subscribe(self.tracks.append)
+
+    def test_path_deltas(self):
+        track = self.tracker.poll()
+        self.assertTrue(track.reset)
+        self.assertEqual(len(track.points), 3)
+        self.assertIsNotNone(track.robot_map)
+
+        self.client.position = encode_position(1, 5)
+        track = self.tracker.poll()
+        self.assertFalse(track.reset)
+        self.assertEqual([point.update for point in track.points], [3, 4])
+        self.assertIsNone(track.robot_map)
+        # the ring buffer keeps the latest points only
+        self.assertEqual(
+            [point.update for point in self.tracker.path], [1, 2, 3, 4])
+
+        # nothing moved, nothing is delivered
+        self.tracker.poll()
+        self.assertEqual(len(self.tracks), 2)
+
+    def test_map_is_refetched_on_update(self):
+        self.tracker.poll()
+        self.tracker.poll()
+        self.assertEqual(self.client.map_fetches, 1)
+
+        self.client.map_update_time = 2
+        self.assertIsNotNone(self.tracker.poll().robot_map)
+        self.assertEqual(self.client.map_fetches, 2)
+
+    def test_new_run_resets_the_path(self):
+        self.tracker.poll()
+        self.client.position = encode_position(2, 1)
+        track = self.tracker.poll()
+        self.assertTrue(track.reset)
+        self.assertEqual(len(self.tracker.path), 1)
+
+    def test_polling_thread(self):
+        with WyzeVacuumTracker(self.client, 'v1', interval=0.01) as tracker:
+            deadline = time.monotonic() + 2
+            while not tracker.path and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertFalse(tracker.running)
+        self.assertEqual(len(tracker.path), 3)
+
+    def test_polling_thread_survives_service_errors(self):
+        client = FailingVacuumClient(failures=2)
+        with WyzeVacuumTracker(client, 'v1', interval=0.01) as tracker:
+            deadline = time.monotonic() + 2
+            while not tracker.path and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(tracker.running)
+        self.assertEqual(client.failures, 0)
+        self.assertEqual(len(tracker.path), 3)
+
+
+class FailingVacuumClient(StubVacuumClient):
+    def __init__(self, failures):
+        super(FailingVacuumClient, self).__init__()
+        self.failures = failures
+
+    def get_vacuum_props(self, device_mac, props):
+        if self.failures:
+            self.failures -= 1
+            raise ProviderInternalException('3001: service error')
+        return super(FailingVacuumClient, self).get_vacuum_props(
+            device_mac, props)
+
+
+class StubSweepRecordClient(object):
+    def __init__(self, create_times):
+        self.create_times = sorted(create_times, reverse=True)
+        self.requests = []
+
+    def get_vacuum_sweep_records(self, device_mac, keys, last_time=None,
+                                 count=20):
+        self.requests.append(last_time)
+        records = [{'record_id': str(t), 'create_time': t,
+                    'map': encode_map()}
+                   for t in self.create_times
+                   if last_time is None or t < last_time][:count]
+        cursor = records[-1]['create_time'] if records else None
+        return records, cursor
+
+
+class StubProvider(object):
+    def __init__(self, wyze_client, sweep_record_cache_dir=None):
+        self.wyze_client = wyze_client
+        self.sweep_record_cache_dir = sweep_record_cache_dir
+
+
+class TestSweepRecords(unittest.TestCase):
+    def setUp(self):
+        self.client = StubSweepRecordClient(range(100, 150))
+        self.vacuum = WyzeVacuum(None, {
+            'mac': 'v1', 'product_model': 'JA_RO2', 'nickname': 'vacuum'})
+
+    def test_streams_pages_backward(self):
+        service = WyzeVacuumService(StubProvider(self.client))
+        records = service.sweep_records(self.vacuum, page_size=20)
+
+        first = next(records)
+        self.assertEqual(first.create_time, 149)
+        self.assertEqual(len(self.client.requests), 1)
+        self.assertEqual(
+            [record.create_time for record in records], list(range(148, 99, -1)))
+        self.assertEqual(self.client.requests, [None, 130, 110])
+
+    def test_since(self):
+        service = WyzeVacuumService(StubProvider(self.client))
+        self.assertEqual(
+            len(list(service.sweep_records(self.vacuum, since=139))), 10)
+
+    def test_maps_are_decoded_lazily(self):
+        service = WyzeVacuumService(StubProvider(self.client))
+        record = next(service.sweep_records(self.vacuum))
+        self.assertIsNone(record._robot_map)
+        self.assertEqual(record.robot_map.head.size_x, 4)
+
+    def test_disk_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        service = WyzeVacuumService(StubProvider(self.client, directory))
+        self.assertEqual(len(list(service.sweep_records(self.vacuum))), 50)
+
+        # only records newer than the cached ones are fetched
+        self.client.create_times.insert(0, 150)
+        self.client.requests = []
+        create_times = [record.create_time
+                        for record in service.sweep_records(self.vacuum)]
+        self.assertEqual(create_times, list(range(150, 99, -1)))
+        self.assertEqual(self.client.requests, [None])
+
+    def test_disk_cache_streams_new_records(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        service = WyzeVacuumService(StubProvider(self.client, directory))
+        records = service.sweep_records(self.vacuum, page_size=20)
+
+        # every page is cached as it arrives
+        self.assertEqual(next(records).create_time, 149)
+        self.assertEqual(self.client.requests, [None])
+        self.assertEqual(len(service.sweep_record_cache.load('v1')), 20)
+        self.assertEqual(len(list(records)), 49)
+        self.assertEqual(len(service.sweep_record_cache.load('v1')), 50)
+
+    def test_disk_cache_newest_records(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        service = WyzeVacuumService(StubProvider(self.client, directory))
+        list(itertools.islice(service.sweep_records(self.vacuum), 5))
+
+        # the cached page is read from disk and the backlog fetched after it
+        self.client.requests = []
+        create_times = [record.create_time
+                        for record in service.sweep_records(self.vacuum)]
+        self.assertEqual(create_times, list(range(149, 99, -1)))
+        self.assertEqual(self.client.requests, [None, 130, 110])
+
+        self.client.requests = []
+        self.assertEqual(len(list(service.sweep_records(self.vacuum))), 50)
+        self.assertEqual(self.client.requests, [None])
+
+    def test_disk_cache_skips_torn_index_lines(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        service = WyzeVacuumService(StubProvider(self.client, directory))
+        list(service.sweep_records(self.vacuum, since=139))
+        with open(os.path.join(directory, 'v1.index'), 'a') as f:
+            f.write('1')
+        self.assertEqual(
+            [record['create_time']
+             for record in service.sweep_record_cache.load('v1')],
+            list(range(149, 139, -1)))
+
+    def test_disk_cache_since(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        service = WyzeVacuumService(StubProvider(self.client, directory))
+
+        # the newest records are cached even if since stops the fetch
+        self.assertEqual(
+            len(list(service.sweep_records(self.vacuum, since=139))), 10)
+        self.assertEqual(self.client.requests, [None])
+        self.assertEqual(len(service.sweep_record_cache.load('v1')), 10)
+
+        list(service.sweep_records(self.vacuum))
+        self.client.create_times[:0] = [152, 151, 150]
+        self.client.requests = []
+        create_times = [record.create_time for record in
+                        service.sweep_records(self.vacuum, since=139)]
+        self.assertEqual(create_times, list(range(152, 139, -1)))
+        self.assertEqual(self.client.requests, [None])
+
+
+class TestPathBuffer(unittest.TestCase):
+    def test_wraps_around(self):
+        path = WyzePathBuffer(capacity=3)
+        for i in range(5):
+            path.append(i, float(i), 0.0)
+        self.assertEqual(len(path), 3)
+        self.assertEqual([point.x for point in path.points()], [2.0, 3.0, 4.0])
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestVacuumMapArrays(unittest.TestCase):
+    def setUp(self):
+        self.vacuum_map = WyzeVacuum(None, {
+            'mac': 'v1', 'product_model': 'JA_RO2', 'nickname': 'vacuum',
+            'current_map': {'map': encode_map()}}).get_occupancy_map()
+
+    def test_grids(self):
+        self.assertEqual(self.vacuum_map.grid.shape, (2, 4))
+        self.assertEqual(self.vacuum_map.grid[1, 3], 255)
+        self.assertFalse(self.vacuum_map.grid.flags.writeable)
+        self.assertEqual(
+            self.vacuum_map.room_mask(10).tolist(),
+            [[False, True, True, False], [False, False, False, False]])
+
+    def test_room_areas(self):
+        self.assertEqual(
+            self.vacuum_map.room_areas(), {10: 0.5, 11: 0.5})
+
+    def test_rooms_without_id(self):
+        message = zlib.decompress(base64.b64decode(encode_map()))
+        # a room whose id field is absent
+        message += _field(12, [_field(2, b'Hall')])
+        vacuum_map = WyzeVacuum(None, {
+            'mac': 'v1', 'product_model': 'JA_RO2', 'nickname': 'vacuum',
+            'current_map': {'map': base64.b64encode(
+                zlib.compress(message)).decode('ascii')}}).get_occupancy_map()
+
+        self.assertEqual(len(vacuum_map.rooms), 3)
+        self.assertEqual(vacuum_map.room_areas(), {10: 0.5, 11: 0.5})
+        self.assertEqual(sorted(vacuum_map.room_masks()), [10, 11])
+
+    def test_coordinate_transforms(self):
+        rows, columns = self.vacuum_map.world_to_grid(
+            [-0.9, 0.9], [-0.4, 0.4])
+        self.assertEqual(rows.tolist(), [0, 1])
+        self.assertEqual(columns.tolist(), [0, 3])
+        x, y = self.vacuum_map.grid_to_world(rows, columns)
+        self.assertEqual(x.tolist(), [-0.75, 0.75])
+        self.assertEqual(y.tolist(), [-0.25, 0.25])
+
+
+class StubApiClient(object):
+    def __init__(self, device_list):
+        self.device_list = device_list
+        self.calls = []
+
+    def get_object_list(self):
+        self.calls.append('get_object_list')
+        return {'data': {'device_list': self.device_list}}
+
+    def get_device_list_property_list(self, devices=[], target_pids=[]):
+        self.calls.append('get_device_list_property_list')
+        return {'data': {'device_list': [{
+            'device_mac': mac,
+            'device_property_list': [{'pid': 'P1501', 'value': '42'}],
+        } for mac in devices]}}
+
+
+class TestBulkProperties(unittest.TestCase):
+    def test_chunked_property_fetch(self):
+        client = WyzeClient({'property_list_chunk_size': 2})
+        client._api_client = StubApiClient([
+            {'mac': 'b{0}'.format(i), 'product_model': 'WLPA19'}
+            for i in range(5)])
+
+        bulbs = client.list_bulbs(WyzeBulb.pids())
+
+        self.assertEqual(len(bulbs), 5)
+        self.assertEqual(
+            client.api_client.calls.count('get_device_list_property_list'), 3)
+        self.assertEqual(WyzeBulb(None, bulbs[4]).brightness, '42')
+        # the shared device list is left untouched
+        self.assertNotIn('data', client.devices.get('b0'))
+
+
+class TestFanOut(unittest.TestCase):
+    def setUp(self):
+        self.client = WyzeClient({'request_timeout': 0.2})
+
+    def tearDown(self):
+        self.client.close()
+
+    def _fail(self):
+        raise ValueError('failed')
+
+    def test_partial_results(self):
+        results = self.client._fan_out({
+            'ok': (lambda value: value, (1,)),
+            'failed': (self._fail, ()),
+            'slow': (time.sleep, (1,)),
+        })
+        self.assertEqual(results, {'ok': 1, 'failed': None, 'slow': None})
+
+    def test_all_failed(self):
+        with self.assertRaises(ValueError):
+            self.client._fan_out({'failed': (self._fail, ())})
+
+
+class StubPropertyClient(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    def set_device_property(self, mac, model, pid, value):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+            self.calls.append((mac, pid, value))
+        if mac == 'broken':
+            raise ValueError('failed')
+
+    def close(self):
+        pass
+
+
+class TestBatchCommands(unittest.TestCase):
+    def setUp(self):
+        self.client = WyzeClient({'max_workers': 8})
+        self.client._api_client = StubPropertyClient()
+        self.service = WyzeBulbService(StubProvider(self.client))
+
+    def tearDown(self):
+        self.client.close()
+
+    def _bulbs(self, macs):
+        return [WyzeBulb(None, {'mac': mac, 'product_model': 'WLPA19',
+                                'nickname': mac, 'switch_state': 0,
+                                'data': {'property_list': [
+                                    {'pid': 'P1501', 'value': '10'}]}})
+                for mac in macs]
+
+    def test_coalesced_per_device(self):
+        bulbs = self._bulbs(['b{0}'.format(i) for i in range(10)] + ['broken'])
+        results = self.service.apply(
+            bulbs, switch_state=True, brightness=40, max_parallel=3)
+
+        calls = self.client.api_client.calls
+        # the broken bulb stops at its first failed property
+        self.assertEqual(len(calls), 21)
+        self.assertLessEqual(self.client.api_client.max_active, 3)
+        self.assertEqual(
+            [pid for mac, pid, _ in calls if mac == 'b0'], ['P3', 'P1501'])
+
+        errors = {result.device.mac: result.error for result in results}
+        self.assertIsInstance(errors.pop('broken'), ValueError)
+        self.assertEqual(set(errors.values()), {None})
+        self.assertEqual(bulbs[0].brightness, 40)
+        self.assertEqual(bulbs[0].switch_state, '1')
+
+    def test_validation(self):
+        with self.assertRaises(InvalidValueException):
+            self.service.apply(self._bulbs(['b0']), brightness=101)
+        self.assertEqual(self.client.api_client.calls, [])
+
+
+class RecordingAdapter(BaseAdapter):
+    def __init__(self):
+        super(RecordingAdapter, self).__init__()
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({'code': 1, 'data': {}}).encode('utf-8')
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class TestRequestHeaders(unittest.TestCase):
+    def test_headers_are_request_scoped(self):
+        client = WyzeVenusServiceClient(
+            {'phone_id': 'phone', 'request_timeout': 1}, 'token')
+        adapter = RecordingAdapter()
+        client.session.mount('https://', adapter)
+
+        threads = [threading.Thread(
+            target=client.get_current_position, args=('did-{0}'.format(i),))
+            for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertNotIn('signature2', client.session.headers)
+        self.assertEqual(len(adapter.requests), 8)
+        for request in adapter.requests:
+            self.assertEqual(request.headers['access_token'], 'token')
+            params = sorted(parse_qsl(urlparse(request.url).query))
+            self.assertEqual(
+                request.headers['signature2'],
+                client.dynamic_signature(client.get_sorted_params(params)))
+
+    def test_signed_body_is_sent(self):
+        client = WyzeVenusServiceClient({'request_timeout': 1}, 'token')
+        adapter = RecordingAdapter()
+        client.session.mount('https://', adapter)
+
+        client.set_iot_action('did', 'JA_RO2', 'set_mode', {'type': 0})
+
+        request = adapter.requests[0]
+        self.assertNotIn(b' ', request.body)
+        self.assertEqual(request.headers['content-type'], 'application/json')
+        self.assertEqual(
+            request.headers['signature2'],
+            client.dynamic_signature(request.body))
+
+
+class TestRequestSigner(unittest.TestCase):
+    SALT = WyzeVenusServiceClient.SALTS['venp_4c30f812828de875']
+
+    def baseline_signature(self, access_token, message):
+        signing_key = md5(
+            (access_token + self.SALT).encode('utf-8')).hexdigest()
+        return hmac.new(signing_key.encode('utf-8'),
+                        msg=message.encode('utf-8'),
+                        digestmod=md5).hexdigest()
+
+    def test_matches_baseline_signature(self):
+        signer = WyzeRequestSigner('token', self.SALT)
+        for message in ('', 'did=1&nonce=2', '{"did":"1"}'):
+            self.assertEqual(signer.sign(message),
+                             self.baseline_signature('token', message))
+            self.assertEqual(signer.sign(message.encode('utf-8')),
+                             self.baseline_signature('token', message))
+
+    def test_signer_follows_token(self):
+        client = WyzeVenusServiceClient({'request_timeout': 1}, 'token')
+        self.assertEqual(client.dynamic_signature('message'),
+                         self.baseline_signature('token', 'message'))
+
+        client.update_access_token('refreshed')
+        self.assertEqual(client.dynamic_signature('message'),
+                         self.baseline_signature('refreshed', 'message'))
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['content-length']))
+        body = json.dumps({'code': 1, 'data': {'device_list': []}}).encode()
+        self.send_response(200)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConnectionPooling(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+
+        class LocalApiClient(WyzeApiClient):
+            endpoint_url = url
+
+        self.client = LocalApiClient(
+            {'app_version': '2.16.55', 'pool_sizes': {'api': 2}}, 'token')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            self.client.get_object_list()
+
+        stats = self.client.pool_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['maxsize'], 2)
+        self.assertEqual(stats[0]['requests'], 5)
+        self.assertEqual(stats[0]['connections'], 1)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket(self):
+        limiter = WyzeRateLimiter(rate=50, burst=1)
+        started = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        # the first request uses the burst, the others wait 20ms each
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_unlimited(self):
+        limiter = WyzeRateLimiter()
+        for _ in range(1000):
+            self.assertEqual(limiter.acquire(), 0.0)
+
+    def test_commands_go_first(self):
+        limiter = WyzeRateLimiter(rate=20, burst=1)
+        limiter.acquire()
+        order = []
+
+        def send(name, priority):
+            limiter.acquire(priority)
+            order.append(name)
+
+        threads = []
+        for name, priority in (('poll', PRIORITY_BACKGROUND),
+                               ('command', PRIORITY_COMMAND)):
+            thread = threading.Thread(target=send, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ['command', 'poll'])
+
+    def test_async_commands_go_first(self):
+        limiter = WyzeRateLimiter(rate=20, burst=1)
+        limiter.acquire()
+        order = []
+
+        async def send(name, priority):
+            await limiter.async_acquire(priority)
+            order.append(name)
+
+        async def send_all():
+            polls = [asyncio.ensure_future(send('poll', PRIORITY_BACKGROUND))
+                     for _ in range(2)]
+            await asyncio.sleep(0.01)
+            await asyncio.gather(send('command', PRIORITY_COMMAND), *polls)
+
+        asyncio.run(send_all())
+        self.assertEqual(order, ['command', 'poll', 'poll'])
+        self.assertEqual(limiter.stats()['waiting'], 0)
+
+    def test_async_wait_is_cancelled(self):
+        limiter = WyzeRateLimiter(rate=1, burst=1)
+        limiter.acquire()
+
+        async def cancel():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(limiter.async_acquire(), 0.01)
+
+        asyncio.run(cancel())
+        self.assertEqual(limiter.stats()['waiting'], 0)
+
+    def test_backoff(self):
+        limiter = WyzeRateLimiter(rate=100, max_backoff=0.05)
+        limiter.throttled()
+        self.assertEqual(limiter.rate, 50)
+        self.assertGreaterEqual(limiter.acquire(), 0.04)
+        self.assertEqual(limiter.stats()['throttled'], 1)
+
+        for _ in range(8):
+            limiter.succeeded()
+        self.assertEqual(limiter.rate, 100)
+
+    def test_backoff_decays_gradually(self):
+        limiter = WyzeRateLimiter(max_backoff=60)
+        for _ in range(4):
+            limiter.throttled()
+        self.assertEqual(limiter.stats()['backoff'], 8)
+
+        # a single success does not reset the pause
+        limiter.succeeded()
+        self.assertEqual(limiter.stats()['backoff'], 4)
+        for _ in range(3):
+            limiter.succeeded()
+        self.assertEqual(limiter.stats()['backoff'], 0)
+
+
+class TestAsyncPriorities(unittest.TestCase):
+
+    def test_commands_are_sent_first(self):
+        from smartbridge.providers.wyze.aio import AsyncWyzeApiClient
+        from smartbridge.providers.wyze.aio import AsyncWyzeVenusServiceClient
+
+        sent = []
+
+        async def do_request(method, url, headers, params=None, data=None):
+            await asyncio.sleep(0)
+            sent.append((url.rsplit('/', 1)[-1], current_priority()))
+            return {}
+
+        api = AsyncWyzeApiClient({'app_version': '2.16.55'}, 'token')
+        venus = AsyncWyzeVenusServiceClient({}, 'token')
+        api._do_request = venus._do_request = do_request
+
+        async def poll():
+            with request_priority(PRIORITY_BACKGROUND):
+                await api.get_object_list()
+
+        async def send():
+            await asyncio.gather(
+                poll(), api.set_device_property('mac', 'model', 'P3', 1),
+                poll(), venus.sweep_room('did', [1]))
+
+        asyncio.run(send())
+        self.assertEqual(sorted(sent), [
+            ('get_object_list', PRIORITY_BACKGROUND),
+            ('get_object_list', PRIORITY_BACKGROUND),
+            ('set_property', PRIORITY_COMMAND),
+            ('sweeping', PRIORITY_COMMAND)])
+
+
+if __name__ == '__main__':
+    unittest.main()